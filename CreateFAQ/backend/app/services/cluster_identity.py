@@ -0,0 +1,302 @@
+"""
+-----------------------------------------------------------------------
+File: services/cluster_identity.py
+Creation Time: Oct 19th 2026, 1:13 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+HDBSCAN cluster ids are arbitrary per run. This module gives clusters a persistent
+`cluster_key` by matching each run's clusters against the fingerprints (members and
+centroid) stored by the previous run, and tells which clusters changed enough to
+need a new FAQ.
+"""
+
+import os
+import uuid
+from collections import Counter
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, List, Optional
+import numpy as np
+from db import with_connection
+
+STATUS_NEW = "new"
+STATUS_CHANGED = "changed"
+STATUS_UNCHANGED = "unchanged"
+
+# Share of members that may change before a cluster's FAQ is regenerated
+CHANGE_THRESHOLD = float(os.environ.get("FAQ_REGENERATE_CHANGE_THRESHOLD", 0.2))
+# A previous cluster is the same cluster if it holds at least this share of the
+# smaller cluster's members ...
+MIN_MEMBER_OVERLAP = 0.5
+# ... or, failing that, if the centroids are at least this similar
+MIN_CENTROID_SIMILARITY = 0.95
+
+
+@dataclass
+class ClusterFingerprint:
+    cluster_key: Optional[str]
+    cluster_id: Optional[int]  # HDBSCAN label in the run that produced it
+    member_ids: FrozenSet[int]
+    centroid: Optional[np.ndarray]
+    has_faq: bool = False  # whether a FAQ was generated from exactly these members
+
+
+@dataclass
+class ClusterMatch:
+    cluster_key: str
+    status: str  # STATUS_NEW, STATUS_CHANGED or STATUS_UNCHANGED
+    previous: Optional[ClusterFingerprint] = None
+    change: float = 1.0  # 1 - Jaccard similarity of the members
+
+
+def compute_fingerprints(
+    cluster_labels, embedding_ids, embeddings=None
+) -> Dict[int, ClusterFingerprint]:
+    """
+    Fingerprint every (non-noise) cluster of a run.
+    :param cluster_labels: Array of cluster labels from HDBSCAN.
+    :param embedding_ids: Embedding IDs aligned with the labels.
+    :param embeddings: Numpy array of the embeddings, for centroids (optional).
+    :return: Dictionary mapping cluster_id to its (still unkeyed) fingerprint.
+    """
+    cluster_labels = np.asarray(cluster_labels)
+    fingerprints = {}
+    for cluster_id in sorted(set(cluster_labels.tolist()) - {-1}):
+        members = np.flatnonzero(cluster_labels == cluster_id)
+        centroid = None
+        if embeddings is not None:
+            vectors = np.asarray(embeddings[members], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            centroid = vectors.mean(axis=0)
+            centroid /= max(np.linalg.norm(centroid), 1e-12)
+        fingerprints[cluster_id] = ClusterFingerprint(
+            cluster_key=None,
+            cluster_id=cluster_id,
+            member_ids=frozenset(int(embedding_ids[i]) for i in members),
+            centroid=centroid,
+        )
+    return fingerprints
+
+
+def match_fingerprints(
+    current: Dict[int, ClusterFingerprint],
+    previous: List[ClusterFingerprint],
+    change_threshold: float = CHANGE_THRESHOLD,
+) -> Dict[int, ClusterMatch]:
+    """
+    Match this run's clusters one-to-one against the previous fingerprints.
+
+    Pairs sharing members are matched first, best Jaccard similarity first. Clusters
+    left over are matched on centroid similarity. A matched cluster is unchanged when
+    its previous fingerprint has a FAQ and at most `change_threshold` of the members
+    differ; everything else matched is changed, and unmatched clusters are new.
+
+    :return: Dictionary mapping cluster_id to its ClusterMatch.
+    """
+    previous_by_key = {fp.cluster_key: fp for fp in previous}
+    owner = {
+        member_id: fp.cluster_key for fp in previous for member_id in fp.member_ids
+    }
+
+    candidates = []
+    for cluster_id, fp in current.items():
+        overlaps = Counter(owner[m] for m in fp.member_ids if m in owner)
+        for key, overlap in overlaps.items():
+            other = previous_by_key[key].member_ids
+            if overlap < MIN_MEMBER_OVERLAP * min(len(fp.member_ids), len(other)):
+                continue
+            jaccard = overlap / (len(fp.member_ids) + len(other) - overlap)
+            candidates.append((jaccard, cluster_id, key))
+
+    matches = {}
+    taken = set()
+    for jaccard, cluster_id, key in sorted(candidates, reverse=True):
+        if cluster_id in matches or key in taken:
+            continue
+        matches[cluster_id] = (key, 1 - jaccard)
+        taken.add(key)
+
+    unmatched = [
+        cid
+        for cid in current
+        if cid not in matches and current[cid].centroid is not None
+    ]
+    leftovers = [
+        fp for fp in previous if fp.cluster_key not in taken and fp.centroid is not None
+    ]
+    if unmatched and leftovers:
+        similarities = (
+            np.stack([current[cid].centroid for cid in unmatched])
+            @ np.stack([fp.centroid for fp in leftovers]).T
+        )
+        for flat_index in np.argsort(similarities, axis=None)[::-1]:
+            i, j = np.unravel_index(flat_index, similarities.shape)
+            if similarities[i, j] < MIN_CENTROID_SIMILARITY:
+                break
+            key = leftovers[j].cluster_key
+            if unmatched[i] in matches or key in taken:
+                continue
+            matches[unmatched[i]] = (key, 1.0)
+            taken.add(key)
+
+    result = {}
+    for cluster_id in current:
+        if cluster_id not in matches:
+            result[cluster_id] = ClusterMatch(uuid.uuid4().hex, STATUS_NEW)
+            continue
+        key, change = matches[cluster_id]
+        previous_fp = previous_by_key[key]
+        status = (
+            STATUS_UNCHANGED
+            if previous_fp.has_faq and change <= change_threshold
+            else STATUS_CHANGED
+        )
+        result[cluster_id] = ClusterMatch(key, status, previous_fp, change)
+    return result
+
+
+def fingerprints_to_save(current, matches, summarized_cluster_ids):
+    """
+    Pick the fingerprint to persist for every cluster of this run.
+    Unchanged clusters keep the members their FAQ was generated from, so drift is
+    measured against the FAQ rather than the last run. Clusters whose FAQ could not be
+    generated are saved without a FAQ, so the next run retries them.
+    :return: List of keyed fingerprints.
+    """
+    fingerprints = []
+    for cluster_id, match in matches.items():
+        if match.status == STATUS_UNCHANGED:
+            fingerprints.append(replace(match.previous, cluster_id=cluster_id))
+        else:
+            fingerprints.append(
+                replace(
+                    current[cluster_id],
+                    cluster_key=match.cluster_key,
+                    has_faq=cluster_id in summarized_cluster_ids,
+                )
+            )
+    return fingerprints
+
+
+@with_connection
+def create_cluster_fingerprints_table(conn):
+    """
+    Create the cluster_fingerprints table and the faqs.cluster_key column.
+    """
+    query = """
+    CREATE TABLE IF NOT EXISTS cluster_fingerprints (
+        machine_type TEXT NOT NULL,
+        cluster_key TEXT NOT NULL,
+        cluster_id INT,
+        member_ids INT[] NOT NULL,
+        centroid REAL[],
+        has_faq BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (machine_type, cluster_key)
+    );
+    ALTER TABLE faqs ADD COLUMN IF NOT EXISTS cluster_key TEXT;
+    """
+    with conn.cursor() as cur:
+        cur.execute(query)
+
+
+@with_connection
+def load_cluster_fingerprints(conn, machine_type) -> List[ClusterFingerprint]:
+    """
+    Load the stored fingerprints of a machine type.
+    Runs over all machine types at once are stored under machine_type "".
+    """
+    query = """
+    SELECT cluster_key, cluster_id, member_ids, centroid, has_faq
+    FROM cluster_fingerprints
+    WHERE machine_type = %s
+    """
+    with conn.cursor() as cur:
+        cur.execute(query, (machine_type or "",))
+        return [
+            ClusterFingerprint(
+                cluster_key=row[0],
+                cluster_id=row[1],
+                member_ids=frozenset(row[2]),
+                centroid=np.array(row[3], dtype=np.float32) if row[3] else None,
+                has_faq=row[4],
+            )
+            for row in cur.fetchall()
+        ]
+
+
+@with_connection
+def save_cluster_fingerprints(conn, machine_type, fingerprints):
+    """
+    Store this run's fingerprints. Fingerprints of clusters that disappeared are kept
+    (with a NULL cluster_id), so the cluster keeps its key if it comes back.
+    """
+    clear_query = """
+    UPDATE cluster_fingerprints SET cluster_id = NULL WHERE machine_type = %s
+    """
+    upsert_query = """
+    INSERT INTO cluster_fingerprints (machine_type, cluster_key, cluster_id, member_ids, centroid, has_faq)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (machine_type, cluster_key) DO UPDATE SET
+        cluster_id = EXCLUDED.cluster_id,
+        member_ids = EXCLUDED.member_ids,
+        centroid = EXCLUDED.centroid,
+        has_faq = EXCLUDED.has_faq,
+        updated_at = CURRENT_TIMESTAMP
+    """
+    with conn.cursor() as cur:
+        cur.execute(clear_query, (machine_type or "",))
+        cur.executemany(
+            upsert_query,
+            [
+                (
+                    machine_type or "",
+                    fp.cluster_key,
+                    int(fp.cluster_id) if fp.cluster_id is not None else None,
+                    sorted(fp.member_ids),
+                    fp.centroid.tolist() if fp.centroid is not None else None,
+                    fp.has_faq,
+                )
+                for fp in fingerprints
+            ],
+        )
+
+
+@with_connection
+def assign_faq_cluster_keys(conn, machine_type, matches):
+    """
+    Keep the faqs rows in step with this run's clusters: point every keyed FAQ at its
+    cluster's current id, and give FAQs created before cluster keys existed the key of
+    the cluster now holding their cluster_id, so they are updated instead of duplicated.
+    :param matches: Dictionary mapping cluster_id to its ClusterMatch.
+    """
+    move_query = """
+    UPDATE faqs SET cluster_id = %s
+    WHERE machine_type IS NOT DISTINCT FROM %s AND split_part(cluster_key, ':', 1) = %s
+    """
+    # Only the newest legacy FAQ of a cluster is adopted; keys are unique per machine type
+    adopt_query = """
+    UPDATE faqs SET cluster_key = %s
+    WHERE faq_id = (
+        SELECT MAX(faq_id) FROM faqs
+        WHERE machine_type IS NOT DISTINCT FROM %s AND cluster_id = %s AND cluster_key IS NULL
+    )
+    """
+    with conn.cursor() as cur:
+        cur.executemany(
+            adopt_query,
+            [
+                (match.cluster_key, machine_type, int(cluster_id))
+                for cluster_id, match in matches.items()
+                if match.status == STATUS_NEW
+            ],
+        )
+        cur.executemany(
+            move_query,
+            [
+                (int(cluster_id), machine_type, match.cluster_key)
+                for cluster_id, match in matches.items()
+            ],
+        )
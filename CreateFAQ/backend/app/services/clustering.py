@@ -9,14 +9,37 @@ Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com
 """
 
 import ast
+import asyncio
+import hashlib
+import json
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from typing import List
 import hdbscan
 from db import with_connection
 import numpy as np
 import psycopg2
+from psycopg2.extras import execute_values
 import os
-from openai import OpenAI
+from cluster_identity import (
+    STATUS_UNCHANGED,
+    assign_faq_cluster_keys,
+    compute_fingerprints,
+    create_cluster_fingerprints_table,
+    fingerprints_to_save,
+    load_cluster_fingerprints,
+    match_fingerprints,
+    save_cluster_fingerprints,
+)
+from embedding_snapshots import EmbeddingSnapshotStore
+from llm_cache import LLMResponseCache
+from llm_client import get_async_client
+from rate_limiter import AsyncRateLimiter, create_chat_completion_with_retries
+from representatives import (
+    format_representatives,
+    partition_members,
+    select_representatives,
+)
 from sklearn.metrics.pairwise import cosine_similarity
 from langchain_core.output_parsers import JsonOutputParser
 
@@ -24,10 +47,19 @@ from langchain_core.output_parsers import JsonOutputParser
 if "GEMINI_API_KEY" not in os.environ:
     raise EnvironmentError("GEMINI_API_KEY not found in environment variables.")
 
-client = OpenAI(
-    api_key=os.environ["GEMINI_API_KEY"],
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
+LLM_MODEL = "gemini-1.5-flash"
+# Bump whenever build_faq_prompt / build_faq_reduce_prompt change so cached answers
+# to the old prompts are not reused
+FAQ_PROMPT_VERSION = "faq-v1"
+FAQ_REDUCE_PROMPT_VERSION = "faq-reduce-v1"
+# Clusters with more members than this are summarized map-reduce style
+FAQ_MAP_REDUCE_GROUP_SIZE = int(os.environ.get("FAQ_MAP_REDUCE_GROUP_SIZE", 2000))
+FAQ_MAP_REDUCE_FAN_OUT = int(os.environ.get("FAQ_MAP_REDUCE_FAN_OUT", 8))
+
+# Retries are handled by create_chat_completion_with_retries. Set GEMINI_BASE_URL
+# to point the pipeline at a local stub server (see llm_stub_server.py)
+async_client = get_async_client("gemini", max_retries=0)
+llm_cache = LLMResponseCache()
 
 
 @with_connection
@@ -75,7 +107,11 @@ def cluster_with_hdbscan(embeddings, min_cluster_size=10, min_samples=3):
         # modified_embeddings = normalize(embeddings)
         from sklearn.metrics.pairwise import cosine_distances
 
-        modified_embeddings = cosine_distances(normalize(embeddings))
+        # HDBSCAN's precomputed path only accepts float64 distances, so upcast
+        # float32 inputs (e.g. memory-mapped snapshots) before building the matrix
+        modified_embeddings = cosine_distances(
+            normalize(np.asarray(embeddings, dtype=np.float64))
+        )
 
         clusterer = hdbscan.HDBSCAN(
             min_cluster_size=min_cluster_size,
@@ -125,11 +161,25 @@ def reassign_noise(embeddings, cluster_labels, clusterer):
     :param clusterer: HDBSCAN clusterer object.
     :return: Updated cluster labels.
     """
-    cluster_centers = clusterer.weighted_cluster_centroids_
-    for i, label in enumerate(cluster_labels):
-        if label == -1:  # Noise point
-            similarities = cosine_similarity([embeddings[i]], cluster_centers)
-            cluster_labels[i] = similarities.argmax()  # Closest cluster
+    # The clusterer was fit on a precomputed distance matrix, so its own centroid
+    # helpers can't be used; weight the embeddings by membership strength instead.
+    cluster_ids = np.unique(cluster_labels[cluster_labels != -1])
+    noise = np.flatnonzero(cluster_labels == -1)
+    if len(cluster_ids) == 0 or len(noise) == 0:
+        return cluster_labels
+
+    cluster_centers = np.stack(
+        [
+            np.average(
+                embeddings[cluster_labels == cluster_id],
+                weights=clusterer.probabilities_[cluster_labels == cluster_id] + 1e-12,
+                axis=0,
+            )
+            for cluster_id in cluster_ids
+        ]
+    )
+    similarities = cosine_similarity(embeddings[noise], cluster_centers)
+    cluster_labels[noise] = cluster_ids[similarities.argmax(axis=1)]  # Closest cluster
     return cluster_labels
 
 
@@ -156,39 +206,98 @@ def parse_json_markdown(json_string: str) -> dict:
         return None
 
 
-@with_connection
-def summarize_hdbscan_clusters(conn, cluster_labels, embedding_ids, machine_type):
-    """
-    Summarize clusters generated by HDBSCAN and generate FAQs.
-    :param conn: Database connection passed by the @with_connection decorator.
-    :param cluster_labels: Array of cluster labels from HDBSCAN.
-    :param embedding_ids: Array of embedding IDs.
+def build_faq_prompt(texts):
+    """Build the FAQ generation prompt for the texts of one cluster."""
+    return f"""
+    Based on the following repair descriptions, generate a JSON object containing the most frequent repairs, culprits, and solutions:
+    {texts}
+
+    The output should be in the JSON format:
+    {{
+        "faq_name": "<Name of the FAQ topic>",
+        "common_3_repairs": "<The 3 most common repairs performed in this cluster and in comma spearated string format>",
+        "common_3_culprits": "<The 3 most frequent culprits/issues in this cluster and in comma spearated string format>",
+        "solution_to_single_frequent_culprit": "<Detailed solution for the most frequent single culprit with its name>"
+    }}
+
+    Ensure the following:
+    1. Analyze patterns in repair descriptions to extract frequent repairs and culprits.
+    2. Identify and summarize one solution for the most frequent culprit.
+    3. Ensure the response is concise and relevant.
     """
-    try:
-        clusters = set(cluster_labels.tolist())
-        faq_clusters = []
-        all_custer_ids, all_machine_types = get_unique_cluster_ids_and_machine_types()
 
-        for cluster_id in clusters:
-            if cluster_id == -1:  # Skip noise
-                continue
 
-            if cluster_id in all_custer_ids and machine_type in all_machine_types:
-                continue
+def faq_content_hash(faq_name, common_3_repairs, common_3_culprits, solution):
+    """Hash of a FAQ's generated content, used to skip rewriting unchanged FAQs."""
+    return hashlib.sha256(
+        json.dumps(
+            [faq_name, common_3_repairs, common_3_culprits, solution],
+            ensure_ascii=False,
+        ).encode()
+    ).hexdigest()
 
-            query = """
-            SELECT text_content
-            FROM embeddings
-            WHERE cluster_id = %s
-            """
-            with conn.cursor() as cur:
-                cur.execute(query, (cluster_id,))
-                texts = [row[0] for row in cur.fetchall()]
 
-            # Use GPT or another LLM for summarization
-            prompt = f"""
-    Based on the following repair descriptions, generate a JSON object containing the most frequent repairs, culprits, and solutions:
-    {texts}
+def parse_cluster_faqs(content, machine_type, cluster_id, cluster_key=None):
+    """
+    Parse the LLM response for a cluster into rows for `upsert_faqs`.
+    The i-th extra FAQ of a response is keyed "<cluster_key>:<i>".
+    :param content: Raw message content returned by the LLM.
+    :param machine_type: Machine type the cluster belongs to.
+    :param cluster_id: Cluster the FAQs were generated for.
+    :param cluster_key: Persistent key of the cluster (see cluster_identity.py).
+    :return: Parsed content (a FAQ dict or a list of them) and the list of FAQ rows.
+    """
+    content = parse_json_markdown(content.strip())
+    rows = []
+    if "faq_name" in content or "faq_name" in content[0]:
+        if "faq_name" in content:
+            content = [content]
+        for i, faq in enumerate(content):
+            faq_name = faq["faq_name"]
+            # Extract fields from the content
+            common_3_repairs = faq.get("common_3_repairs", "")
+            common_3_culprits = faq.get("common_3_culprits", "")
+            solution_to_single_frequent_culprit = faq.get(
+                "solution_to_single_frequent_culprit", ""
+            )
+            rows.append(
+                {
+                    "faq_name": faq_name,
+                    "machine_type": machine_type,
+                    "cluster_id": int(cluster_id),
+                    "common_3_repairs": common_3_repairs,
+                    "common_3_culprits": common_3_culprits,
+                    "solution_to_single_frequent_culprit": solution_to_single_frequent_culprit,
+                    "cluster_key": (
+                        cluster_key
+                        if i == 0 or cluster_key is None
+                        else f"{cluster_key}:{i}"
+                    ),
+                    "content_hash": faq_content_hash(
+                        faq_name,
+                        common_3_repairs,
+                        common_3_culprits,
+                        solution_to_single_frequent_culprit,
+                    ),
+                }
+            )
+    return content, rows
+
+
+def build_faq_reduce_prompt(partials):
+    """
+    Build the prompt that merges partial FAQs of one cluster into a single FAQ.
+    :param partials: List of (partial FAQ dict, number of repair descriptions it covers).
+    """
+    partial_lines = "\n    ".join(
+        f"- Covers {n_members} repair descriptions: {json.dumps(faq)}"
+        for faq, n_members in partials
+    )
+    return f"""
+    The following partial FAQs were each generated from a different subset of the same cluster of repair descriptions:
+    {partial_lines}
+
+    Merge them into a single JSON object, weighting each partial by the number of repair descriptions it covers.
 
     The output should be in the JSON format:
     {{
@@ -199,138 +308,419 @@ def summarize_hdbscan_clusters(conn, cluster_labels, embedding_ids, machine_type
     }}
 
     Ensure the following:
-    1. Analyze patterns in repair descriptions to extract frequent repairs and culprits.
-    2. Identify and summarize one solution for the most frequent culprit.
+    1. Rank repairs and culprits by how often they occur across all partials.
+    2. Keep the solution for the single most frequent culprit overall.
     3. Ensure the response is concise and relevant.
     """
-            time.sleep(1)
-            response = client.chat.completions.create(
-                model="gemini-1.5-flash",
-                n=1,
-                messages=[
+
+
+def _parse_partial_faq(content):
+    """Parse a map/reduce response into a single FAQ dict."""
+    parsed = parse_json_markdown(content.strip())
+    if isinstance(parsed, list) and parsed:
+        parsed = parsed[0]
+    if not isinstance(parsed, dict) or "faq_name" not in parsed:
+        raise ValueError(f"Unusable partial FAQ: {content[:200]}")
+    return parsed
+
+
+async def summarize_clusters_async(
+    cluster_groups,
+    max_concurrency=None,
+    requests_per_minute=None,
+    tokens_per_minute=None,
+    fan_out=None,
+):
+    """
+    Generate the LLM responses for many clusters concurrently.
+    Concurrency is bounded by a semaphore and request/token throughput by a token bucket.
+
+    A cluster with a single group of texts is summarized with one prompt. A cluster
+    split into several groups is summarized map-reduce style: every group becomes a
+    partial FAQ (map), then partials are merged `fan_out` at a time, over as many
+    rounds as needed, into the final FAQ (reduce). Every map and reduce answer is cached.
+
+    :param cluster_groups: Dictionary mapping cluster_id to a list of
+        (texts, number of members the texts stand for) groups.
+    :param max_concurrency: Maximum requests in flight (default: $LLM_MAX_CONCURRENCY or 8).
+    :param requests_per_minute: Request quota (default: $LLM_REQUESTS_PER_MINUTE or 60).
+    :param tokens_per_minute: Token quota (default: $LLM_TOKENS_PER_MINUTE or 1,000,000).
+    :param fan_out: Partials merged per reduce request (default: FAQ_MAP_REDUCE_FAN_OUT).
+    :return: Dictionary mapping cluster_id to the message content, or to the exception
+        raised for that cluster.
+    """
+    max_concurrency = max_concurrency or int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+    rate_limiter = AsyncRateLimiter(
+        requests_per_minute or int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 60)),
+        tokens_per_minute or int(os.environ.get("LLM_TOKENS_PER_MINUTE", 1_000_000)),
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    fan_out = max(2, fan_out or FAQ_MAP_REDUCE_FAN_OUT)
+
+    async def complete(prompt_version, cache_texts, prompt):
+        cache_key = llm_cache.make_key(LLM_MODEL, prompt_version, cache_texts)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        async with semaphore:
+            response = await create_chat_completion_with_retries(
+                async_client,
+                [
                     {"role": "system", "content": "You are a helpful assistant."},
                     {"role": "user", "content": prompt},
                 ],
+                rate_limiter,
+                LLM_MODEL,
             )
+        content = response.choices[0].message.content
+        # Only cache answers we can use, so a malformed response is retried next run
+        if parse_json_markdown(content.strip()) is not None:
+            llm_cache.set(cache_key, content)
+        return content
+
+    async def merge(batch):
+        if len(batch) == 1:
+            return json.dumps(batch[0][0])
+        cache_texts = [
+            json.dumps([faq, n_members], sort_keys=True) for faq, n_members in batch
+        ]
+        return await complete(
+            FAQ_REDUCE_PROMPT_VERSION, cache_texts, build_faq_reduce_prompt(batch)
+        )
 
-            # Extract the content from the response
-            content = response.choices[0].message.content.strip()
-            content = parse_json_markdown(content)
-            if "faq_name" in content or "faq_name" in content[0]:
-                if "faq_name" in content:
-                    content = [content]
-                for faq in content:
-                    faq_name = faq["faq_name"]
-                    # Extract fields from the content
-                    common_3_repairs = faq.get("common_3_repairs", "")
-                    common_3_culprits = faq.get("common_3_culprits", "")
-                    solution_to_single_frequent_culprit = faq.get(
-                        "solution_to_single_frequent_culprit", ""
-                    )
+    async def summarize(groups):
+        if len(groups) == 1:
+            texts, _ = groups[0]
+            return await complete(FAQ_PROMPT_VERSION, texts, build_faq_prompt(texts))
 
-                    # Insert into the faqs table
-                    insert_faq(
-                        faq_name,
-                        machine_type,
-                        cluster_id,
-                        common_3_repairs,
-                        common_3_culprits,
-                        solution_to_single_frequent_culprit,
-                    )
+        # Map: one partial FAQ per sub-group
+        contents = await asyncio.gather(
+            *(
+                complete(FAQ_PROMPT_VERSION, texts, build_faq_prompt(texts))
+                for texts, _ in groups
+            )
+        )
+        partials = [
+            (_parse_partial_faq(content), n_members)
+            for content, (_, n_members) in zip(contents, groups)
+        ]
+
+        # Reduce: merge `fan_out` partials at a time until a single FAQ is left
+        while True:
+            batches = [
+                partials[i : i + fan_out] for i in range(0, len(partials), fan_out)
+            ]
+            contents = await asyncio.gather(*(merge(batch) for batch in batches))
+            if len(batches) == 1:
+                return contents[0]
+            partials = [
+                (_parse_partial_faq(content), sum(n_members for _, n_members in batch))
+                for content, batch in zip(contents, batches)
+            ]
+
+    cluster_ids = list(cluster_groups)
+    responses = await asyncio.gather(
+        *(summarize(cluster_groups[cluster_id]) for cluster_id in cluster_ids),
+        return_exceptions=True,
+    )
+    return dict(zip(cluster_ids, responses))
 
-            faq_clusters.append((cluster_id, content))
 
-        return faq_clusters
-    except Exception as e:
-        print(e)
+def iter_cluster_texts(conn, machine_type=None, batch_size=5000):
+    """
+    Stream the texts of every cluster in a single query, one cluster at a time.
+    Rows come through a server-side cursor ordered by (machine_type, cluster_id),
+    which the composite index from `create_cluster_texts_index` serves, so only
+    `batch_size` rows plus the current cluster are held in memory.
+    :param conn: Open database connection (the named cursor needs its transaction).
+    :param machine_type: Restrict to one machine type; cluster ids restart per machine type.
+    :param batch_size: Rows fetched per round-trip of the streaming cursor.
+    :return: Generator of ((machine_type, cluster_id), [(embedding_id, text_content), ...]),
+        with the machine type of the rows, so clusters of different machine types
+        never merge.
+    """
+    query = """
+    SELECT machine_type, cluster_id, embedding_id, text_content
+    FROM embeddings
+    WHERE cluster_id IS NOT NULL
+    """
+    params = None
+    if machine_type:
+        query += " AND machine_type = %s"
+        params = (machine_type,)
+    query += " ORDER BY machine_type, cluster_id, embedding_id"
+
+    with conn.cursor(name="cluster_texts_cursor") as cur:
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        current_key, rows = None, []
+        for row_machine_type, cluster_id, embedding_id, text_content in cur:
+            key = (row_machine_type, cluster_id)
+            if key != current_key and rows:
+                yield current_key, rows
+                rows = []
+            current_key = key
+            rows.append((embedding_id, text_content))
+        if rows:
+            yield current_key, rows
+
+
+@with_connection
+def fetch_cluster_texts(conn, machine_type=None, batch_size=5000):
+    """
+    Load the texts of every cluster in a single query.
+    :param conn: Database connection (provided by @with_connection decorator).
+    :param machine_type: Restrict to one machine type.
+    :param batch_size: Rows fetched per round-trip of the streaming cursor.
+    :return: Dictionary mapping (machine_type, cluster_id) to [(embedding_id, text_content), ...].
+    """
+    return dict(iter_cluster_texts(conn, machine_type, batch_size))
+
+
+@with_connection
+def create_cluster_texts_index(conn):
+    """
+    Create the composite index behind `iter_cluster_texts`.
+    """
+    query = """
+    CREATE INDEX IF NOT EXISTS embeddings_machine_type_cluster_idx
+    ON embeddings (machine_type, cluster_id)
+    """
+    with conn.cursor() as cur:
+        cur.execute(query)
+
+
+def build_cluster_groups(texts, map_group_size, embeddings=None, probabilities=None):
+    """
+    Turn the texts of one cluster into the prompt groups used by `summarize_clusters_async`.
+    With embeddings, the cluster is split into sub-groups of similar members and each
+    group is reduced to its representative texts; without, texts are chunked as they are.
+    :return: List of (texts, number of members the texts stand for).
+    """
+    if embeddings is None:
+        return [
+            (texts[i : i + map_group_size], len(texts[i : i + map_group_size]))
+            for i in range(0, len(texts), map_group_size)
+        ]
+
+    groups = []
+    for group in partition_members(embeddings, map_group_size):
+        representatives = select_representatives(
+            [texts[i] for i in group],
+            embeddings[group],
+            probabilities[group] if probabilities is not None else None,
+        )
+        groups.append((format_representatives(representatives), len(group)))
+    return groups
 
 
 @with_connection
-def insert_faq(
+def summarize_hdbscan_clusters(
     conn,
-    faq_name,
+    cluster_labels,
+    embedding_ids,
     machine_type,
-    cluster_id=None,
-    common_3_repairs=None,
-    common_3_culprits=None,
-    solution_to_single_frequent_culprit=None,
-    tags=None,
-    rating=0,
+    embeddings=None,
+    probabilities=None,
+    map_group_size=None,
+    fan_out=None,
 ):
     """
-    Insert a new FAQ into the faqs table.
-
-    Args:
-        conn: Database connection (handled by @with_connection).
-        faq_name (str): The name or title of the FAQ.
-        machine_type (str): The machine type associated with the FAQ.
-        cluster_id (int, optional): The cluster ID associated with the FAQ.
-        common_3_repairs (str, optional): The 3 most common repairs in this cluster.
-        common_3_culprits (str, optional): The 3 most common culprits/issues.
-        solution_to_single_frequent_culprit (str, optional): Solution for the most frequent culprit.
-        tags (list, optional): Tags for the FAQ (e.g., ["failure", "repair"]).
-        rating (int, optional): Initial rating for the FAQ (default: 0).
-    """
-    insert_query = """
-    INSERT INTO faqs (
-        faq_name, machine_type, cluster_id, common_3_repairs, 
-        common_3_culprits, solution_to_single_frequent_culprit, 
-        tags, rating
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    RETURNING faq_id;
+    Summarize clusters generated by HDBSCAN and generate FAQs.
+    LLM requests for all clusters run concurrently; FAQs are inserted afterwards in cluster order.
+    Clusters are matched against the previous run (see cluster_identity.py) and only
+    new clusters, or clusters whose membership changed, are sent to the LLM.
+    When embeddings are given, each prompt only carries the cluster's representative
+    texts (see representatives.py), so prompt size stays flat as clusters grow.
+    Clusters larger than `map_group_size` are split into sub-groups of similar members
+    and summarized map-reduce style (see summarize_clusters_async).
+    :param conn: Database connection passed by the @with_connection decorator.
+    :param cluster_labels: Array of cluster labels from HDBSCAN.
+    :param embedding_ids: Array of embedding IDs.
+    :param machine_type: Machine type the clusters belong to.
+    :param embeddings: Numpy array of the clustered embeddings (optional).
+    :param probabilities: HDBSCAN membership probabilities (optional).
+    :param map_group_size: Members per map sub-group (default: FAQ_MAP_REDUCE_GROUP_SIZE).
+    :param fan_out: Partials merged per reduce request (default: FAQ_MAP_REDUCE_FAN_OUT).
     """
-    with conn.cursor() as cur:
-        cur.execute(
-            insert_query,
-            (
-                faq_name,
-                machine_type,
-                cluster_id,
-                common_3_repairs,
-                common_3_culprits,
-                solution_to_single_frequent_culprit,
-                tags if tags else [],  # Use an empty list if no tags are provided
-                rating,
+    map_group_size = map_group_size or FAQ_MAP_REDUCE_GROUP_SIZE
+    try:
+        faq_clusters = []
+        current = compute_fingerprints(cluster_labels, embedding_ids, embeddings)
+        matches = match_fingerprints(current, load_cluster_fingerprints(machine_type))
+        assign_faq_cluster_keys(machine_type, matches)
+        stale = {
+            cluster_id
+            for cluster_id, match in matches.items()
+            if match.status != STATUS_UNCHANGED
+        }
+        print(
+            f"'{machine_type}': {len(stale)} of {len(matches)} clusters are new or changed"
+        )
+
+        index_by_id = {
+            int(embedding_id): i for i, embedding_id in enumerate(embedding_ids)
+        }
+        cluster_groups = {}
+        for (_, cluster_id), rows in iter_cluster_texts(conn, machine_type):
+            if cluster_id not in stale:
+                continue
+
+            rows = [(eid, text) for eid, text in rows if eid in index_by_id]
+            texts = [text for _, text in rows]
+            if embeddings is None:
+                cluster_groups[cluster_id] = build_cluster_groups(texts, map_group_size)
+                continue
+
+            members = np.array([index_by_id[eid] for eid, _ in rows])
+            cluster_groups[cluster_id] = build_cluster_groups(
+                texts,
+                map_group_size,
+                embeddings[members],
+                probabilities[members] if probabilities is not None else None,
+            )
+
+        # Use GPT or another LLM for summarization
+        responses = asyncio.run(
+            summarize_clusters_async(cluster_groups, fan_out=fan_out)
+        )
+
+        faq_rows = []
+        for cluster_id, response in responses.items():
+            if isinstance(response, Exception):
+                print(f"Summarization of cluster {cluster_id} failed: {response}")
+                continue
+            try:
+                content, rows = parse_cluster_faqs(
+                    response, machine_type, cluster_id, matches[cluster_id].cluster_key
+                )
+            except Exception as e:
+                print(f"Could not parse FAQs of cluster {cluster_id}: {e}")
+                continue
+            faq_clusters.append((cluster_id, content))
+            faq_rows.extend(rows)
+
+        faq_ids = upsert_faqs(faq_rows)
+        print(
+            f"'{machine_type}': {len(faq_ids)} of {len(faq_rows)} FAQs inserted or changed"
+        )
+
+        save_cluster_fingerprints(
+            machine_type,
+            fingerprints_to_save(
+                current, matches, {cluster_id for cluster_id, _ in faq_clusters}
             ),
         )
-        faq_id = cur.fetchone()[0]  # Get the generated FAQ ID
-    return faq_id
+        print(f"LLM cache for '{machine_type}': {llm_cache.stats()}")
+        return faq_clusters
+    except Exception as e:
+        print(e)
 
 
 @with_connection
-def get_unique_cluster_ids_and_machine_types(conn) -> dict:
+def upsert_faqs(conn, faqs):
     """
-    Retrieve all unique cluster IDs and machine types from the `faqs` table.
+    Insert or update the FAQs of a run in one statement.
+
+    FAQs are keyed on (machine_type, cluster_key). An existing FAQ is only rewritten,
+    and its updated_at bumped, when its content hash changed; unchanged FAQs are left
+    alone, so reruns neither duplicate nor touch them.
 
     Args:
-        conn: Database connection (handled by @with_connection decorator).
+        conn: Database connection (handled by @with_connection).
+        faqs (list): Rows from `parse_cluster_faqs`.
 
     Returns:
-        A dictionary with two keys:
-        - 'cluster_ids': List of unique cluster IDs (excluding NULL values).
-        - 'machine_types': List of unique machine types.
-    """
-    query_cluster_ids = """
-    SELECT DISTINCT cluster_id
-    FROM faqs
-    WHERE cluster_id IS NOT NULL
+        List of the faq_ids that were inserted or changed.
     """
-
-    query_machine_types = """
-    SELECT DISTINCT machine_type
-    FROM faqs
+    # A statement can't update the same row twice, so the last FAQ per key wins
+    rows = {}
+    for i, faq in enumerate(faqs):
+        key = (faq["machine_type"] or "", faq["cluster_key"] or i)
+        rows[key] = faq
+    if not rows:
+        return []
+
+    upsert_query = """
+    INSERT INTO faqs (
+        faq_name, machine_type, cluster_id, common_3_repairs,
+        common_3_culprits, solution_to_single_frequent_culprit,
+        tags, rating, cluster_key, content_hash
+    ) VALUES %s
+    ON CONFLICT ((COALESCE(machine_type, '')), cluster_key) DO UPDATE SET
+        faq_name = EXCLUDED.faq_name,
+        cluster_id = EXCLUDED.cluster_id,
+        common_3_repairs = EXCLUDED.common_3_repairs,
+        common_3_culprits = EXCLUDED.common_3_culprits,
+        solution_to_single_frequent_culprit = EXCLUDED.solution_to_single_frequent_culprit,
+        content_hash = EXCLUDED.content_hash,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE faqs.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING faq_id
     """
-
     with conn.cursor() as cur:
-        # Fetch unique cluster IDs
-        cur.execute(query_cluster_ids)
-        cluster_ids = [row[0] for row in cur.fetchall()]
+        result = execute_values(
+            cur,
+            upsert_query,
+            [
+                (
+                    faq["faq_name"],
+                    faq["machine_type"],
+                    faq["cluster_id"],
+                    faq["common_3_repairs"],
+                    faq["common_3_culprits"],
+                    faq["solution_to_single_frequent_culprit"],
+                    [],
+                    0,
+                    faq["cluster_key"],
+                    faq["content_hash"],
+                )
+                for faq in rows.values()
+            ],
+            page_size=len(rows),
+            fetch=True,
+        )
+    return [row[0] for row in result]
 
-        # Fetch unique machine types
-        cur.execute(query_machine_types)
-        machine_types = [row[0] for row in cur.fetchall()]
 
-    return cluster_ids, machine_types
+@with_connection
+def create_faq_upsert_index(conn):
+    """
+    Add the faqs.content_hash column and the unique (machine_type, cluster_key)
+    index behind `upsert_faqs`. Earlier runs may have stored several FAQs under
+    one key; the newest is kept and their feedback is moved onto it.
+    """
+    dedupe_query = """
+    CREATE TEMP TABLE faq_duplicates ON COMMIT DROP AS
+    SELECT faq_id, keep_id FROM (
+        SELECT faq_id, MAX(faq_id) OVER (
+            PARTITION BY COALESCE(machine_type, ''), cluster_key
+        ) AS keep_id
+        FROM faqs
+        WHERE cluster_key IS NOT NULL
+    ) keyed
+    WHERE faq_id <> keep_id
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE faqs ADD COLUMN IF NOT EXISTS cluster_key TEXT;
+            ALTER TABLE faqs ADD COLUMN IF NOT EXISTS content_hash TEXT;
+            """)
+        cur.execute(dedupe_query)
+        cur.execute("SELECT to_regclass('faq_feedback')")
+        if cur.fetchone()[0] is not None:
+            cur.execute("""
+                UPDATE faq_feedback SET faq_id = d.keep_id
+                FROM faq_duplicates d WHERE faq_feedback.faq_id = d.faq_id
+                """)
+        cur.execute(
+            "DELETE FROM faqs USING faq_duplicates d WHERE faqs.faq_id = d.faq_id"
+        )
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS faqs_machine_type_cluster_key_idx
+            ON faqs ((COALESCE(machine_type, '')), cluster_key)
+            """)
 
 
 def process_and_cluster_with_hdbscan(
@@ -352,7 +742,7 @@ def process_and_cluster_with_hdbscan(
 
     # Step 4: Summarize clusters and generate FAQs
     faq_clusters = summarize_hdbscan_clusters(
-        cluster_labels, embedding_ids, machine_type
+        cluster_labels, embedding_ids, machine_type, embeddings, probabilities
     )
 
 
@@ -378,7 +768,229 @@ def get_all_machine_types(conn):
         return [row[0] for row in result] if result else []
 
 
+@with_connection
+def count_embeddings_by_machine_type(conn) -> dict:
+    """
+    Count the embeddings stored for each machine type.
+
+    Args:
+        conn: Database connection (provided by @with_connection decorator).
+
+    Returns:
+        Dictionary mapping machine_type to its number of embeddings.
+    """
+    query = """
+    SELECT machine_type, COUNT(*)
+    FROM embeddings
+    GROUP BY machine_type
+    """
+    with conn.cursor() as cur:
+        cur.execute(query)
+        return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def estimate_clustering_memory(n_points, dim=768):
+    """
+    Rough estimate (in bytes) of the memory needed to cluster `n_points` embeddings.
+    `cluster_with_hdbscan` builds a dense float64 cosine distance matrix, which
+    dominates; peak usage measured with benchmarks/clustering_benchmark.py is about
+    three matrices of that size.
+    """
+    return 3 * 8 * n_points * n_points + 2 * 8 * n_points * dim
+
+
+def cluster_machine_type(machine_type, min_cluster_size=2, min_samples=1):
+    """
+    Clustering stage for a single machine type: snapshot -> HDBSCAN -> update.
+    Runs in a worker process of `run_parallel_clustering`, so failures are raised
+    instead of printed and only what the summarization stage needs is returned.
+    The embeddings come from the local snapshot (see embedding_snapshots.py), which
+    only downloads rows added since the previous run; the summarization stage opens
+    the same snapshot version instead of receiving the embeddings from the worker.
+    :param machine_type: Machine type to cluster.
+    :param min_cluster_size: Minimum size of clusters.
+    :param min_samples: Minimum samples for a point to be considered core.
+    :return: Dictionary with the cluster labels, probabilities and snapshot version.
+    """
+    snapshot = EmbeddingSnapshotStore().load(machine_type)
+    if len(snapshot.embedding_ids) == 0:
+        raise RuntimeError(f"No embeddings to cluster for '{machine_type}'")
+
+    cluster_labels, probabilities, _ = cluster_with_hdbscan(
+        snapshot.embeddings,
+        min_cluster_size=min_cluster_size,
+        min_samples=min_samples,
+    )
+    if cluster_labels is None:
+        raise RuntimeError(f"HDBSCAN failed for '{machine_type}'")
+
+    update_hdbscan_clusters(cluster_labels, snapshot.embedding_ids.tolist())
+
+    return {
+        "cluster_labels": cluster_labels,
+        "probabilities": probabilities,
+        "snapshot_version": snapshot.version,
+        "n_points": len(cluster_labels),
+        "n_clusters": len(set(cluster_labels.tolist()) - {-1}),
+    }
+
+
+def run_parallel_clustering(
+    machine_types=None,
+    max_workers=None,
+    memory_budget_bytes=None,
+    min_cluster_size=2,
+    min_samples=1,
+):
+    """
+    Cluster machine types concurrently in a process pool.
+
+    Machine types are scheduled largest first, so the longest jobs start early
+    instead of straggling at the end. When a memory budget is set, a machine type
+    is only started once its estimated clustering memory fits next to the jobs
+    already running; the largest one that fits is picked. A machine type that
+    exceeds the budget on its own is clustered out of core (see out_of_core.py)
+    within the whole budget, so it runs alone.
+
+    Args:
+        machine_types: Machine types to cluster (default: all from `repairjob`).
+        max_workers: Number of worker processes (default: $CLUSTERING_WORKERS or CPU count).
+        memory_budget_bytes: Memory budget shared by running jobs
+            (default: $CLUSTERING_MEMORY_BUDGET_MB, unlimited if unset).
+        min_cluster_size: Minimum size of clusters.
+        min_samples: Minimum samples for a point to be considered core.
+
+    Returns:
+        Dictionary mapping machine_type to its result. Every result has a
+        `status` of "ok" or "failed"; failed results carry the `error`.
+        Out-of-core results carry the `paths` of their memory-mapped arrays.
+    """
+    from out_of_core import cluster_machine_type_out_of_core
+
+    if machine_types is None:
+        machine_types = get_all_machine_types()
+    if max_workers is None:
+        max_workers = int(os.environ.get("CLUSTERING_WORKERS", os.cpu_count() or 1))
+    if memory_budget_bytes is None and "CLUSTERING_MEMORY_BUDGET_MB" in os.environ:
+        memory_budget_bytes = int(os.environ["CLUSTERING_MEMORY_BUDGET_MB"]) * 1024**2
+
+    counts = count_embeddings_by_machine_type()
+    pending = sorted(machine_types, key=lambda mt: counts.get(mt, 0), reverse=True)
+    estimates = {mt: estimate_clustering_memory(counts.get(mt, 0)) for mt in pending}
+    out_of_core = set()
+    if memory_budget_bytes is not None:
+        out_of_core = {mt for mt in pending if estimates[mt] > memory_budget_bytes}
+        for machine_type in out_of_core:
+            estimates[machine_type] = memory_budget_bytes
+
+    results = {}
+    in_flight = {}  # future -> (machine_type, start time)
+    reserved_bytes = 0
+    total = len(pending)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or in_flight:
+            while pending and len(in_flight) < max_workers:
+                if memory_budget_bytes is None:
+                    machine_type = pending[0]
+                else:
+                    machine_type = next(
+                        (
+                            mt
+                            for mt in pending
+                            if reserved_bytes + estimates[mt] <= memory_budget_bytes
+                        ),
+                        None if in_flight else pending[0],
+                    )
+                    if machine_type is None:
+                        break
+
+                pending.remove(machine_type)
+                reserved_bytes += estimates[machine_type]
+                if machine_type in out_of_core:
+                    future = executor.submit(
+                        cluster_machine_type_out_of_core,
+                        machine_type,
+                        memory_budget_bytes,
+                        min_cluster_size,
+                        min_samples,
+                    )
+                else:
+                    future = executor.submit(
+                        cluster_machine_type,
+                        machine_type,
+                        min_cluster_size,
+                        min_samples,
+                    )
+                in_flight[future] = (machine_type, time.time())
+                print(
+                    f"Started clustering '{machine_type}' "
+                    f"({counts.get(machine_type, 0)} embeddings"
+                    f"{', out of core' if machine_type in out_of_core else ''})"
+                )
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                machine_type, started_at = in_flight.pop(future)
+                reserved_bytes -= estimates[machine_type]
+                elapsed = time.time() - started_at
+                try:
+                    result = future.result()
+                except Exception as e:
+                    results[machine_type] = {"status": "failed", "error": str(e)}
+                    print(
+                        f"[{len(results)}/{total}] Clustering '{machine_type}' "
+                        f"failed after {elapsed:.1f}s: {e}"
+                    )
+                else:
+                    results[machine_type] = {"status": "ok", **result}
+                    print(
+                        f"[{len(results)}/{total}] Clustered '{machine_type}': "
+                        f"{result['n_clusters']} clusters from {result['n_points']} "
+                        f"embeddings in {elapsed:.1f}s"
+                    )
+
+    return results
+
+
+def summarize_clustered_machine_types(clustering_results):
+    """
+    Summarization stage: generate FAQs for every machine type that clustered successfully.
+    Runs in the main process after `run_parallel_clustering`, so LLM calls are kept
+    out of the clustering workers.
+    :param clustering_results: Output of `run_parallel_clustering`.
+    :return: Dictionary mapping machine_type to "ok", "failed" or "skipped".
+    """
+    from out_of_core import open_out_of_core_result
+
+    statuses = {}
+    for machine_type, result in clustering_results.items():
+        if result["status"] != "ok":
+            statuses[machine_type] = "skipped"
+            print(f"Skipping summarization of '{machine_type}': clustering failed")
+            continue
+        if "paths" in result:
+            result = {**result, **open_out_of_core_result(result["paths"])}
+        snapshot = EmbeddingSnapshotStore().open(
+            machine_type, result["snapshot_version"]
+        )
+
+        faq_clusters = summarize_hdbscan_clusters(
+            result["cluster_labels"],
+            snapshot.embedding_ids,
+            machine_type,
+            snapshot.embeddings,
+            result["probabilities"],
+        )
+        statuses[machine_type] = "ok" if faq_clusters is not None else "failed"
+        print(f"Summarization of '{machine_type}': {statuses[machine_type]}")
+
+    return statuses
+
+
 if __name__ == "__main__":
-    machine_types_list = get_all_machine_types()
-    for machine_type in machine_types_list:
-        process_and_cluster_with_hdbscan(machine_type, 2, 1)
+    create_cluster_texts_index()
+    create_cluster_fingerprints_table()
+    create_faq_upsert_index()
+    clustering_results = run_parallel_clustering(min_cluster_size=2, min_samples=1)
+    summarize_clustered_machine_types(clustering_results)
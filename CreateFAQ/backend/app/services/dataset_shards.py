@@ -0,0 +1,329 @@
+"""
+-----------------------------------------------------------------------
+File: services/dataset_shards.py
+Creation Time: Oct 19th 2026, 1:34 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Sharded exports of generated repair job datasets, and their replay into Postgres.
+
+A dataset directory holds numbered shards (gzipped JSON lines or Parquet) and a
+manifest.json with the generator parameters and every shard's row count, ticket
+range and sha256, so a benchmark environment can be restored without
+regenerating anything:
+
+    python dataset_shards.py load datasets/load-test-1m --workers 8
+    python dataset_shards.py load datasets/load-test-1m --shards 0 1 2
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from offline_repair_jobs import COLUMNS, INT_COLUMNS
+
+SHARD_FORMATS = ("jsonl.gz", "parquet")
+TIMESTAMP_COLUMNS = ("created_at", "updated_at")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _plain_values(values):
+    """Column values as Python objects (ints, strings or None)."""
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == "M":
+            return np.datetime_as_string(values, unit="s").tolist()
+        return values.tolist()
+    return list(values)
+
+
+def _parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet shards need pyarrow: pip install pyarrow")
+    return pa, pq
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, "manifest.json")) as f:
+        return json.load(f)
+
+
+class ShardWriter:
+    """
+    Writes a dataset one shard at a time. The manifest is rewritten after every
+    shard, so an interrupted export keeps every complete shard. A directory that
+    already holds files is only added to with append=True; every run that wrote
+    to the dataset is listed under "runs" with its parameters and first shard.
+    """
+
+    def __init__(
+        self, directory, shard_format="jsonl.gz", parameters=None, append=False
+    ):
+        """
+        Args:
+            directory: Dataset directory (created if missing).
+            shard_format: "jsonl.gz" or "parquet".
+            parameters: Generator parameters recorded in the manifest.
+            append: Add shards to an existing dataset instead of refusing a
+                non-empty directory.
+        """
+        if shard_format not in SHARD_FORMATS:
+            raise ValueError(f"Unknown shard format: {shard_format}")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        has_manifest = os.path.exists(os.path.join(directory, "manifest.json"))
+        if has_manifest and not append:
+            raise ValueError(
+                f"{directory} already holds a dataset; append to it explicitly "
+                "or use a new directory"
+            )
+        if os.listdir(directory) and not has_manifest:
+            raise ValueError(f"{directory} is not empty and holds no dataset")
+        run = {"parameters": parameters or {}, "first_shard": 0}
+        if has_manifest:
+            self.manifest = read_manifest(directory)
+            if self.manifest["format"] != shard_format:
+                raise ValueError(
+                    f"{directory} holds {self.manifest['format']} shards, not {shard_format}"
+                )
+            # Manifests written before runs were recorded had a single run
+            self.manifest.setdefault(
+                "runs", [{"parameters": self.manifest["parameters"], "first_shard": 0}]
+            )
+            run["first_shard"] = len(self.manifest["shards"])
+            self.manifest["runs"].append(run)
+        else:
+            self.manifest = {
+                "format": shard_format,
+                "columns": list(COLUMNS),
+                "parameters": parameters or {},
+                "runs": [run],
+                "rows": 0,
+                "shards": [],
+            }
+
+    def write_shard(self, columns):
+        """
+        Write one shard.
+        :param columns: Dictionary mapping every column of COLUMNS to a list or an array
+            (missing timestamp columns are written as null).
+        :return: The shard's manifest entry.
+        """
+        n_rows = len(columns["ticket_id"])
+        columns = {
+            name: (_plain_values(columns[name]) if name in columns else [None] * n_rows)
+            for name in COLUMNS
+        }
+        # The LLM generator draws costs with cents; the table stores whole numbers
+        for name in INT_COLUMNS:
+            columns[name] = [round(v) if v is not None else None for v in columns[name]]
+        index = len(self.manifest["shards"])
+        name = f"part-{index:05d}.{self.manifest['format']}"
+        path = os.path.join(self.directory, name)
+
+        if self.manifest["format"] == "parquet":
+            pa, pq = _parquet()
+            arrays = {}
+            for column, values in columns.items():
+                if column in INT_COLUMNS:
+                    arrays[column] = pa.array(values, type=pa.int32())
+                elif column in TIMESTAMP_COLUMNS:
+                    # None becomes NaT, which pyarrow stores as null
+                    arrays[column] = pa.array(
+                        np.array(values, dtype="datetime64[s]"),
+                        type=pa.timestamp("s"),
+                        from_pandas=True,
+                    )
+                else:
+                    arrays[column] = pa.array(values, type=pa.string())
+            table = pa.table(arrays)
+            pq.write_table(table, f"{path}.tmp")
+        else:
+            # No name or mtime in the gzip header, so equal shards have equal checksums
+            with open(f"{path}.tmp", "wb") as raw, gzip.GzipFile(
+                filename="", mode="wb", fileobj=raw, compresslevel=3, mtime=0
+            ) as compressed, io.TextIOWrapper(compressed, encoding="utf-8") as f:
+                for row in zip(*columns.values()):
+                    f.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False))
+                    f.write("\n")
+        os.replace(f"{path}.tmp", path)
+
+        entry = {
+            "index": index,
+            "path": name,
+            "rows": n_rows,
+            "first_ticket_id": columns["ticket_id"][0] if n_rows else None,
+            "last_ticket_id": columns["ticket_id"][-1] if n_rows else None,
+            "sha256": _sha256(path),
+        }
+        self.manifest["shards"].append(entry)
+        self.manifest["rows"] += n_rows
+        manifest_path = os.path.join(self.directory, "manifest.json")
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        return entry
+
+
+def read_shard(directory, entry):
+    """Read a shard back into a list of row tuples in COLUMNS order."""
+    path = os.path.join(directory, entry["path"])
+    if path.endswith(".parquet"):
+        _, pq = _parquet()
+        table = pq.read_table(path, columns=list(COLUMNS))
+        columns = []
+        for name in COLUMNS:
+            values = table.column(name).to_pylist()
+            if name in TIMESTAMP_COLUMNS:
+                values = [v.isoformat() if v is not None else None for v in values]
+            columns.append(values)
+        return list(zip(*columns))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [tuple(json.loads(line)[name] for name in COLUMNS) for line in f]
+
+
+def _copy_value(value):
+    """Render a value in Postgres COPY text format."""
+    if value is None:
+        return "\\N"
+    value = str(value)
+    if any(c in value for c in "\\\t\n\r"):
+        value = (
+            value.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+    return value
+
+
+def load_shard(directory, entry, verify=True):
+    """
+    Bulk-load one shard into the RepairJob table. Rows are COPYed into a staging
+    table and inserted from there, so tickets that already exist are skipped and
+    a shard can be replayed twice.
+    :return: (rows in the shard, rows inserted).
+    """
+    from db import with_connection
+
+    if verify and _sha256(os.path.join(directory, entry["path"])) != entry["sha256"]:
+        raise ValueError(f"Checksum mismatch for shard {entry['path']}")
+    rows = read_shard(directory, entry)
+    buffer = io.StringIO(
+        "".join("\t".join(map(_copy_value, row)) + "\n" for row in rows)
+    )
+    column_list = ", ".join(COLUMNS)
+    # Rows exported without timestamps get the table's defaults
+    select_list = ", ".join(
+        f"COALESCE({name}, CURRENT_TIMESTAMP)" if name in TIMESTAMP_COLUMNS else name
+        for name in COLUMNS
+    )
+
+    @with_connection
+    def copy_rows(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE repairjob_stage "
+                "(LIKE RepairJob INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            cur.copy_expert(f"COPY repairjob_stage ({column_list}) FROM STDIN", buffer)
+            cur.execute(f"""
+                INSERT INTO RepairJob ({column_list})
+                SELECT {select_list} FROM repairjob_stage
+                ON CONFLICT (ticket_id) DO NOTHING
+                """)
+            return cur.rowcount
+
+    return len(rows), copy_rows()
+
+
+def load_shards(directory, shard_indexes=None, max_workers=None, verify=True):
+    """
+    Replay a dataset (or some of its shards) into the RepairJob table, one process per shard.
+    :param shard_indexes: Indexes of the shards to load (default: all).
+    :param max_workers: Parallel loaders (default: CPU count).
+    :param verify: Check every shard's sha256 against the manifest first.
+    :return: Dictionary with the rows read and inserted.
+    """
+    from db import create_table
+
+    create_table()
+    manifest = read_manifest(directory)
+    entries = [
+        entry
+        for entry in manifest["shards"]
+        if shard_indexes is None or entry["index"] in set(shard_indexes)
+    ]
+    stats = {"shards": 0, "rows": 0, "inserted": 0}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(load_shard, directory, entry, verify): entry
+            for entry in entries
+        }
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                rows, inserted = future.result()
+            except Exception as e:
+                print(f"Loading shard {entry['path']} failed: {e}")
+                continue
+            stats["shards"] += 1
+            stats["rows"] += rows
+            stats["inserted"] += inserted
+            print(f"Loaded {entry['path']}: {inserted} of {rows} rows inserted")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay generated repair job datasets")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    load = subparsers.add_parser("load", help="Bulk-load shards into the database")
+    load.add_argument("directory")
+    load.add_argument(
+        "--shards", type=int, nargs="+", help="Shard indexes (default: all)"
+    )
+    load.add_argument("--workers", type=int)
+    load.add_argument("--no-verify", action="store_true")
+    show = subparsers.add_parser("show", help="Print a dataset's manifest summary")
+    show.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        manifest = read_manifest(args.directory)
+        print(
+            f"{manifest['rows']} rows in {len(manifest['shards'])} "
+            f"{manifest['format']} shards"
+        )
+        for run in manifest.get("runs", [{"parameters": manifest["parameters"]}]):
+            print(
+                f"  from shard {run.get('first_shard', 0)}: parameters {run['parameters']}"
+            )
+        return
+
+    started_at = time.perf_counter()
+    stats = load_shards(args.directory, args.shards, args.workers, not args.no_verify)
+    seconds = time.perf_counter() - started_at
+    print(
+        f"{stats['inserted']} of {stats['rows']} rows from {stats['shards']} shards "
+        f"inserted in {seconds:.1f}s ({stats['rows'] / seconds:,.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -42,6 +42,7 @@ import uuid
 from typing import Optional, List
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 
 # Connect to the database
 PG_USER = os.environ["PG_USER"]
@@ -148,6 +149,59 @@ def create_repair_job(conn, repair_job: RepairJob):
         )
 
 
+@with_connection
+def create_repair_jobs(conn, repair_jobs: List[RepairJob]) -> List[str]:
+    """
+    Insert many repair jobs in one statement. Tickets that already exist are skipped,
+    so a batch can be retried safely.
+    Returns the ticket_ids that were inserted.
+    """
+    if not repair_jobs:
+        return []
+    insert_query = """
+    INSERT INTO RepairJob (
+        ticket_id, manufacturing_plant_id, video_path, audio_path, engineer_id,
+        machine_id, machine_type, downtime, repairtime, total_cost, labor_cost,
+        item_cost, item_bill_id, replacement_items_list, description,
+        transcription, summary_steps, prev_failed_ticket_id, next_raised_ticket_id
+    ) VALUES %s
+    ON CONFLICT (ticket_id) DO NOTHING
+    RETURNING ticket_id
+    """
+    with conn.cursor() as cur:
+        rows = execute_values(
+            cur,
+            insert_query,
+            [
+                (
+                    repair_job.ticket_id,
+                    repair_job.manufacturing_plant_id,
+                    repair_job.video_path,
+                    repair_job.audio_path,
+                    repair_job.engineer_id,
+                    repair_job.machine_id,
+                    repair_job.machine_type,
+                    repair_job.downtime,
+                    repair_job.repairtime,
+                    repair_job.total_cost,
+                    repair_job.labor_cost,
+                    repair_job.item_cost,
+                    repair_job.item_bill_id,
+                    repair_job.replacement_items_list,
+                    repair_job.description,
+                    repair_job.transcription,
+                    repair_job.summary_steps,
+                    repair_job.prev_failed_ticket_id,
+                    repair_job.next_raised_ticket_id,
+                )
+                for repair_job in repair_jobs
+            ],
+            page_size=len(repair_jobs),
+            fetch=True,
+        )
+    return [row[0] for row in rows]
+
+
 @with_connection
 def read_repair_job(conn, ticket_id: str) -> Optional[RepairJob]:
     select_query = """
@@ -0,0 +1,277 @@
+"""
+-----------------------------------------------------------------------
+File: services/embedding_snapshots.py
+Creation Time: Oct 19th 2026, 1:24 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Local, memory-mapped copies of the `embeddings` table, one per machine type, so
+clustering runs don't download the same vectors from Postgres every time.
+
+Every machine type has append-only files (float32 vectors, int64 embedding ids,
+repair job ids) and a manifest. A refresh appends only the rows above the last
+embedding_id watermark and records a new version; a version is a prefix of the
+files, so older versions stay readable until the snapshot has to be rebuilt.
+"""
+
+import fcntl
+import json
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+import numpy as np
+from db import with_connection
+
+SNAPSHOT_DIR = os.environ.get("EMBEDDING_SNAPSHOT_DIR", "embedding_snapshots")
+
+
+def parse_vector(embedding):
+    """
+    Parse a pgvector value ("[0.1,0.2,...]") into a float32 array.
+    Much faster than ast.literal_eval for 768 floats.
+    """
+    if not isinstance(embedding, str):
+        return np.asarray(embedding, dtype=np.float32)
+    return np.fromstring(embedding.strip("[]"), dtype=np.float32, sep=",")
+
+
+@dataclass
+class EmbeddingSnapshot:
+    machine_type: Optional[str]
+    version: int
+    watermark: int  # highest embedding_id in the snapshot
+    embeddings: np.ndarray  # read-only memory map, (rows, dim) float32
+    embedding_ids: np.ndarray  # read-only memory map, (rows,) int64
+    repair_job_ids_path: str
+    repair_job_ids_bytes: int
+
+    def repair_job_ids(self) -> List[str]:
+        """Repair job ids aligned with the embeddings (read on demand)."""
+        with open(self.repair_job_ids_path, encoding="utf-8") as f:
+            return f.read(self.repair_job_ids_bytes).splitlines()
+
+
+@with_connection
+def _append_new_rows(conn, machine_type, watermark, files, batch_size=5000):
+    """
+    Append the rows above `watermark` to the snapshot files.
+    The rows are streamed through a server-side cursor and counted in the same
+    REPEATABLE READ snapshot, so the caller can tell whether rows below the
+    watermark were deleted or committed late (the snapshot then needs a rebuild).
+    :param conn: Database connection (provided by @with_connection decorator).
+    :param files: Open binary files for "vectors", "ids" and "repair_job_ids".
+    :return: (rows appended, new watermark, vector dimension, rows in the table).
+    """
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    where, params = "WHERE embedding_id > %s", [watermark]
+    if machine_type:
+        where += " AND machine_type = %s"
+        params.append(machine_type)
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) FROM embeddings"
+            + (" WHERE machine_type = %s" if machine_type else ""),
+            (machine_type,) if machine_type else None,
+        )
+        total_rows = cur.fetchone()[0]
+
+    appended, dim = 0, None
+    with conn.cursor(name="snapshot_refresh_cursor") as cur:
+        cur.itersize = batch_size
+        cur.execute(
+            f"SELECT embedding_id, embedding, repair_job_id FROM embeddings {where} "
+            "ORDER BY embedding_id",
+            params,
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            vectors = np.stack([parse_vector(row[1]) for row in rows])
+            dim = vectors.shape[1]
+            files["vectors"].write(vectors.tobytes())
+            files["ids"].write(np.array([row[0] for row in rows], np.int64).tobytes())
+            files["repair_job_ids"].write(
+                "".join(f"{row[2]}\n" for row in rows).encode("utf-8")
+            )
+            appended += len(rows)
+            watermark = rows[-1][0]
+    return appended, watermark, dim, total_rows
+
+
+class EmbeddingSnapshotStore:
+    """
+    Versioned, memory-mapped snapshots of the embeddings of each machine type.
+
+    Layout of a machine type's directory:
+        manifest.json            generation, dim and the list of versions
+        vectors.<gen>.f32        raw float32 rows
+        ids.<gen>.i64            raw int64 embedding ids
+        repair_job_ids.<gen>.txt one repair job id per line
+
+    A rebuild (when rows below the watermark were deleted or committed late)
+    writes a new generation of files, so readers of the old one are unaffected.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory: Root directory (default: $EMBEDDING_SNAPSHOT_DIR or embedding_snapshots).
+        """
+        self.directory = directory or SNAPSHOT_DIR
+
+    def _machine_dir(self, machine_type):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", machine_type or "all")
+        return os.path.join(self.directory, name)
+
+    def _files(self, machine_type, generation):
+        base = self._machine_dir(machine_type)
+        return {
+            "vectors": os.path.join(base, f"vectors.{generation}.f32"),
+            "ids": os.path.join(base, f"ids.{generation}.i64"),
+            "repair_job_ids": os.path.join(base, f"repair_job_ids.{generation}.txt"),
+        }
+
+    def manifest(self, machine_type) -> dict:
+        """The manifest of a machine type (no versions if it was never refreshed)."""
+        path = os.path.join(self._machine_dir(machine_type), "manifest.json")
+        if not os.path.exists(path):
+            return {"generation": 0, "dim": None, "versions": []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, machine_type, manifest):
+        path = os.path.join(self._machine_dir(machine_type), "manifest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def refresh(self, machine_type, batch_size=5000) -> dict:
+        """
+        Bring the snapshot of a machine type up to date with the embeddings table.
+        Only rows above the watermark of the latest version are downloaded. If the
+        table then holds a different number of rows than the snapshot, rows below
+        the watermark were deleted or committed out of order, and the snapshot is
+        rebuilt from scratch.
+        :return: The latest version entry of the manifest.
+        """
+        os.makedirs(self._machine_dir(machine_type), exist_ok=True)
+        lock_path = os.path.join(self._machine_dir(machine_type), ".lock")
+        with open(lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            manifest = self.manifest(machine_type)
+            latest = manifest["versions"][-1] if manifest["versions"] else None
+
+            version = self._append(machine_type, manifest, latest, batch_size)
+            if version is None:
+                print(f"Rebuilding the embedding snapshot of '{machine_type}'")
+                old_files = self._files(machine_type, manifest["generation"])
+                manifest = {
+                    **manifest,
+                    "generation": manifest["generation"] + 1,
+                    "dim": None,
+                    "versions": [],
+                }
+                version = self._append(machine_type, manifest, None, batch_size)
+                if version is None:
+                    raise RuntimeError(
+                        f"Could not rebuild the embedding snapshot of '{machine_type}'"
+                    )
+                for path in old_files.values():
+                    if os.path.exists(path):
+                        os.remove(path)
+            return version
+
+    def _append(self, machine_type, manifest, latest, batch_size):
+        """
+        Append new rows to the current generation and record a version.
+        :return: The latest version entry, or None if the snapshot needs a rebuild.
+        """
+        files = self._files(machine_type, manifest["generation"])
+        sizes = {
+            "vectors": latest["rows"] * 4 * manifest["dim"] if latest else 0,
+            "ids": latest["rows"] * 8 if latest else 0,
+            "repair_job_ids": latest["repair_job_ids_bytes"] if latest else 0,
+        }
+        handles = {}
+        try:
+            for key, path in files.items():
+                handles[key] = open(path, "r+b" if os.path.exists(path) else "w+b")
+                # Drop whatever an interrupted refresh appended after the last version
+                handles[key].truncate(sizes[key])
+                handles[key].seek(sizes[key])
+            appended, watermark, dim, total_rows = _append_new_rows(
+                machine_type, latest["watermark"] if latest else 0, handles, batch_size
+            )
+            for handle in handles.values():
+                handle.flush()
+                os.fsync(handle.fileno())
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+        rows = (latest["rows"] if latest else 0) + appended
+        if rows != total_rows:
+            return None
+        if appended == 0 and latest:
+            return latest
+        if manifest["dim"] is not None and dim is not None and dim != manifest["dim"]:
+            return None
+
+        version = {
+            "version": manifest.get("last_version", 0) + 1,
+            "rows": rows,
+            "watermark": watermark,
+            "repair_job_ids_bytes": os.path.getsize(files["repair_job_ids"]),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        manifest["dim"] = manifest["dim"] or dim
+        manifest["last_version"] = version["version"]
+        manifest["versions"].append(version)
+        self._write_manifest(machine_type, manifest)
+        return version
+
+    def open(self, machine_type, version: Optional[int] = None) -> EmbeddingSnapshot:
+        """
+        Memory-map a version of a machine type's snapshot without copying it.
+        :param version: Version to open (default: the latest).
+        """
+        manifest = self.manifest(machine_type)
+        versions = {entry["version"]: entry for entry in manifest["versions"]}
+        if not versions:
+            raise FileNotFoundError(f"No embedding snapshot for '{machine_type}'")
+        entry = versions[version] if version is not None else manifest["versions"][-1]
+        files = self._files(machine_type, manifest["generation"])
+
+        rows, dim = entry["rows"], manifest["dim"] or 0
+        if rows == 0:
+            embeddings = np.empty((0, dim), dtype=np.float32)
+            embedding_ids = np.empty(0, dtype=np.int64)
+        else:
+            embeddings = np.memmap(
+                files["vectors"], dtype=np.float32, mode="r", shape=(rows, dim)
+            )
+            embedding_ids = np.memmap(
+                files["ids"], dtype=np.int64, mode="r", shape=(rows,)
+            )
+        return EmbeddingSnapshot(
+            machine_type=machine_type,
+            version=entry["version"],
+            watermark=entry["watermark"],
+            embeddings=embeddings,
+            embedding_ids=embedding_ids,
+            repair_job_ids_path=files["repair_job_ids"],
+            repair_job_ids_bytes=entry["repair_job_ids_bytes"],
+        )
+
+    def load(self, machine_type) -> EmbeddingSnapshot:
+        """Refresh the snapshot of a machine type and open its latest version."""
+        self.refresh(machine_type)
+        return self.open(machine_type)
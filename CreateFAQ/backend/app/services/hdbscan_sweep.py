@@ -0,0 +1,314 @@
+"""
+-----------------------------------------------------------------------
+File: services/hdbscan_sweep.py
+Creation Time: Oct 19th 2026, 1:27 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+HDBSCAN hyperparameter sweep over min_cluster_size / min_samples /
+cluster_selection_epsilon, scored with DBCV, noise ratio and cluster count.
+
+The expensive work is shared instead of redone per setting:
+- the cosine distance matrix and every point's sorted nearest-neighbour distances
+  are computed once, and workers memory-map them;
+- the minimum spanning tree of the mutual reachability graph (and its single
+  linkage tree) is built once per min_samples, since only core distances depend
+  on it;
+- every (min_cluster_size, epsilon) pair then only condenses that tree.
+
+Nothing is written to the database; the ranked results go to a JSON report.
+
+    python hdbscan_sweep.py --machine-type "Type A" --min-cluster-sizes 2 5 10 \\
+        --min-samples 1 3 5 --epsilons 0 0.05 0.1 --output hdbscan_sweep.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+
+# Private hdbscan internals, so each min_samples tree is built once and condensed
+# per setting; pyproject.toml pins hdbscan to the releases they were checked against
+from hdbscan._hdbscan_linkage import label, mst_linkage_core
+from hdbscan.hdbscan_ import _tree_to_labels
+from hdbscan.validity import validity_index
+from sklearn.metrics.pairwise import cosine_distances
+from sklearn.preprocessing import normalize
+
+# DBCV is quadratic per cluster, so large sweeps score a random sample of points
+DBCV_SAMPLE_SIZE = int(os.environ.get("HDBSCAN_SWEEP_DBCV_SAMPLE", 5000))
+
+# Shared arrays of the worker processes, memory-mapped from the sweep's work directory
+_shared = {}
+
+
+def _init_worker(work_dir):
+    _shared["distances"] = np.load(
+        os.path.join(work_dir, "distances.npy"), mmap_mode="r"
+    )
+    _shared["neighbour_distances"] = np.load(
+        os.path.join(work_dir, "neighbour_distances.npy"), mmap_mode="r"
+    )
+    _shared["dbcv_sample"] = np.load(os.path.join(work_dir, "dbcv_sample.npy"))
+
+
+def _build_tree(min_samples):
+    """
+    Single linkage tree of the mutual reachability graph for one min_samples,
+    computed the way hdbscan's generic (precomputed) algorithm does.
+    """
+    distances = _shared["distances"]
+    n = len(distances)
+    core_distances = _shared["neighbour_distances"][:, min(n - 1, min_samples)]
+
+    mutual_reachability = np.array(distances, order="C")
+    np.maximum(mutual_reachability, core_distances[:, None], out=mutual_reachability)
+    np.maximum(mutual_reachability, core_distances[None, :], out=mutual_reachability)
+    spanning_tree = mst_linkage_core(mutual_reachability)
+    del mutual_reachability
+
+    spanning_tree = spanning_tree[np.argsort(spanning_tree.T[2]), :]
+    return label(spanning_tree)
+
+
+def estimate_dbcv_dim(distances):
+    """
+    The dimension DBCV's all-points core distance should raise distances to.
+
+    DBCV uses the data dimension, but at the 768 dimensions of the embeddings
+    (1/distance)**768 overflows and every setting gets the same score. The
+    embeddings lie near a much lower-dimensional manifold, so this uses its
+    TwoNN estimate (Facco et al., 2017) on the same cosine distances DBCV sees,
+    capped so that the core distance sums stay finite.
+    :param distances: Square matrix of pairwise distances of the DBCV sample.
+    :return: Dimension to pass to validity_index as `d`.
+    """
+    distances = np.array(distances, dtype=np.float64)
+    # Skip the point itself and exact duplicates
+    distances[distances <= 0] = np.inf
+    nearest = np.sort(np.partition(distances, 1, axis=1)[:, :2], axis=1)
+    nearest = nearest[np.isfinite(nearest).all(axis=1)]
+    log_ratios = np.log(nearest[:, 1] / nearest[:, 0])
+    dim = len(log_ratios) / log_ratios.sum() if log_ratios.sum() > 0 else 1.0
+
+    smallest = nearest[:, 0].min() if len(nearest) else 1.0
+    if smallest < 1.0:
+        max_exponent = np.log(np.finfo(np.float64).max / len(distances))
+        dim = min(dim, max_exponent / -np.log(smallest))
+    return float(max(dim, 1.0))
+
+
+def _score_setting(single_linkage_tree, min_cluster_size, epsilon, dim):
+    """
+    Cluster with one (min_cluster_size, epsilon) on a prebuilt tree and score it.
+    :param dim: Dimension for DBCV (see estimate_dbcv_dim).
+    :return: (labels, scores) where scores has the cluster count, noise ratio and DBCV.
+    """
+    labels = _tree_to_labels(
+        None,
+        single_linkage_tree,
+        min_cluster_size,
+        cluster_selection_epsilon=epsilon,
+    )[0]
+    n_clusters = len(set(labels.tolist()) - {-1})
+
+    dbcv = None
+    sample = _shared["dbcv_sample"]
+    sample_labels = labels[sample].copy()
+    # validity_index can't score a cluster with a single sampled point
+    counts = np.bincount(sample_labels[sample_labels != -1], minlength=n_clusters)
+    sample_labels[np.isin(sample_labels, np.flatnonzero(counts < 2))] = -1
+    if len(set(sample_labels.tolist()) - {-1}) >= 2:
+        sample_distances = np.asarray(_shared["distances"][np.ix_(sample, sample)])
+        score = validity_index(
+            sample_distances, sample_labels, metric="precomputed", d=dim
+        )
+        dbcv = float(score) if np.isfinite(score) else None
+
+    return labels, {
+        "n_clusters": n_clusters,
+        "noise_ratio": round(float((labels == -1).mean()), 4),
+        "dbcv": round(dbcv, 4) if dbcv is not None else None,
+    }
+
+
+def _evaluate(min_samples, settings, dim):
+    """
+    Worker task: build the tree for one min_samples and score all its settings.
+    :param settings: List of (min_cluster_size, epsilon).
+    :return: List of result dictionaries.
+    """
+    started_at = time.perf_counter()
+    single_linkage_tree = _build_tree(min_samples)
+    tree_seconds = time.perf_counter() - started_at
+
+    results = []
+    for min_cluster_size, epsilon in settings:
+        started_at = time.perf_counter()
+        try:
+            _, scores = _score_setting(
+                single_linkage_tree, min_cluster_size, epsilon, dim
+            )
+        except Exception as e:
+            scores = {"n_clusters": None, "noise_ratio": None, "dbcv": None}
+            scores["error"] = str(e)
+        results.append(
+            {
+                "min_cluster_size": min_cluster_size,
+                "min_samples": min_samples,
+                "cluster_selection_epsilon": epsilon,
+                **scores,
+                "seconds": round(time.perf_counter() - started_at, 4),
+                "shared_tree_seconds": round(tree_seconds, 4),
+            }
+        )
+    return results
+
+
+def rank_results(results):
+    """
+    Best first: highest DBCV, then lowest noise ratio. Settings without a DBCV
+    (fewer than two clusters, or failed) come last.
+    """
+    return sorted(
+        results,
+        key=lambda r: (
+            r["dbcv"] is None,
+            -(r["dbcv"] or 0.0),
+            r["noise_ratio"] if r["noise_ratio"] is not None else 1.0,
+        ),
+    )
+
+
+def sweep_hdbscan(
+    embeddings,
+    min_cluster_sizes=(2, 5, 10),
+    min_samples_values=(1, 3, 5),
+    epsilons=(0.0, 0.05, 0.1),
+    max_workers=None,
+    dbcv_sample_size=DBCV_SAMPLE_SIZE,
+    seed=0,
+):
+    """
+    Evaluate a grid of HDBSCAN settings in parallel, sharing the expensive work.
+    :param embeddings: Numpy array (n, dim) of embeddings.
+    :param min_cluster_sizes: Values of min_cluster_size to try.
+    :param min_samples_values: Values of min_samples to try.
+    :param epsilons: Values of cluster_selection_epsilon to try.
+    :param max_workers: Worker processes (default: one per min_samples, up to the CPU count).
+        Every worker holds one n x n mutual reachability matrix at a time.
+    :param dbcv_sample_size: Number of points DBCV is computed on.
+    :param seed: Seed of the DBCV sample.
+    :return: Dictionary with the timings of the shared work and the ranked results.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    n, dim = embeddings.shape
+    min_samples_values = sorted(set(min_samples_values))
+    settings = list(itertools.product(sorted(set(min_cluster_sizes)), epsilons))
+    if max_workers is None:
+        max_workers = min(len(min_samples_values), os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        started_at = time.perf_counter()
+        distances = cosine_distances(normalize(embeddings))
+        np.save(os.path.join(work_dir, "distances.npy"), distances)
+        # Nearest-neighbour distances up to the largest min_samples, shared by all trees
+        k = min(n - 1, max(min_samples_values))
+        neighbour_distances = np.sort(
+            np.partition(distances, k, axis=1)[:, : k + 1], axis=1
+        )
+        np.save(os.path.join(work_dir, "neighbour_distances.npy"), neighbour_distances)
+        rng = np.random.default_rng(seed)
+        dbcv_sample = np.sort(rng.choice(n, min(n, dbcv_sample_size), replace=False))
+        np.save(os.path.join(work_dir, "dbcv_sample.npy"), dbcv_sample)
+        dbcv_dim = estimate_dbcv_dim(distances[np.ix_(dbcv_sample, dbcv_sample)])
+        del distances, neighbour_distances
+        shared_seconds = time.perf_counter() - started_at
+
+        results = []
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(work_dir,)
+        ) as executor:
+            futures = {
+                executor.submit(_evaluate, min_samples, settings, dbcv_dim): min_samples
+                for min_samples in min_samples_values
+            }
+            for future, min_samples in futures.items():
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    print(f"Sweep of min_samples={min_samples} failed: {e}")
+                    continue
+                print(f"Swept min_samples={min_samples}: {len(settings)} settings")
+
+    return {
+        "n_points": n,
+        "dim": dim,
+        "dbcv_dim": round(dbcv_dim, 2),
+        "dbcv_sample_size": int(len(dbcv_sample)),
+        "shared_distances_seconds": round(shared_seconds, 4),
+        "results": rank_results(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HDBSCAN hyperparameter sweep")
+    parser.add_argument("--machine-type", help="Machine type to sweep (default: all)")
+    parser.add_argument("--min-cluster-sizes", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--min-samples", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--epsilons", type=float, nargs="+", default=[0.0, 0.05, 0.1])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--dbcv-sample-size", type=int, default=DBCV_SAMPLE_SIZE)
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="Use the local embedding snapshot as it is, without querying the DB",
+    )
+    parser.add_argument("--output", default="hdbscan_sweep.json")
+    args = parser.parse_args()
+
+    from embedding_snapshots import EmbeddingSnapshotStore
+
+    store = EmbeddingSnapshotStore()
+    snapshot = (
+        store.open(args.machine_type)
+        if args.no_refresh
+        else store.load(args.machine_type)
+    )
+    report = sweep_hdbscan(
+        snapshot.embeddings,
+        args.min_cluster_sizes,
+        args.min_samples,
+        args.epsilons,
+        args.workers,
+        args.dbcv_sample_size,
+    )
+    report = {
+        "machine_type": args.machine_type,
+        "snapshot_version": snapshot.version,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        **report,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for rank, result in enumerate(report["results"][:5], start=1):
+        print(
+            f"{rank}. min_cluster_size={result['min_cluster_size']} "
+            f"min_samples={result['min_samples']} "
+            f"epsilon={result['cluster_selection_epsilon']}: "
+            f"DBCV {result['dbcv']}, {result['n_clusters']} clusters, "
+            f"{result['noise_ratio']:.1%} noise"
+        )
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+-----------------------------------------------------------------------
+File: services/llm_cache.py
+Creation Time: Oct 19th 2026, 1:07 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of LLM responses, stored in a local SQLite file.
+
+    Keys combine the model, the prompt template version and a hash of the
+    (sorted) input texts, so bumping a template version invalidates old answers.
+    With `bypass` set, lookups always miss but fresh responses are still stored,
+    which refreshes the cache.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        bypass: Optional[bool] = None,
+    ):
+        """
+        Args:
+            path: SQLite file (default: $LLM_CACHE_PATH or llm_cache.sqlite3).
+            ttl_seconds: Entry lifetime (default: $LLM_CACHE_TTL_SECONDS or 30 days).
+            bypass: Skip lookups (default: $LLM_CACHE_BYPASS is "1"/"true").
+        """
+        self.path = path or os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+        self.ttl_seconds = (
+            ttl_seconds
+            if ttl_seconds is not None
+            else float(os.environ.get("LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+        )
+        self.bypass = (
+            bypass
+            if bypass is not None
+            else os.environ.get("LLM_CACHE_BYPASS", "").lower() in ("1", "true")
+        )
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+
+    @staticmethod
+    def make_key(model: str, template_version: str, texts: List[str]) -> str:
+        """Build the cache key for a prompt built from `texts`."""
+        texts_hash = hashlib.sha256(
+            json.dumps(sorted(texts), ensure_ascii=False).encode()
+        ).hexdigest()
+        return hashlib.sha256(
+            f"{model}\x00{template_version}\x00{texts_hash}".encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key`, or None on a miss or expired entry."""
+        if self.bypass:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            if row and time.time() - row[1] > self.ttl_seconds:
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM llm_responses WHERE cache_key = ?", (key,)
+                    )
+                row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, response: str):
+        """Store (or refresh) the response for `key`."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (cache_key, response, created_at) "
+                "VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+        self.writes += 1
+
+    def stats(self) -> dict:
+        """Hit/miss statistics since this cache object was created."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bypass": self.bypass,
+        }
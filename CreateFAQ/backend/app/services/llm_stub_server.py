@@ -0,0 +1,151 @@
+"""
+-----------------------------------------------------------------------
+File: services/llm_stub_server.py
+Creation Time: Oct 19th 2026, 1:07 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Minimal OpenAI-compatible chat completions server for exercising the
+summarization pipeline without a real LLM. Point the pipeline at it with:
+
+    python llm_stub_server.py --port 8080 --latency-ms 200 --error-rate 0.1
+    GEMINI_API_KEY=stub GEMINI_BASE_URL=http://localhost:8080/v1/ python clustering.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = """```json
+{
+    "faq_name": "Stub FAQ",
+    "common_3_repairs": "Replace filter, Recalibrate sensor, Flush lines",
+    "common_3_culprits": "Clogged filter, Loose wiring, Worn seal",
+    "solution_to_single_frequent_culprit": "Clogged filter: replace it and flush the system."
+}
+```"""
+
+
+class StubState:
+    """Configuration and request counters shared by all handler threads."""
+
+    def __init__(self, content, latency_ms, error_rate):
+        self.content = content
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+
+def make_handler(state):
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            time.sleep(state.latency_ms / 1000)
+
+            with state.lock:
+                state.requests += 1
+                fail = random.random() < state.error_rate
+                if fail:
+                    state.errors += 1
+
+            if fail:
+                # Pick one of the two failure modes the client has to retry
+                if random.random() < 0.5:
+                    self._send_json(
+                        429,
+                        {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                        {"Retry-After": "0.1"},
+                    )
+                else:
+                    self._send_json(503, {"error": {"message": "Service unavailable"}})
+                return
+
+            prompt_chars = sum(
+                len(message.get("content", "")) for message in request.get("messages", [])
+            )
+            self._send_json(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": state.content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_chars // 4,
+                        "completion_tokens": len(state.content) // 4,
+                        "total_tokens": (prompt_chars + len(state.content)) // 4,
+                    },
+                },
+            )
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChatCompletionsHandler
+
+
+def serve(port=8080, content=DEFAULT_CONTENT, latency_ms=0, error_rate=0.0):
+    """
+    Start the stub server in a background thread.
+    :return: The server (call `shutdown()` to stop it) and its shared StubState.
+    """
+    state = StubState(content, latency_ms, error_rate)
+    server = ThreadingHTTPServer(("localhost", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of 429/503 responses"
+    )
+    parser.add_argument("--response-file", help="File with the message content to return")
+    args = parser.parse_args()
+
+    content = DEFAULT_CONTENT
+    if args.response_file:
+        with open(args.response_file) as f:
+            content = f.read()
+
+    server, state = serve(args.port, content, args.latency_ms, args.error_rate)
+    print(f"Stub LLM server listening on http://localhost:{args.port}/v1/")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {state.requests} requests ({state.errors} injected errors)")
@@ -0,0 +1,506 @@
+"""
+-----------------------------------------------------------------------
+File: services/offline_repair_jobs.py
+Creation Time: Oct 19th 2026, 1:32 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+LLM-free generator of synthetic repair jobs for load and scale tests.
+
+Descriptions, transcriptions and summary steps are composed from the catalog in
+repair_job_catalog.py instead of asking the LLM, and the numeric fields are drawn
+in NumPy a chunk at a time. Every chunk has its own seed, so the same (seed,
+chunk_size) always produces the same rows. Rows stream straight into Postgres with
+COPY, into a COPY-format text file, or into Parquet (needs pyarrow).
+
+    python offline_repair_jobs.py --count 1000000 --sink copy
+    python offline_repair_jobs.py --count 1000000 --sink parquet --output repair_jobs.parquet
+    python offline_repair_jobs.py --count 1000000 --sink shards --output datasets/load-test-1m
+"""
+
+import argparse
+import io
+import time
+from datetime import datetime
+import numpy as np
+from repair_job_catalog import (
+    engineers,
+    machine_models,
+    machine_types,
+    manufacturing_plants,
+    repair_jobs,
+    standard_repair_steps,
+)
+
+# Columns of the RepairJob table, in the order rows are written
+COLUMNS = (
+    "ticket_id",
+    "manufacturing_plant_id",
+    "video_path",
+    "audio_path",
+    "engineer_id",
+    "machine_id",
+    "machine_type",
+    "downtime",
+    "repairtime",
+    "total_cost",
+    "labor_cost",
+    "item_cost",
+    "item_bill_id",
+    "replacement_items_list",
+    "description",
+    "transcription",
+    "summary_steps",
+    "prev_failed_ticket_id",
+    "next_raised_ticket_id",
+    "created_at",
+    "updated_at",
+)
+INT_COLUMNS = ("downtime", "repairtime", "total_cost", "labor_cost", "item_cost")
+
+# Same outcomes the LLM prompt asks for in synthetic_data_generation.py
+OUTCOME_SUCCESS, OUTCOME_FAILED, OUTCOME_ALTERNATE, OUTCOME_FAILED_DEVIATION = range(4)
+
+OPENERS = [
+    "Okay, starting on this one.",
+    "Alright, recording now.",
+    "So, first look at the unit.",
+    "Beginning the repair as planned.",
+    "Let's get this one done.",
+    "Logging the repair as I go.",
+]
+NOISE_SENTENCES = [
+    " Hangar temperature was above normal during the inspection.",
+    " Work was paused briefly for a shift handover.",
+    " The unit had been flagged by the previous crew as well.",
+    " Tooling had to be fetched from the other bay.",
+    " Documentation for this serial number was incomplete.",
+]
+FILLERS = [" Uh, let me double-check that.", " Hmm, okay.", " Wait, one second."]
+
+CREATED_AT_START = np.datetime64("2024-11-01T00:00:00")
+CREATED_AT_SPAN_MINUTES = 16 * 24 * 60
+
+
+def _typo(text, rng):
+    """Swap two adjacent letters of a random word, the way a hurried engineer would."""
+    words = text.split(" ")
+    candidates = [i for i, word in enumerate(words) if len(word) > 4]
+    if not candidates:
+        return text
+    i = candidates[rng.integers(len(candidates))]
+    j = int(rng.integers(1, len(words[i]) - 2))
+    word = words[i]
+    words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2 :]
+    return " ".join(words)
+
+
+def _step_list(steps):
+    return " ".join(f"{i}. {step}" for i, step in enumerate(steps, start=1))
+
+
+class _TextVariants:
+    """
+    Every description, transcription and summary text a row can get, rendered once.
+
+    A variant is identified by (job type, outcome, deviation, typo): the deviation is 0
+    when the planned steps were followed, or k + 1 when step k was replaced by a step
+    taken from another job type.
+    """
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        self.n_steps = np.array(
+            [len(standard_repair_steps[job]) for job in repair_jobs]
+        )
+        self.deviation_slots = int(self.n_steps.max()) + 1
+        size = len(repair_jobs) * 4 * self.deviation_slots
+        self.descriptions = [[None] * size, [None] * size]
+        self.transcriptions = [None] * size
+        self.summaries = [None] * size
+
+        for j, job in enumerate(repair_jobs):
+            steps = standard_repair_steps[job]
+            other_steps = [
+                step
+                for other in repair_jobs
+                if other != job
+                for step in standard_repair_steps[other]
+            ]
+            for outcome in range(4):
+                deviations = (
+                    range(1, len(steps) + 1)
+                    if outcome in (OUTCOME_ALTERNATE, OUTCOME_FAILED_DEVIATION)
+                    else [0]
+                )
+                for deviation in deviations:
+                    followed = list(steps)
+                    replacement = None
+                    if deviation:
+                        replacement = other_steps[rng.integers(len(other_steps))]
+                        followed[deviation - 1] = replacement
+                    description, transcription = self._render(
+                        job, steps, outcome, deviation, replacement
+                    )
+                    k = self.index(j, outcome, deviation)
+                    self.descriptions[0][k] = description
+                    self.descriptions[1][k] = _typo(description, rng)
+                    self.transcriptions[k] = transcription
+                    self.summaries[k] = _step_list(followed)
+
+        # Rows are written as COPY text without escaping, so no variant may need it
+        for texts in (*self.descriptions, self.transcriptions, self.summaries):
+            for text in texts:
+                assert text is None or not any(c in text for c in "\t\n\r\\")
+
+    def index(self, job, outcome, deviation):
+        return (job * 4 + outcome) * self.deviation_slots + deviation
+
+    @staticmethod
+    def _render(job, steps, outcome, deviation, replacement):
+        if outcome == OUTCOME_SUCCESS:
+            result = (
+                "The planned repair steps were followed and the issue was resolved."
+            )
+            remark = "Everything checks out, closing the ticket."
+        elif outcome == OUTCOME_FAILED:
+            result = "The planned repair steps were followed but the issue persists."
+            remark = "Still seeing the fault, escalating this one."
+        elif outcome == OUTCOME_ALTERNATE:
+            result = (
+                f"The repair succeeded through an alternate method: "
+                f"'{replacement}' was done instead of '{steps[deviation - 1]}'"
+            )
+            remark = "Different route than planned, but it works now."
+        else:
+            result = (
+                f"The repair failed and deviated from the plan: "
+                f"'{replacement}' was done instead of '{steps[deviation - 1]}'"
+            )
+            remark = "That didn't fix it, we'll need another ticket."
+        description = f"{job}. {result.rstrip('.')}."
+        spoken = " ".join(
+            (
+                f"Now, {replacement[0].lower()}{replacement[1:]}"
+                if deviation and i == deviation - 1
+                else step
+            )
+            for i, step in enumerate(steps)
+        )
+        return description, f"Looks like {job.lower()}. {spoken} {remark}"
+
+
+def generate_chunk(
+    start,
+    size,
+    variants,
+    seed=0,
+    chunk_index=0,
+    failure_rate=0.25,
+    deviation_rate=0.2,
+    noise_rate=0.1,
+    repetition_rate=0.05,
+):
+    """
+    Generate `size` repair jobs numbered from `start`.
+    :param variants: _TextVariants the texts are taken from.
+    :param failure_rate: Share of repairs that failed.
+    :param deviation_rate: Share of repairs that deviated from the planned steps.
+    :param noise_rate: Share of rows with a typo and an irrelevant remark in their texts.
+    :param repetition_rate: Share of rows that repeat an earlier row of the chunk
+        (same machine, job and texts), like a duplicated report.
+    :return: Dictionary mapping every column of COLUMNS to a list or an array.
+    """
+    rng = np.random.default_rng([seed, chunk_index])
+    rows = np.arange(size)
+
+    job = rng.integers(0, len(repair_jobs), size)
+    machine_type = rng.integers(0, len(machine_types), size)
+    n_models = np.array([len(machine_models[t]) for t in machine_types])
+    model = (rng.random(size) * n_models[machine_type]).astype(np.int64)
+    serial = rng.integers(1, 1001, size)
+    failed = rng.random(size) < failure_rate
+    deviated = rng.random(size) < deviation_rate
+    outcome = np.where(
+        deviated,
+        np.where(failed, OUTCOME_FAILED_DEVIATION, OUTCOME_ALTERNATE),
+        np.where(failed, OUTCOME_FAILED, OUTCOME_SUCCESS),
+    )
+    deviation = np.where(
+        deviated, 1 + (rng.random(size) * variants.n_steps[job]).astype(np.int64), 0
+    )
+    noisy = (rng.random(size) < noise_rate).astype(np.int64)
+    opener = rng.integers(0, len(OPENERS), size)
+    noise_sentence = rng.integers(0, len(NOISE_SENTENCES), size)
+    filler = rng.integers(0, len(FILLERS), size)
+
+    # Repeated rows take every categorical field of a random earlier row
+    repeated = (rng.random(size) < repetition_rate) & (rows > 0)
+    source = np.where(
+        repeated, (rng.random(size) * np.maximum(rows, 1)).astype(np.int64), rows
+    )
+    # Chains of repeats resolve to their original row
+    source = source[source]
+    while np.any(source != source[source]):
+        source = source[source]
+    job, machine_type, model, serial = (
+        job[source],
+        machine_type[source],
+        model[source],
+        serial[source],
+    )
+    outcome, deviation, noisy = outcome[source], deviation[source], noisy[source]
+    opener, noise_sentence, filler = (
+        opener[source],
+        noise_sentence[source],
+        filler[source],
+    )
+
+    downtime = rng.integers(24, 73, size)
+    repairtime = rng.integers(4, 13, size)
+    total_cost = rng.integers(5000, 50001, size)
+    labor_cost = np.rint(total_cost * 0.4).astype(np.int64)
+    item_cost = total_cost - labor_cost
+    created_at = CREATED_AT_START + rng.integers(
+        0, CREATED_AT_SPAN_MINUTES, size
+    ).astype("timedelta64[m]")
+    updated_at = created_at + rng.integers(1, 49, size).astype("timedelta64[h]")
+
+    variant = (job * 4 + outcome) * variants.deviation_slots + deviation
+    model_offsets = np.concatenate([[0], np.cumsum(n_models)[:-1]])
+    model_names = [name for t in machine_types for name in machine_models[t]]
+    machine_ids = [
+        f"{model_names[m]}-{s:04}"
+        for m, s in zip((model_offsets[machine_type] + model).tolist(), serial.tolist())
+    ]
+    machine_type_names = [machine_types[t] for t in machine_type.tolist()]
+    ticket_ids = [f"HON-2024-11-{i:03}" for i in range(start, start + size)]
+
+    descriptions = [
+        f"{machine_ids[r]} ({machine_type_names[r]}): "
+        f"{variants.descriptions[n][v]}{NOISE_SENTENCES[s] if n else ''}"
+        for r, (v, n, s) in enumerate(
+            zip(variant.tolist(), noisy.tolist(), noise_sentence.tolist())
+        )
+    ]
+    transcriptions = [
+        f"{OPENERS[o]}{FILLERS[f] if n else ''} {variants.transcriptions[v]}"
+        for v, o, n, f in zip(
+            variant.tolist(), opener.tolist(), noisy.tolist(), filler.tolist()
+        )
+    ]
+
+    return {
+        "ticket_id": ticket_ids,
+        "manufacturing_plant_id": [
+            manufacturing_plants[p]
+            for p in rng.integers(0, len(manufacturing_plants), size).tolist()
+        ],
+        "video_path": [f"/media/repairs/2024/11/{t}_video.mp4" for t in ticket_ids],
+        "audio_path": [f"/media/repairs/2024/11/{t}_audio.wav" for t in ticket_ids],
+        "engineer_id": [
+            engineers[e] for e in rng.integers(0, len(engineers), size).tolist()
+        ],
+        "machine_id": machine_ids,
+        "machine_type": machine_type_names,
+        "downtime": downtime,
+        "repairtime": repairtime,
+        "total_cost": total_cost,
+        "labor_cost": labor_cost,
+        "item_cost": item_cost,
+        "item_bill_id": [f"BILL-{t}" for t in ticket_ids],
+        "replacement_items_list": [""] * size,
+        "description": descriptions,
+        "transcription": transcriptions,
+        "summary_steps": [variants.summaries[v] for v in variant.tolist()],
+        "prev_failed_ticket_id": [None] * size,
+        "next_raised_ticket_id": [None] * size,
+        "created_at": created_at,
+        "updated_at": updated_at,
+    }
+
+
+def generate_repair_jobs(start=1, count=100_000, seed=0, chunk_size=50_000, **rates):
+    """
+    Yield the repair jobs start..start+count-1 chunk by chunk (see generate_chunk).
+    :param rates: failure_rate, deviation_rate, noise_rate and repetition_rate.
+    """
+    variants = _TextVariants(seed)
+    for chunk_index, chunk_start in enumerate(range(start, start + count, chunk_size)):
+        size = min(chunk_size, start + count - chunk_start)
+        yield generate_chunk(chunk_start, size, variants, seed, chunk_index, **rates)
+
+
+def to_copy_text(chunk):
+    """Render a chunk as Postgres COPY text (tab separated, \\N for NULL)."""
+    columns = []
+    for name in COLUMNS:
+        values = chunk[name]
+        if name in INT_COLUMNS:
+            values = map(str, values.tolist())
+        elif name in ("created_at", "updated_at"):
+            values = np.datetime_as_string(values, unit="s").tolist()
+        elif values[0] is None:
+            values = ["\\N"] * len(values)
+        columns.append(values)
+    return "".join("\t".join(row) + "\n" for row in zip(*columns))
+
+
+def write_copy_file(chunks, path):
+    """Write the chunks to a COPY text file, loadable with \\copy RepairJob FROM."""
+    rows = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(to_copy_text(chunk))
+            rows += len(chunk["ticket_id"])
+    return rows
+
+
+def copy_to_database(chunks):
+    """
+    Stream the chunks into the RepairJob table with COPY, in one transaction.
+    Ticket ids must not exist yet (pick --start accordingly).
+    """
+    from db import create_table, with_connection
+
+    create_table()
+
+    @with_connection
+    def copy_rows(conn):
+        rows = 0
+        with conn.cursor() as cur:
+            for chunk in chunks:
+                cur.copy_expert(
+                    f"COPY RepairJob ({', '.join(COLUMNS)}) FROM STDIN",
+                    io.StringIO(to_copy_text(chunk)),
+                )
+                rows += len(chunk["ticket_id"])
+        return rows
+
+    return copy_rows()
+
+
+def write_parquet(chunks, path):
+    """Write the chunks to a Parquet file, one row group per chunk."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Writing Parquet needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema(
+        [
+            (name, pa.int32() if name in INT_COLUMNS else pa.string())
+            for name in COLUMNS
+            if name not in ("created_at", "updated_at")
+        ]
+        + [("created_at", pa.timestamp("s")), ("updated_at", pa.timestamp("s"))]
+    )
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(
+                pa.table(
+                    {
+                        name: pa.array(chunk[name], type=schema.field(name).type)
+                        for name in schema.names
+                    },
+                    schema=schema,
+                )
+            )
+            rows += len(chunk["ticket_id"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic repair jobs without the LLM"
+    )
+    parser.add_argument(
+        "--start", type=int, default=1, help="Number of the first ticket"
+    )
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--failure-rate", type=float, default=0.25)
+    parser.add_argument("--deviation-rate", type=float, default=0.2)
+    parser.add_argument("--noise-rate", type=float, default=0.1)
+    parser.add_argument("--repetition-rate", type=float, default=0.05)
+    parser.add_argument(
+        "--sink",
+        choices=["copy", "copy-file", "parquet", "shards"],
+        default="copy",
+        help="copy: into the database (PG_* variables); copy-file/parquet: into "
+        "--output; shards: into the dataset directory --output (see dataset_shards.py)",
+    )
+    parser.add_argument(
+        "--shard-format",
+        choices=["jsonl.gz", "parquet"],
+        default="jsonl.gz",
+        help="parquet needs pyarrow",
+    )
+    parser.add_argument(
+        "--output",
+        help="Output file, or dataset directory for --sink shards "
+        "(default: repair_jobs.tsv / repair_jobs.parquet / repair_jobs_dataset)",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="With --sink shards, add shards to an existing dataset directory",
+    )
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = {
+            "parquet": "repair_jobs.parquet",
+            "shards": "repair_jobs_dataset",
+        }.get(args.sink, "repair_jobs.tsv")
+
+    chunks = generate_repair_jobs(
+        args.start,
+        args.count,
+        args.seed,
+        args.chunk_size,
+        failure_rate=args.failure_rate,
+        deviation_rate=args.deviation_rate,
+        noise_rate=args.noise_rate,
+        repetition_rate=args.repetition_rate,
+    )
+    started_at = time.perf_counter()
+    if args.sink == "copy":
+        rows = copy_to_database(chunks)
+    elif args.sink == "copy-file":
+        rows = write_copy_file(chunks, args.output)
+    elif args.sink == "parquet":
+        rows = write_parquet(chunks, args.output)
+    else:
+        from dataset_shards import ShardWriter
+
+        try:
+            shards = ShardWriter(
+                args.output,
+                args.shard_format,
+                {
+                    "generator": "offline",
+                    **{
+                        k: v
+                        for k, v in vars(args).items()
+                        if k not in ("sink", "shard_format", "output", "append")
+                    },
+                },
+                append=args.append,
+            )
+        except ValueError as e:
+            parser.error(f"{e} (--append adds shards to an existing dataset)")
+        rows = sum(shards.write_shard(chunk)["rows"] for chunk in chunks)
+    seconds = time.perf_counter() - started_at
+    print(
+        f"[{datetime.now():%H:%M:%S}] {rows} repair jobs written to {args.sink} "
+        f"in {seconds:.1f}s ({rows / seconds:,.0f} jobs/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+-----------------------------------------------------------------------
+File: services/out_of_core.py
+Creation Time: Oct 19th 2026, 1:21 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Out-of-core clustering for machine types whose embeddings don't fit in memory.
+
+Phase 1 brings the machine type's embedding snapshot up to date (see
+embedding_snapshots.py), a memory-mapped float32 matrix with an embedding id
+sidecar. Phase 2 splits the snapshot into coarse partitions
+with streaming spherical k-means, runs `cluster_with_hdbscan` inside every
+partition, and merges clusters of neighbouring partitions whose centroids nearly
+coincide. Resident memory stays within the budget: partitions are sized so their
+distance matrix fits, and everything else is read in chunks from the snapshot.
+"""
+
+import os
+import re
+from collections import Counter
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy.sparse import csr_matrix
+from clustering import (
+    cluster_with_hdbscan,
+    estimate_clustering_memory,
+    update_hdbscan_clusters,
+)
+from embedding_snapshots import EmbeddingSnapshotStore
+from representatives import partition_members
+
+OUT_OF_CORE_DIR = os.environ.get("CLUSTERING_OUT_OF_CORE_DIR", "clustering_snapshots")
+# Clusters of different partitions are merged when their centroids are this similar
+MERGE_SIMILARITY = float(os.environ.get("CLUSTERING_MERGE_SIMILARITY", 0.95))
+# Share of every partition's clustering taken up by context points (see cluster_snapshot)
+CONTEXT_SHARE = 0.2
+# Clusters whose context points have at least this Jaccard similarity are merged
+MIN_CONTEXT_JACCARD = 0.5
+# Bytes per point kept in memory for the whole run (partition, order, labels, ...)
+_BYTES_PER_POINT = 32
+
+
+def result_paths(machine_type, directory=OUT_OF_CORE_DIR):
+    """
+    File names of a machine type's out-of-core clustering results.
+    """
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", machine_type or "all")
+    base = os.path.join(directory, name)
+    return {
+        "labels": f"{base}.labels.npy",
+        "probabilities": f"{base}.probabilities.npy",
+    }
+
+
+def max_partition_size(memory_budget_bytes, dim):
+    """
+    Largest number of points whose in-memory clustering fits in the budget.
+    """
+    low, high = 1, 1
+    while estimate_clustering_memory(high * 2, dim) <= memory_budget_bytes:
+        high *= 2
+    high *= 2
+    while low < high - 1:
+        middle = (low + high) // 2
+        if estimate_clustering_memory(middle, dim) <= memory_budget_bytes:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def _normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def coarse_partition(vectors, n_partitions, chunk_rows, n_iter=3, seed=0):
+    """
+    Assign every vector to one of `n_partitions` coarse partitions.
+    Spherical k-means whose passes stream over the (memory-mapped) vectors in
+    chunks of `chunk_rows`, so only the centers and one chunk are in memory.
+    :return: int32 array of partition ids.
+    """
+    n = len(vectors)
+    rng = np.random.default_rng(seed)
+    centers = _normalized(vectors[np.sort(rng.choice(n, n_partitions, replace=False))])
+
+    partitions = np.empty(n, dtype=np.int32)
+    for iteration in range(n_iter + 1):
+        sums = np.zeros_like(centers)
+        for start in range(0, n, chunk_rows):
+            chunk = _normalized(vectors[start : start + chunk_rows])
+            assignment = (chunk @ centers.T).argmax(axis=1)
+            partitions[start : start + len(chunk)] = assignment
+            if iteration < n_iter:
+                one_hot = csr_matrix(
+                    (
+                        np.ones(len(chunk), dtype=np.float32),
+                        (assignment, np.arange(len(chunk))),
+                    ),
+                    shape=(n_partitions, len(chunk)),
+                )
+                sums += one_hot @ chunk
+        if iteration < n_iter:
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0  # empty partitions keep their previous center
+            centers[filled] = sums[filled] / norms[filled, None]
+    return partitions
+
+
+def _merge_clusters(
+    centroids, cluster_partitions, cluster_context, threshold, block_bytes
+):
+    """
+    Union clusters of different partitions that are the same cluster: clusters
+    that share most of their context points, or whose centroids are at least
+    `threshold` similar.
+    :return: Array mapping every local cluster to its merged cluster id (0..k-1).
+    """
+    n_clusters = len(centroids)
+    parent = np.arange(n_clusters)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters_by_context_point = {}
+    for i, context_points in enumerate(cluster_context):
+        for point in context_points.tolist():
+            clusters_by_context_point.setdefault(point, []).append(i)
+    shared = Counter(
+        (i, j)
+        for clusters in clusters_by_context_point.values()
+        for i in clusters
+        for j in clusters
+        if i < j
+    )
+    for (i, j), overlap in shared.items():
+        union_size = len(cluster_context[i]) + len(cluster_context[j]) - overlap
+        if overlap >= 2 and overlap >= MIN_CONTEXT_JACCARD * union_size:
+            union(i, j)
+
+    block_rows = max(1, block_bytes // max(1, 4 * n_clusters))
+    for start in range(0, n_clusters, block_rows):
+        similarities = centroids[start : start + block_rows] @ centroids.T
+        rows, columns = np.nonzero(similarities >= threshold)
+        rows += start
+        for i, j in zip(rows.tolist(), columns.tolist()):
+            if j > i and cluster_partitions[i] != cluster_partitions[j]:
+                union(i, j)
+
+    roots = np.array([find(i) for i in range(n_clusters)], dtype=np.int64)
+    return np.unique(roots, return_inverse=True)[1]
+
+
+def cluster_snapshot(
+    vectors,
+    paths,
+    memory_budget_bytes,
+    min_cluster_size=2,
+    min_samples=1,
+    merge_similarity=MERGE_SIMILARITY,
+):
+    """
+    Cluster a memory-mapped snapshot within a memory budget.
+
+    1. Coarse partitions are sized so `estimate_clustering_memory` of each one fits
+       in the budget (aiming at half of that, since k-means partitions are uneven).
+    2. HDBSCAN runs inside each partition; partitions that still came out too large
+       are split further with `partition_members`. A partition that holds a slice
+       of a single large cluster has no density contrast, and HDBSCAN would call
+       most of it noise, so every partition is clustered together with a fixed
+       random sample of the whole snapshot (the context points).
+    3. A cluster cut in two by a partition boundary shows up as two clusters that
+       contain the same context points, or have almost the same centroid. Such
+       clusters are merged; clusters still smaller than `min_cluster_size` after
+       merging become noise.
+
+    Labels and membership probabilities are written to memory-mapped .npy files
+    (`paths["labels"]`, `paths["probabilities"]`).
+
+    :param vectors: Memory-mapped (n, dim) float32 embeddings.
+    :param paths: Result files, see `result_paths`.
+    :param memory_budget_bytes: Memory budget for the whole run.
+    :param min_cluster_size: Minimum size of clusters.
+    :param min_samples: Minimum samples for a point to be considered core.
+    :param merge_similarity: Centroid cosine similarity at which clusters are merged.
+    :return: Number of clusters.
+    """
+    n, dim = vectors.shape
+    os.makedirs(os.path.dirname(paths["labels"]) or ".", exist_ok=True)
+
+    available = memory_budget_bytes - _BYTES_PER_POINT * n
+    partition_size = max_partition_size(available, dim) if available > 0 else 0
+    n_context = min(n, int(CONTEXT_SHARE * partition_size))
+    partition_size -= n_context
+    if partition_size < 2 * min_cluster_size:
+        raise MemoryError(
+            f"A {memory_budget_bytes / 1024**2:.0f} MB budget is too small to cluster "
+            f"{n} points out of core"
+        )
+    chunk_rows = max(1, min(n, available // (4 * dim * 4)))
+
+    n_partitions = min(n, -(-2 * n // partition_size))
+    partitions = (
+        coarse_partition(vectors, n_partitions, chunk_rows)
+        if n_partitions > 1
+        else np.zeros(n, dtype=np.int32)
+    )
+    order = np.argsort(partitions, kind="stable")
+    bounds = np.concatenate(
+        [[0], np.cumsum(np.bincount(partitions, minlength=n_partitions))]
+    )
+    del partitions
+
+    # Local cluster of every point (-1 for noise), and per local cluster its
+    # probability-weighted centroid, the partition it came from and its context points
+    local_labels = np.full(n, -1, dtype=np.int32)
+    probabilities = open_memmap(
+        paths["probabilities"], mode="w+", dtype=np.float32, shape=(n,)
+    )
+    centroids, cluster_partitions, cluster_context = [], [], []
+    context = np.sort(np.random.default_rng(0).choice(n, n_context, replace=False))
+    context_vectors = _normalized(vectors[context])
+
+    part_id = 0
+    for p in range(n_partitions):
+        members = order[bounds[p] : bounds[p + 1]]
+        if len(members) < min_cluster_size:
+            continue
+        members = np.sort(members)  # sequential reads from the memory map
+        partition_vectors = _normalized(vectors[members])
+        if len(members) > partition_size:
+            groups = partition_members(partition_vectors, partition_size)
+        else:
+            groups = [np.arange(len(members))]
+
+        for group in groups:
+            group_members = members[group]
+            outside = ~np.isin(context, group_members)
+            all_labels, group_probabilities, _ = cluster_with_hdbscan(
+                np.vstack([partition_vectors[group], context_vectors[outside]]),
+                min_cluster_size,
+                min_samples,
+            )
+            if all_labels is None:
+                raise RuntimeError(f"HDBSCAN failed on partition {p}")
+            labels, context_labels = all_labels[: len(group)], all_labels[len(group) :]
+            context_indices = np.flatnonzero(outside)
+            group_probabilities = group_probabilities[: len(group)]
+            probabilities[group_members] = group_probabilities
+            for label in np.unique(labels[labels != -1]):
+                in_cluster = labels == label
+                centroid = (
+                    group_probabilities[in_cluster, None] + 1e-6
+                ) * partition_vectors[group][in_cluster]
+                centroid = centroid.sum(axis=0)
+                centroids.append(centroid / max(np.linalg.norm(centroid), 1e-12))
+                cluster_partitions.append(part_id)
+                cluster_context.append(context_indices[context_labels == label])
+                local_labels[group_members[in_cluster]] = len(centroids) - 1
+            part_id += 1
+        print(
+            f"Partition {p + 1}/{n_partitions}: {len(members)} points, {len(centroids)} clusters so far"
+        )
+
+    labels = open_memmap(paths["labels"], mode="w+", dtype=np.int32, shape=(n,))
+    if not centroids:
+        labels[:] = -1
+        labels.flush()
+        probabilities.flush()
+        return 0
+
+    merged = _merge_clusters(
+        np.stack(centroids).astype(np.float32),
+        np.array(cluster_partitions),
+        cluster_context,
+        merge_similarity,
+        block_bytes=chunk_rows * dim * 4,
+    )
+    sizes = np.bincount(merged[local_labels[local_labels != -1]])
+    kept = sizes >= min_cluster_size
+    # Renumber the kept clusters 0..k-1 and send the rest to noise
+    merged = np.where(kept, np.cumsum(kept) - 1, -1)[merged]
+    for start in range(0, n, chunk_rows):
+        chunk = local_labels[start : start + chunk_rows]
+        chunk_labels = np.where(chunk == -1, -1, merged[chunk])
+        labels[start : start + len(chunk)] = chunk_labels
+        probabilities[start : start + len(chunk)][chunk_labels == -1] = 0
+    labels.flush()
+    probabilities.flush()
+    return int(kept.sum())
+
+
+def cluster_machine_type_out_of_core(
+    machine_type,
+    memory_budget_bytes,
+    min_cluster_size=2,
+    min_samples=1,
+    directory=OUT_OF_CORE_DIR,
+    update_batch_size=10000,
+):
+    """
+    Out-of-core counterpart of `clustering.cluster_machine_type`:
+    snapshot -> partitioned HDBSCAN -> update, within `memory_budget_bytes`.
+    The results stay on disk; the returned dictionary carries their paths, and
+    `open_out_of_core_result` memory-maps them for the summarization stage.
+    :return: Dictionary with the result paths, snapshot version, number of points and clusters.
+    """
+    snapshot = EmbeddingSnapshotStore().load(machine_type)
+    n_points = len(snapshot.embedding_ids)
+    if n_points == 0:
+        raise RuntimeError(f"No embeddings to cluster for '{machine_type}'")
+
+    paths = result_paths(machine_type, directory)
+    n_clusters = cluster_snapshot(
+        snapshot.embeddings, paths, memory_budget_bytes, min_cluster_size, min_samples
+    )
+
+    labels = np.load(paths["labels"], mmap_mode="r")
+    for start in range(0, n_points, update_batch_size):
+        update_hdbscan_clusters(
+            labels[start : start + update_batch_size],
+            snapshot.embedding_ids[start : start + update_batch_size].tolist(),
+        )
+
+    return {
+        "paths": paths,
+        "snapshot_version": snapshot.version,
+        "n_points": n_points,
+        "n_clusters": n_clusters,
+    }
+
+
+def open_out_of_core_result(paths):
+    """
+    Memory-map the cluster labels and probabilities written by
+    `cluster_machine_type_out_of_core`.
+    """
+    return {
+        "cluster_labels": np.load(paths["labels"], mmap_mode="r"),
+        "probabilities": np.load(paths["probabilities"], mmap_mode="r"),
+    }
@@ -0,0 +1,132 @@
+"""
+-----------------------------------------------------------------------
+File: services/rate_limiter.py
+Creation Time: Oct 19th 2026, 1:07 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+"""
+
+import asyncio
+import random
+import time
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for rate limiting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """
+    Token bucket for asyncio code.
+    Holds up to `capacity` tokens and refills continuously at `refill_per_second`.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.refill_per_second,
+        )
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1):
+        """
+        Wait until `amount` tokens are available and take them.
+        Requests larger than the bucket are clamped to its capacity so they can't block forever.
+        """
+        amount = min(amount, self.capacity)
+        # The lock keeps waiters in FIFO order, so a large request isn't starved by small ones
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_second)
+
+
+class AsyncRateLimiter:
+    """
+    Limits requests per minute and tokens per minute, e.g. for an LLM API quota.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int):
+        """Wait for one request slot and `tokens` tokens."""
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+def _is_retryable(error):
+    """Rate limits, server errors and connection problems are worth retrying."""
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after_seconds(error):
+    """Server-suggested delay from the Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def create_chat_completion_with_retries(
+    client,
+    messages,
+    rate_limiter,
+    model,
+    max_retries=5,
+    base_delay=1.0,
+    max_delay=60.0,
+    **request_options,
+):
+    """
+    Call the chat completions endpoint under a rate limiter, retrying
+    429/5xx and connection errors with exponential backoff and jitter.
+    :param client: Async OpenAI-compatible client (llm_client.get_async_client),
+        best created with max_retries=0 so only this function retries.
+    :param messages: Chat messages to send.
+    :param rate_limiter: AsyncRateLimiter shared by all concurrent requests.
+    :param model: Model name.
+    :param max_retries: Number of retries after the first attempt.
+    :param base_delay: Backoff delay (seconds) of the first retry; doubles every retry.
+    :param max_delay: Upper bound for a single backoff delay.
+    :param request_options: Extra arguments of the request, e.g. response_format.
+    :return: The chat completion response.
+    """
+    tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    for attempt in range(max_retries + 1):
+        await rate_limiter.acquire(tokens)
+        try:
+            return await client.chat.completions.create(
+                model=model, n=1, messages=messages, **request_options
+            )
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after_seconds(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2**attempt) * random.uniform(0.5, 1)
+            print(f"LLM request failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,175 @@
+"""
+-----------------------------------------------------------------------
+File: services/repair_job_catalog.py
+Creation Time: Oct 19th 2026, 1:32 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Sample plants, engineers, machines and repair jobs the synthetic repair job
+generators draw from.
+"""
+
+# List of sample data
+manufacturing_plants = ["PHX01", "TOR01", "BLR01", "PRG01"]
+engineers = [
+    "ENG-JD-1234",
+    "ENG-MA-5678",
+    "ENG-KS-9012",
+    "ENG-RT-3456",
+    "ENG-LW-2345",
+    "ENG-TM-7890",
+    "ENG-PG-4567",
+    "ENG-SK-3451",
+    "ENG-AB-5673",
+    "ENG-ML-2234",
+    "ENG-CW-6789",
+    "ENG-NV-4321",
+    "ENG-BP-1290",
+    "ENG-RS-3459",
+    "ENG-DC-8765",
+    "ENG-TP-5467",
+    "ENG-AG-2348",
+    "ENG-FK-0987",
+    "ENG-MN-4563",
+    "ENG-VR-7643",
+]
+machine_types = [
+    "Auxiliary Power Units (APUs)",
+    "Turbofan Engines",
+    "Environmental Control Systems",
+    "Avionics Systems",
+    "Landing Systems",
+]
+
+# Machine Models
+machine_models = {
+    "Auxiliary Power Units (APUs)": [
+        "131-9A (Airbus A320 family)",
+        "331-350C (Boeing 777)",
+        "36-150 (Helicopters)",
+    ],
+    "Turbofan Engines": [
+        "HTF7000 (Business jets)",
+        "TFE731 (Business jets)",
+        "ALF502/LF507 (Regional airliners)",
+    ],
+    "Environmental Control Systems": [
+        "Cabin Pressure Control Systems",
+        "Air Conditioning Packs",
+        "Bleed Air Systems",
+    ],
+    "Avionics Systems": [
+        "Primus Epic integrated avionics system",
+        "IntuVue RDR-4000 weather radar",
+        "LASEREF VI Inertial Reference System",
+    ],
+    "Landing Systems": [
+        "Electric Braking Systems",
+        "Wheels and Brakes",
+        "Tire Pressure Monitoring Systems",
+    ],
+}
+repair_jobs = [
+    "Fuel pump failure causing startup issues",
+    "Oil filter clog leading to overheating",
+    "Sensor module malfunction causing erroneous readings",
+    "Compressor blade wear causing vibration",
+    "Avionics system software update failure",
+    "APU not starting due to electrical issue",
+    "Engine overheating under load",
+    "Landing gear retraction failure",
+    "Weather radar displaying incorrect data",
+    "Cabin pressure control system failure",
+]
+
+standard_repair_steps = {
+    "Fuel pump failure causing startup issues": [
+        "Inspect fuel pump for visible damage.",
+        "Clean and recalibrate fuel pump connections.",
+        "Replace faulty fuel pump with a new unit.",
+        "Inspect and clean fuel lines for debris.",
+        "Conduct system test to verify fuel pump performance.",
+    ],
+    "Oil filter clog leading to overheating": [
+        "Drain and inspect engine oil for contaminants.",
+        "Replace clogged oil filter with a new filter.",
+        "Flush the oil system to remove residue.",
+        "Inspect and clean oil lines for blockages.",
+        "Refill engine with recommended oil.",
+        "Test engine operation under load to ensure proper cooling.",
+    ],
+    "Sensor module malfunction causing erroneous readings": [
+        "Disconnect and inspect the faulty sensor module.",
+        "Check wiring connections for wear or loose fittings.",
+        "Clean sensor module contact points.",
+        "Replace faulty sensor module with a new one.",
+        "Calibrate the new sensor module.",
+        "Verify accuracy of the sensor readings through diagnostic tests.",
+        "Document calibration results for records.",
+    ],
+    "Compressor blade wear causing vibration": [
+        "Inspect compressor blades for visible wear or damage.",
+        "Remove worn or damaged compressor blades.",
+        "Install replacement blades according to manufacturer specifications.",
+        "Balance the compressor assembly to minimize vibration.",
+        "Perform alignment tests on the engine components.",
+        "Test engine operation at various speeds to verify performance.",
+        "Record vibration test results for future reference.",
+    ],
+    "Avionics system software update failure": [
+        "Perform diagnostic tests to identify the software issue.",
+        "Back up the current avionics system configuration.",
+        "Reset the avionics system to factory settings.",
+        "Reinstall the latest software version.",
+        "Verify software installation through system checks.",
+        "Conduct functional tests for critical avionics features.",
+        "Document software update results and any anomalies.",
+    ],
+    "APU not starting due to electrical issue": [
+        "Inspect APU electrical connections for wear or damage.",
+        "Test the APU starter motor for proper functionality.",
+        "Check the APU battery voltage and replace if necessary.",
+        "Repair or replace faulty electrical wiring.",
+        "Inspect and clean APU control relays.",
+        "Test APU operation under no-load conditions.",
+        "Verify proper startup sequence and load-bearing capability.",
+    ],
+    "Engine overheating under load": [
+        "Inspect the cooling system for blockages.",
+        "Check engine oil levels and quality.",
+        "Replace worn-out coolant pump or hoses.",
+        "Test the radiator for leaks or blockages.",
+        "Inspect and clean air intake filters.",
+        "Perform an engine heat test under load conditions.",
+        "Replace or repair any failed components.",
+    ],
+    "Landing gear retraction failure": [
+        "Inspect landing gear hydraulic lines for leaks.",
+        "Test landing gear actuators for proper operation.",
+        "Replace hydraulic fluid and bleed the system.",
+        "Check and repair landing gear sensors.",
+        "Inspect landing gear mechanical linkages for wear.",
+        "Test landing gear retraction and extension cycles.",
+        "Verify system performance through multiple cycles.",
+    ],
+    "Weather radar displaying incorrect data": [
+        "Inspect radar antenna for physical damage.",
+        "Test radar signal connections and wiring.",
+        "Update radar software to the latest version.",
+        "Replace faulty radar modules as needed.",
+        "Calibrate radar signal strength and accuracy.",
+        "Perform flight tests to validate radar data.",
+        "Document radar performance results and system status.",
+    ],
+    "Cabin pressure control system failure": [
+        "Inspect cabin pressure control valves for wear.",
+        "Check and replace faulty sensors in the pressure control system.",
+        "Test pneumatic lines for leaks or blockages.",
+        "Replace or repair damaged pressure regulators.",
+        "Calibrate the pressure control system.",
+        "Conduct a pressure test under simulated flight conditions.",
+        "Document system performance and calibration data.",
+    ],
+}
@@ -0,0 +1,142 @@
+"""
+-----------------------------------------------------------------------
+File: services/representatives.py
+Creation Time: Oct 19th 2026, 1:08 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+"""
+
+import os
+import numpy as np
+from rate_limiter import estimate_tokens
+
+# Defaults for how much of a cluster goes into its FAQ prompt
+MAX_REPRESENTATIVES = int(os.environ.get("FAQ_MAX_REPRESENTATIVES", 25))
+REPRESENTATIVE_TOKEN_BUDGET = int(os.environ.get("FAQ_REPRESENTATIVE_TOKEN_BUDGET", 2000))
+
+
+def select_representatives(
+    texts,
+    embeddings,
+    probabilities=None,
+    k=MAX_REPRESENTATIVES,
+    token_budget=REPRESENTATIVE_TOKEN_BUDGET,
+    diversity=0.3,
+):
+    """
+    Pick up to `k` representative texts of a cluster within a token budget.
+
+    The first pick is the member closest to the cluster's centroid (weighted by
+    HDBSCAN membership probabilities), i.e. an approximate medoid. Further picks
+    use maximal marginal relevance: close to the centroid, but far from what was
+    already picked, so repeated sentences don't crowd out the rest of the cluster.
+
+    :param texts: Texts of the cluster members.
+    :param embeddings: Numpy array (n, dim) of the members' embeddings.
+    :param probabilities: HDBSCAN membership probabilities of the members (optional).
+    :param k: Maximum number of representatives.
+    :param token_budget: Maximum estimated tokens of all representatives together.
+    :param diversity: Weight of the dissimilarity term (0 = only centrality).
+    :return: List of (text, coverage) in pick order, where coverage is the number of
+        members whose nearest representative is that text. If no member fits the
+        budget, the medoid alone, truncated to the budget.
+    """
+    n = len(texts)
+    if n == 0 or k < 1:
+        return []
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    weights = (
+        np.ones(n, dtype=np.float32)
+        if probabilities is None
+        else np.asarray(probabilities, dtype=np.float32) + 1e-6
+    )
+
+    centroid = (weights[:, None] * vectors).sum(axis=0)
+    centroid /= max(np.linalg.norm(centroid), 1e-12)
+    relevance = (vectors @ centroid) * weights
+
+    token_counts = np.array([estimate_tokens(text) for text in texts])
+    available = token_counts <= token_budget
+
+    # Identical sentences are common; only let the first copy compete
+    seen = set()
+    for i, text in enumerate(texts):
+        if text in seen:
+            available[i] = False
+        seen.add(text)
+
+    selected = []
+    max_similarity = np.full(n, -1.0, dtype=np.float32)
+    remaining_budget = token_budget
+    while len(selected) < k and available.any():
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[~available] = -np.inf
+        best = int(scores.argmax())
+
+        selected.append(best)
+        remaining_budget -= token_counts[best]
+        available[best] = False
+        available &= token_counts <= remaining_budget
+        max_similarity = np.maximum(max_similarity, vectors @ vectors[best])
+
+    if not selected:
+        # Every member is longer than the budget: cut the medoid down to it
+        medoid = int(relevance.argmax())
+        return [(texts[medoid][: max(1, token_budget) * 4], n)]
+
+    nearest = (vectors @ vectors[selected].T).argmax(axis=1)
+    coverage = np.bincount(nearest, minlength=len(selected))
+    return [(texts[i], int(count)) for i, count in zip(selected, coverage)]
+
+
+def format_representatives(representatives):
+    """
+    Render representatives for the FAQ prompt, marking how many members each one stands for.
+    """
+    return [
+        f"{text} (x{coverage})" if coverage > 1 else text
+        for text, coverage in representatives
+    ]
+
+
+def partition_members(embeddings, group_size, n_iter=5):
+    """
+    Split a cluster into sub-groups of similar members with about `group_size` members each.
+    Uses a few rounds of spherical k-means seeded with farthest-point picks; it only
+    has to be good enough that rare sub-topics end up together in some sub-group.
+    :param embeddings: Numpy array (n, dim) of the members' embeddings.
+    :param group_size: Target number of members per sub-group.
+    :param n_iter: Number of k-means refinement rounds.
+    :return: List of index arrays into `embeddings`, one per non-empty sub-group.
+    """
+    n = len(embeddings)
+    n_groups = -(-n // group_size)
+    if n_groups <= 1:
+        return [np.arange(n)]
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    centroid = vectors.mean(axis=0)
+    seeds = [int((vectors @ centroid).argmax())]
+    max_similarity = vectors @ vectors[seeds[0]]
+    for _ in range(n_groups - 1):
+        seeds.append(int(max_similarity.argmin()))
+        max_similarity = np.maximum(max_similarity, vectors @ vectors[seeds[-1]])
+
+    centers = vectors[seeds]
+    for _ in range(n_iter):
+        assignment = (vectors @ centers.T).argmax(axis=1)
+        for g in range(n_groups):
+            in_group = assignment == g
+            if in_group.any():
+                center = vectors[in_group].sum(axis=0)
+                centers[g] = center / max(np.linalg.norm(center), 1e-12)
+    assignment = (vectors @ centers.T).argmax(axis=1)
+
+    groups = [np.flatnonzero(assignment == g) for g in range(n_groups)]
+    return [group for group in groups if len(group)]
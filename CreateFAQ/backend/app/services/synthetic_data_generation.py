@@ -8,13 +8,30 @@ Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com
 -----------------------------------------------------------------------
 """
 
+import argparse
+import asyncio
 import os
 import random
 import logging
 from datetime import datetime, timedelta
 import time
-from db import create_table, create_repair_job, RepairJob, with_connection
-from openai import OpenAI
+from db import (
+    create_table,
+    create_repair_job,
+    create_repair_jobs,
+    RepairJob,
+    with_connection,
+)
+from llm_cache import LLMResponseCache
+from repair_job_catalog import (
+    engineers,
+    machine_models,
+    machine_types,
+    manufacturing_plants,
+    repair_jobs,
+    standard_repair_steps,
+)
+from llm_client import get_async_client, get_client
 import json
 
 # Initialize logging
@@ -24,205 +41,43 @@ logging.basicConfig(level=logging.INFO)
 if "GEMINI_API_KEY" not in os.environ:
     raise EnvironmentError("GEMINI_API_KEY not found in environment variables.")
 
-client = OpenAI(
-    api_key=os.environ["GEMINI_API_KEY"],
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
-
-# List of sample data
-manufacturing_plants = ["PHX01", "TOR01", "BLR01", "PRG01"]
-engineers = [
-    "ENG-JD-1234",
-    "ENG-MA-5678",
-    "ENG-KS-9012",
-    "ENG-RT-3456",
-    "ENG-LW-2345",
-    "ENG-TM-7890",
-    "ENG-PG-4567",
-    "ENG-SK-3451",
-    "ENG-AB-5673",
-    "ENG-ML-2234",
-    "ENG-CW-6789",
-    "ENG-NV-4321",
-    "ENG-BP-1290",
-    "ENG-RS-3459",
-    "ENG-DC-8765",
-    "ENG-TP-5467",
-    "ENG-AG-2348",
-    "ENG-FK-0987",
-    "ENG-MN-4563",
-    "ENG-VR-7643",
-]
-machine_types = [
-    "Auxiliary Power Units (APUs)",
-    "Turbofan Engines",
-    "Environmental Control Systems",
-    "Avionics Systems",
-    "Landing Systems",
-]
-
-# Machine Models
-machine_models = {
-    "Auxiliary Power Units (APUs)": [
-        "131-9A (Airbus A320 family)",
-        "331-350C (Boeing 777)",
-        "36-150 (Helicopters)",
-    ],
-    "Turbofan Engines": [
-        "HTF7000 (Business jets)",
-        "TFE731 (Business jets)",
-        "ALF502/LF507 (Regional airliners)",
-    ],
-    "Environmental Control Systems": [
-        "Cabin Pressure Control Systems",
-        "Air Conditioning Packs",
-        "Bleed Air Systems",
-    ],
-    "Avionics Systems": [
-        "Primus Epic integrated avionics system",
-        "IntuVue RDR-4000 weather radar",
-        "LASEREF VI Inertial Reference System",
-    ],
-    "Landing Systems": [
-        "Electric Braking Systems",
-        "Wheels and Brakes",
-        "Tire Pressure Monitoring Systems",
-    ],
-}
-repair_jobs = [
-    "Fuel pump failure causing startup issues",
-    "Oil filter clog leading to overheating",
-    "Sensor module malfunction causing erroneous readings",
-    "Compressor blade wear causing vibration",
-    "Avionics system software update failure",
-    "APU not starting due to electrical issue",
-    "Engine overheating under load",
-    "Landing gear retraction failure",
-    "Weather radar displaying incorrect data",
-    "Cabin pressure control system failure",
-]
-
-standard_repair_steps = {
-    "Fuel pump failure causing startup issues": [
-        "Inspect fuel pump for visible damage.",
-        "Clean and recalibrate fuel pump connections.",
-        "Replace faulty fuel pump with a new unit.",
-        "Inspect and clean fuel lines for debris.",
-        "Conduct system test to verify fuel pump performance.",
-    ],
-    "Oil filter clog leading to overheating": [
-        "Drain and inspect engine oil for contaminants.",
-        "Replace clogged oil filter with a new filter.",
-        "Flush the oil system to remove residue.",
-        "Inspect and clean oil lines for blockages.",
-        "Refill engine with recommended oil.",
-        "Test engine operation under load to ensure proper cooling.",
-    ],
-    "Sensor module malfunction causing erroneous readings": [
-        "Disconnect and inspect the faulty sensor module.",
-        "Check wiring connections for wear or loose fittings.",
-        "Clean sensor module contact points.",
-        "Replace faulty sensor module with a new one.",
-        "Calibrate the new sensor module.",
-        "Verify accuracy of the sensor readings through diagnostic tests.",
-        "Document calibration results for records.",
-    ],
-    "Compressor blade wear causing vibration": [
-        "Inspect compressor blades for visible wear or damage.",
-        "Remove worn or damaged compressor blades.",
-        "Install replacement blades according to manufacturer specifications.",
-        "Balance the compressor assembly to minimize vibration.",
-        "Perform alignment tests on the engine components.",
-        "Test engine operation at various speeds to verify performance.",
-        "Record vibration test results for future reference.",
-    ],
-    "Avionics system software update failure": [
-        "Perform diagnostic tests to identify the software issue.",
-        "Back up the current avionics system configuration.",
-        "Reset the avionics system to factory settings.",
-        "Reinstall the latest software version.",
-        "Verify software installation through system checks.",
-        "Conduct functional tests for critical avionics features.",
-        "Document software update results and any anomalies.",
-    ],
-    "APU not starting due to electrical issue": [
-        "Inspect APU electrical connections for wear or damage.",
-        "Test the APU starter motor for proper functionality.",
-        "Check the APU battery voltage and replace if necessary.",
-        "Repair or replace faulty electrical wiring.",
-        "Inspect and clean APU control relays.",
-        "Test APU operation under no-load conditions.",
-        "Verify proper startup sequence and load-bearing capability.",
-    ],
-    "Engine overheating under load": [
-        "Inspect the cooling system for blockages.",
-        "Check engine oil levels and quality.",
-        "Replace worn-out coolant pump or hoses.",
-        "Test the radiator for leaks or blockages.",
-        "Inspect and clean air intake filters.",
-        "Perform an engine heat test under load conditions.",
-        "Replace or repair any failed components.",
-    ],
-    "Landing gear retraction failure": [
-        "Inspect landing gear hydraulic lines for leaks.",
-        "Test landing gear actuators for proper operation.",
-        "Replace hydraulic fluid and bleed the system.",
-        "Check and repair landing gear sensors.",
-        "Inspect landing gear mechanical linkages for wear.",
-        "Test landing gear retraction and extension cycles.",
-        "Verify system performance through multiple cycles.",
-    ],
-    "Weather radar displaying incorrect data": [
-        "Inspect radar antenna for physical damage.",
-        "Test radar signal connections and wiring.",
-        "Update radar software to the latest version.",
-        "Replace faulty radar modules as needed.",
-        "Calibrate radar signal strength and accuracy.",
-        "Perform flight tests to validate radar data.",
-        "Document radar performance results and system status.",
-    ],
-    "Cabin pressure control system failure": [
-        "Inspect cabin pressure control valves for wear.",
-        "Check and replace faulty sensors in the pressure control system.",
-        "Test pneumatic lines for leaks or blockages.",
-        "Replace or repair damaged pressure regulators.",
-        "Calibrate the pressure control system.",
-        "Conduct a pressure test under simulated flight conditions.",
-        "Document system performance and calibration data.",
-    ],
-}
+client = get_client("gemini")
+# create_chat_completion_with_retries does the retrying of the async client
+async_client = get_async_client("gemini", max_retries=0)
+LLM_MODEL = "gemini-1.5-flash"
+# Bump whenever the prompt in generate_text_fields_with_gemini changes
+REPAIR_DOC_PROMPT_VERSION = "repair-doc-v1"
+llm_cache = LLMResponseCache()
 
 
 # Helper function to generate random timestamps
-def random_timestamp(start_date, end_date):
+def random_timestamp(start_date, end_date, rng=random):
     delta = end_date - start_date
-    random_days = random.randint(0, delta.days)
+    random_days = rng.randint(0, delta.days)
     return start_date + timedelta(
-        days=random_days, hours=random.randint(0, 23), minutes=random.randint(0, 59)
+        days=random_days, hours=rng.randint(0, 23), minutes=rng.randint(0, 59)
     )
 
 
 # Generate synthetic repair job instance
-def generate_repair_job_instance(ticket_id, job_type):
-    machine_type = random.choice(machine_types)
-    plant = random.choice(manufacturing_plants)
+def generate_repair_job_instance(ticket_id, job_type, rng=random):
+    machine_type = rng.choice(machine_types)
+    plant = rng.choice(manufacturing_plants)
     video_path = f"/media/repairs/2024/11/{ticket_id}_video.mp4"
     audio_path = f"/media/repairs/2024/11/{ticket_id}_audio.wav"
-    engineer = random.choice(engineers)
-    machine_id = (
-        f"{random.choice(machine_models[machine_type])}-{random.randint(1, 1000):04}"
-    )
-    downtime = random.randint(24, 72)
-    repairtime = random.randint(4, 12)
-    total_cost = round(random.uniform(5000, 50000), 2)
+    engineer = rng.choice(engineers)
+    machine_id = f"{rng.choice(machine_models[machine_type])}-{rng.randint(1, 1000):04}"
+    downtime = rng.randint(24, 72)
+    repairtime = rng.randint(4, 12)
+    total_cost = round(rng.uniform(5000, 50000), 2)
     labor_cost = round(total_cost * 0.4, 2)
     item_cost = round(total_cost * 0.6, 2)
-    created_at = random_timestamp(datetime(2024, 11, 1), datetime(2024, 11, 16))
-    updated_at = created_at + timedelta(hours=random.randint(1, 48))
-    status = random.choice(["success", "failed", "in-progress"])
+    created_at = random_timestamp(datetime(2024, 11, 1), datetime(2024, 11, 16), rng)
+    updated_at = created_at + timedelta(hours=rng.randint(1, 48))
+    status = rng.choice(["success", "failed", "in-progress"])
 
     # Standard repair steps for the job type
-    repair_steps = random.choice(standard_repair_steps[job_type])
+    repair_steps = rng.choice(standard_repair_steps[job_type])
 
     return {
         "ticket_id": ticket_id,
@@ -245,9 +100,22 @@ def generate_repair_job_instance(ticket_id, job_type):
     }
 
 
-# Generate description, transcription, and summary using Gemini
-def generate_text_fields_with_gemini(job):
-    prompt = f"""
+def make_ticket_id(i):
+    return f"HON-2024-11-{i:03}"
+
+
+def generate_seeded_repair_job(i, seed=0):
+    """
+    Repair job instance for the i-th ticket. The same (i, seed) always gives the
+    same job, and so the same prompt, which lets a resumed run reuse cached answers.
+    """
+    rng = random.Random(f"{seed}:{i}")
+    return generate_repair_job_instance(make_ticket_id(i), rng.choice(repair_jobs), rng)
+
+
+def build_repair_doc_prompt(job):
+    """Prompt asking the LLM for the description, transcription and summary of a job."""
+    return f"""
 You are tasked with generating realistic repair documentation for a repair job, which may have one of the following outcomes and choose only one outcome from the following:
 1. Correct/Successful repair.
 2. Failed repair attempt.
@@ -284,37 +152,57 @@ Please provide the output in JSON format with the following fields:
 Make sure the output is valid JSON and adheres to the specified format.
 """
 
-    try:
-        logging.info(f"Sending prompt for job: {job['ticket_id']}")
-        # Send the prompt to the Gemini API
-        response = client.chat.completions.create(
-            model="gemini-1.5-flash",
-            n=1,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt},
-            ],
-            response_format={"type": "json_object"},
-        )
 
-        # Extract the content from the response
-        content = response.choices[0].message.content.strip()
+def apply_text_fields(job, content):
+    """
+    Parse the LLM's JSON answer into the job's description, transcription and summary steps.
+    Raises if the answer is not valid JSON.
+    """
+    parsed_content = json.loads(content)
+    job["description"] = parsed_content.get(
+        "Description", "Description not available"
+    ).strip()
+    job["transcription"] = parsed_content.get(
+        "Transcription", "Transcription not available"
+    ).strip()
+    summary_steps = parsed_content.get("Summary Steps", "Summary Steps not available")
+    # The model sometimes answers with a list of steps; the column is TEXT
+    if not isinstance(summary_steps, str):
+        summary_steps = "\n".join(str(step) for step in summary_steps)
+    job["summary_steps"] = summary_steps
+    return job
 
-        # Parse JSON response
-        parsed_content = json.loads(content)
-
-        # Assign values to the job
-        job["description"] = parsed_content.get(
-            "Description", "Description not available"
-        ).strip()
-        job["transcription"] = parsed_content.get(
-            "Transcription", "Transcription not available"
-        ).strip()
-        job["summary_steps"] = parsed_content.get(
-            "Summary Steps", "Summary Steps not available"
-        )
 
-        return job
+# Generate description, transcription, and summary using Gemini
+def generate_text_fields_with_gemini(job):
+    prompt = build_repair_doc_prompt(job)
+
+    try:
+        cache_key = llm_cache.make_key(LLM_MODEL, REPAIR_DOC_PROMPT_VERSION, [prompt])
+        content = llm_cache.get(cache_key)
+        if content is None:
+            logging.info(f"Sending prompt for job: {job['ticket_id']}")
+            # Send the prompt to the Gemini API
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                n=1,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": prompt},
+                ],
+                response_format={"type": "json_object"},
+            )
+
+            # Extract the content from the response
+            content = response.choices[0].message.content.strip()
+
+            # Parse JSON response; only cache a response that parses
+            job = apply_text_fields(job, content)
+            llm_cache.set(cache_key, content)
+            return job
+
+        logging.info(f"Using cached response for job: {job['ticket_id']}")
+        return apply_text_fields(job, content)
 
     except Exception as e:
         logging.error(f"Error generating text fields for job {job['ticket_id']}: {e}")
@@ -331,37 +219,39 @@ def generate_full_repair_job_data(prev_row_len=0):
         save_repair_jobs_to_db(job)
 
 
+def job_to_repair_job(job):
+    """Build the RepairJob row of a generated job."""
+    return RepairJob(
+        ticket_id=job["ticket_id"],
+        manufacturing_plant_id=job["manufacturing_plant_id"],
+        video_path=job["video_path"],
+        audio_path=job["audio_path"],
+        engineer_id=job["engineer_id"],
+        machine_id=job["machine_id"],
+        machine_type=job["machine_type"],
+        downtime=job["downtime"],
+        repairtime=job["repairtime"],
+        total_cost=job["total_cost"],
+        labor_cost=job["labor_cost"],
+        item_cost=job["item_cost"],
+        item_bill_id="BILL-"
+        + job["ticket_id"],  # Example for generating a unique bill ID
+        replacement_items_list=job.get("replacement_items_list", ""),
+        description=job["description"],
+        transcription=job["transcription"],
+        summary_steps=job["summary_steps"],
+        prev_failed_ticket_id=None,  # Placeholder
+        next_raised_ticket_id=None,  # Placeholder
+    )
+
+
 def save_repair_jobs_to_db(job):
     """
     Save generated repair jobs to the PostgreSQL database.
     """
     try:
-        # Create a RepairJob instance
-        repair_job = RepairJob(
-            ticket_id=job["ticket_id"],
-            manufacturing_plant_id=job["manufacturing_plant_id"],
-            video_path=job["video_path"],
-            audio_path=job["audio_path"],
-            engineer_id=job["engineer_id"],
-            machine_id=job["machine_id"],
-            machine_type=job["machine_type"],
-            downtime=job["downtime"],
-            repairtime=job["repairtime"],
-            total_cost=job["total_cost"],
-            labor_cost=job["labor_cost"],
-            item_cost=job["item_cost"],
-            item_bill_id="BILL-"
-            + job["ticket_id"],  # Example for generating a unique bill ID
-            replacement_items_list=job.get("replacement_items_list", ""),
-            description=job["description"],
-            transcription=job["transcription"],
-            summary_steps=job["summary_steps"],
-            prev_failed_ticket_id=None,  # Placeholder
-            next_raised_ticket_id=None,  # Placeholder
-        )
-
         # Save to database
-        create_repair_job(repair_job)
+        create_repair_job(job_to_repair_job(job))
         logging.info(
             f"Successfully saved repair job {job['ticket_id']} to the database."
         )
@@ -383,20 +273,262 @@ def count_repair_job_rows(conn):
         return count
 
 
+class GenerationCheckpoint:
+    """
+    JSON file recording exactly which ticket ids are stored in the database.
+    It is rewritten atomically after every committed batch, so a run can be
+    stopped at any point and resumed without gaps or duplicates.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.succeeded = set()
+        self.failed = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.succeeded = set(data.get("succeeded", []))
+            self.failed = data.get("failed", {})
+
+    def record(self, succeeded=(), failed=None):
+        """Record finished tickets and persist the checkpoint."""
+        self.succeeded.update(succeeded)
+        for ticket_id in succeeded:
+            self.failed.pop(ticket_id, None)
+        self.failed.update(failed or {})
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(
+                {"succeeded": sorted(self.succeeded), "failed": self.failed},
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+async def generate_text_fields_async(job, rate_limiter):
+    """Async version of generate_text_fields_with_gemini, sharing its cache."""
+    from rate_limiter import create_chat_completion_with_retries
+
+    prompt = build_repair_doc_prompt(job)
+    cache_key = llm_cache.make_key(LLM_MODEL, REPAIR_DOC_PROMPT_VERSION, [prompt])
+    content = llm_cache.get(cache_key)
+    if content is None:
+        response = await create_chat_completion_with_retries(
+            async_client,
+            [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt},
+            ],
+            rate_limiter,
+            LLM_MODEL,
+            response_format={"type": "json_object"},
+        )
+        content = response.choices[0].message.content.strip()
+        job = apply_text_fields(job, content)
+        llm_cache.set(cache_key, content)
+        return job
+    return apply_text_fields(job, content)
+
+
+async def generate_repair_jobs_async(
+    start=1,
+    count=100,
+    checkpoint_path="repair_job_checkpoint.json",
+    max_concurrency=None,
+    batch_size=500,
+    requests_per_minute=None,
+    tokens_per_minute=None,
+    seed=0,
+    export_dir=None,
+    export_format="jsonl.gz",
+    store_in_db=True,
+):
+    """
+    Generate tickets start..start+count-1 concurrently and store them in batches.
+
+    Workers call the LLM under a shared rate limiter; a single writer inserts the
+    finished jobs batch by batch and records them in the checkpoint only after the
+    batch is committed. Tickets already in the checkpoint are skipped, and tickets
+    that failed are retried by the next run.
+
+    Args:
+        start (int): Number of the first ticket.
+        count (int): Number of tickets to generate.
+        checkpoint_path (str): JSON checkpoint of the succeeded ticket ids.
+        max_concurrency (int): LLM requests in flight (default: $LLM_MAX_CONCURRENCY or 8).
+        batch_size (int): Jobs per database insert.
+        requests_per_minute (int): Request quota (default: $LLM_REQUESTS_PER_MINUTE or 60).
+        tokens_per_minute (int): Token quota (default: $LLM_TOKENS_PER_MINUTE or 1,000,000).
+        seed (int): Seed of the generated job attributes.
+        export_dir (str): Also write every batch as a shard of this dataset
+            directory (see dataset_shards.py). A new run needs an empty or missing
+            directory; a run resumed from the checkpoint appends to it.
+        export_format (str): "jsonl.gz" or "parquet".
+        store_in_db (bool): Insert the jobs into the database; with export_dir,
+            False only exports them (without it, ValueError).
+
+    Returns:
+        Dictionary with the number of tickets stored, skipped and failed.
+    """
+    from rate_limiter import AsyncRateLimiter
+
+    if not store_in_db and not export_dir:
+        raise ValueError("store_in_db=False needs an export_dir")
+
+    checkpoint = GenerationCheckpoint(checkpoint_path)
+    shards = None
+    if export_dir:
+        from dataset_shards import ShardWriter
+
+        # A resumed run adds the tickets its checkpoint doesn't have yet
+        shards = ShardWriter(
+            export_dir,
+            export_format,
+            {"generator": "llm", "start": start, "count": count, "seed": seed},
+            append=bool(checkpoint.succeeded or checkpoint.failed),
+        )
+    pending = [
+        i
+        for i in range(start, start + count)
+        if make_ticket_id(i) not in checkpoint.succeeded
+    ]
+    max_concurrency = max_concurrency or int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+    rate_limiter = AsyncRateLimiter(
+        requests_per_minute or int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 60)),
+        tokens_per_minute or int(os.environ.get("LLM_TOKENS_PER_MINUTE", 1_000_000)),
+    )
+    tickets = asyncio.Queue()
+    for i in pending:
+        tickets.put_nowait(i)
+    finished = asyncio.Queue(maxsize=2 * batch_size)
+    stats = {"stored": 0, "skipped": count - len(pending), "failed": 0}
+    started_at = time.perf_counter()
+
+    async def worker():
+        while True:
+            try:
+                i = tickets.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            job = generate_seeded_repair_job(i, seed)
+            try:
+                await finished.put(
+                    (job, await generate_text_fields_async(job, rate_limiter))
+                )
+            except Exception as e:
+                logging.error(
+                    f"Error generating text fields for job {job['ticket_id']}: {e}"
+                )
+                await finished.put((job, e))
+
+    async def flush(jobs, failed):
+        stored = []
+        if jobs:
+            try:
+                repair_jobs_batch = [job_to_repair_job(job) for job in jobs]
+                if store_in_db:
+                    await asyncio.to_thread(create_repair_jobs, repair_jobs_batch)
+                if shards:
+                    await asyncio.to_thread(
+                        shards.write_shard,
+                        {
+                            **{
+                                field: [getattr(r, field) for r in repair_jobs_batch]
+                                for field in RepairJob.__dataclass_fields__
+                            },
+                            "created_at": [job["created_at"] for job in jobs],
+                            "updated_at": [job["updated_at"] for job in jobs],
+                        },
+                    )
+                stored = [job["ticket_id"] for job in jobs]
+            except Exception as e:
+                logging.error(f"Failed to save a batch of {len(jobs)} repair jobs: {e}")
+                failed.update({job["ticket_id"]: str(e) for job in jobs})
+        checkpoint.record(stored, failed)
+        stats["stored"] += len(stored)
+        stats["failed"] += len(failed)
+        done = stats["stored"] + stats["failed"]
+        rate = done / max(time.perf_counter() - started_at, 1e-9)
+        logging.info(
+            f"{done}/{len(pending)} tickets done ({stats['failed']} failed), "
+            f"{rate:.1f} tickets/s"
+        )
+
+    async def writer():
+        jobs, failed = [], {}
+        for _ in range(len(pending)):
+            job, result = await finished.get()
+            if isinstance(result, Exception):
+                failed[job["ticket_id"]] = str(result)
+            else:
+                jobs.append(result)
+            if len(jobs) + len(failed) >= batch_size:
+                await flush(jobs, failed)
+                jobs, failed = [], {}
+        if jobs or failed:
+            await flush(jobs, failed)
+
+    workers = [
+        asyncio.create_task(worker()) for _ in range(min(max_concurrency, len(pending)))
+    ]
+    await asyncio.gather(writer(), *workers)
+    return stats
+
+
 # Main script
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic repair jobs")
+    parser.add_argument(
+        "--start", type=int, default=1, help="Number of the first ticket"
+    )
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--requests-per-minute", type=int)
+    parser.add_argument("--tokens-per-minute", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", default="repair_job_checkpoint.json")
+    parser.add_argument("--export-dir", help="Also write the jobs as dataset shards")
+    parser.add_argument(
+        "--export-format", choices=["jsonl.gz", "parquet"], default="jsonl.gz"
+    )
+    parser.add_argument(
+        "--no-db",
+        action="store_true",
+        help="Only export (needs --export-dir), don't insert into the DB",
+    )
+    args = parser.parse_args()
+    if args.no_db and not args.export_dir:
+        parser.error("--no-db needs --export-dir, or the jobs would go nowhere")
     try:
         # Step 1: Create the table if it doesn't exist
-        logging.info("Creating RepairJob table if it doesn't exist.")
-        create_table()
+        if not args.no_db:
+            logging.info("Creating RepairJob table if it doesn't exist.")
+            create_table()
 
         # Step 2: Generate synthetic repair job data
         logging.info("Generating synthetic repair jobs.")
-        prev_row_len = count_repair_job_rows()
-        repair_jobs_data = generate_full_repair_job_data(prev_row_len)
-
-        logging.info("All repair jobs have been processed.")
+        stats = asyncio.run(
+            generate_repair_jobs_async(
+                args.start,
+                args.count,
+                args.checkpoint,
+                args.concurrency,
+                args.batch_size,
+                args.requests_per_minute,
+                args.tokens_per_minute,
+                args.seed,
+                args.export_dir,
+                args.export_format,
+                not args.no_db,
+            )
+        )
 
-        logging.info("Repair jobs data saved successfully.")
+        logging.info(
+            f"All repair jobs have been processed: {stats['stored']} stored, "
+            f"{stats['skipped']} already done, {stats['failed']} failed "
+            f"(rerun to retry them)."
+        )
     except Exception as e:
         logging.error(f"Critical failure: {e}")
@@ -0,0 +1,394 @@
+"""
+-----------------------------------------------------------------------
+File: benchmarks/clustering_benchmark.py
+Creation Time: Oct 19th 2026, 1:15 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Scalability benchmark of the clustering pipeline:
+fetch_embeddings -> cluster_with_hdbscan -> reassign_noise -> update_hdbscan_clusters.
+
+Every dataset size runs in a fresh process. Each stage reports the RSS at its
+start and how far its peak RSS rose above that; on Linux the peak is reset before
+every stage (/proc/self/clear_refs), elsewhere it is the process's lifetime peak,
+so a stage that stays below an earlier stage's peak shows no growth.
+Without --db the vectors are generated in memory and the DB stages are skipped.
+With --db, synthetic rows are loaded into the database configured by the PG_*
+variables (use a local Postgres, not production) under machine_type
+"benchmark-<n>" and removed afterwards; the DB fetch is then compared with
+building and cold-loading an embedding snapshot (see embedding_snapshots.py).
+
+    python benchmarks/clustering_benchmark.py --sizes 1000 10000 --output report.json
+    python benchmarks/clustering_benchmark.py --db --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+
+SERVICES_DIR = os.path.join(os.path.dirname(__file__), "..", "app", "services")
+sys.path.insert(0, os.path.abspath(SERVICES_DIR))
+# The benchmark never calls the LLM, but clustering.py requires a key at import
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _proc_status_mb(field):
+    """A memory field (VmRSS, VmHWM) of /proc/self/status in MB, or None off Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS (VmHWM) to the current RSS, so the next reading is the peak
+    of what runs in between. Linux only.
+    :return: True if the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def default_memory_limit_bytes():
+    """80% of physical memory, or None if it can't be determined."""
+    try:
+        return int(0.8 * os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def make_clustered_embeddings(
+    n_points, dim=768, n_clusters=50, noise_ratio=0.05, seed=0
+):
+    """
+    Synthetic embeddings: gaussian blobs around random centers plus uniform noise.
+    :return: float32 array (n_points, dim) and the ground-truth labels (-1 for noise).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n_points)
+    embeddings = centers[labels] + 0.35 * rng.normal(size=(n_points, dim)).astype(
+        np.float32
+    )
+    noise = rng.random(n_points) < noise_ratio
+    embeddings[noise] = rng.normal(size=(noise.sum(), dim)).astype(np.float32) * 1.5
+    labels[noise] = -1
+    return embeddings, labels
+
+
+class StageTimer:
+    """
+    Records wall time and memory of each pipeline stage: the RSS at its start
+    and the growth of the peak RSS above it. peak_rss_scope says whether the peak
+    is the stage's own ("stage") or the process's so far ("process").
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, *args, **extra):
+        per_stage = _proc_status_mb("VmRSS") is not None and reset_peak_rss()
+        start_rss = _proc_status_mb("VmRSS") if per_stage else peak_rss_mb()
+        started_at = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.stages[name] = {"status": "failed", "error": repr(e)}
+            return None
+        wall_s = time.perf_counter() - started_at
+        peak = _proc_status_mb("VmHWM") if per_stage else peak_rss_mb()
+        self.stages[name] = {
+            "status": "ok",
+            "wall_s": round(wall_s, 4),
+            "rss_start_mb": round(start_rss, 1),
+            "peak_rss_delta_mb": round(max(0.0, peak - start_rss), 1),
+            "peak_rss_scope": "stage" if per_stage else "process",
+            **extra,
+        }
+        return result
+
+    def skip(self, name, reason):
+        self.stages[name] = {"status": "skipped", "reason": reason}
+
+
+def load_benchmark_rows(machine_type, embeddings, batch_size=10_000):
+    """
+    COPY synthetic embeddings into the embeddings table, under a dummy repair job.
+    :return: Number of rows written.
+    """
+    from db import RepairJob, create_repair_job, with_connection
+
+    create_repair_job(
+        RepairJob(
+            ticket_id=machine_type,
+            manufacturing_plant_id="BENCH",
+            video_path="",
+            audio_path="",
+            engineer_id="BENCH",
+            machine_id="BENCH",
+            machine_type=machine_type,
+            downtime=0,
+            repairtime=0,
+            total_cost=0,
+            labor_cost=0,
+            item_cost=0,
+            item_bill_id="BENCH",
+            replacement_items_list="",
+            description="",
+            transcription="",
+            summary_steps="",
+        )
+    )
+
+    @with_connection
+    def copy_rows(conn):
+        with conn.cursor() as cur:
+            for start in range(0, len(embeddings), batch_size):
+                buffer = io.StringIO()
+                for i, vector in enumerate(embeddings[start : start + batch_size]):
+                    vector_literal = "[" + ",".join(f"{x:.6f}" for x in vector) + "]"
+                    buffer.write(
+                        f"{machine_type}\t{machine_type}\tbenchmark sentence {start + i}"
+                        f"\tsentence\t{vector_literal}\tsentence\n"
+                    )
+                buffer.seek(0)
+                cur.copy_expert(
+                    "COPY embeddings (repair_job_id, machine_type, text_content, "
+                    "text_type, embedding, chunk_level) FROM STDIN",
+                    buffer,
+                )
+        return len(embeddings)
+
+    return copy_rows()
+
+
+def delete_benchmark_rows(machine_type):
+    """Remove the benchmark embeddings and their dummy repair job."""
+    from db import with_connection
+
+    @with_connection
+    def delete_rows(conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM embeddings WHERE machine_type = %s", (machine_type,)
+            )
+            cur.execute("DELETE FROM repairjob WHERE ticket_id = %s", (machine_type,))
+
+    delete_rows()
+
+
+def benchmark_size(n_points, args):
+    """
+    Run every stage for one dataset size. Runs in its own process.
+    :return: Report entry for this size.
+    """
+    from embedding_snapshots import EmbeddingSnapshotStore
+    from clustering import (
+        cluster_with_hdbscan,
+        estimate_clustering_memory,
+        fetch_embeddings,
+        reassign_noise,
+        update_hdbscan_clusters,
+    )
+
+    timer = StageTimer()
+    machine_type = f"benchmark-{n_points}"
+    generated = timer.run(
+        "generate",
+        make_clustered_embeddings,
+        n_points,
+        args.dim,
+        args.n_clusters,
+        args.noise_ratio,
+        args.seed,
+    )
+    if generated is None:
+        return {"n_points": n_points, "stages": timer.stages}
+    embeddings, embedding_ids = generated[0], list(range(n_points))
+
+    try:
+        if args.db:
+            started_at = time.perf_counter()
+            written = timer.run("insert", load_benchmark_rows, machine_type, embeddings)
+            if written:
+                timer.stages["insert"]["rows_per_s"] = round(
+                    written / (time.perf_counter() - started_at), 1
+                )
+            fetched = timer.run("fetch_embeddings", fetch_embeddings, machine_type)
+            if fetched is None or fetched[0] is None:
+                return {"n_points": n_points, "stages": timer.stages}
+            embeddings, embedding_ids, _ = fetched
+
+            with tempfile.TemporaryDirectory() as snapshot_dir:
+                store = EmbeddingSnapshotStore(snapshot_dir)
+                timer.run("snapshot_refresh", store.refresh, machine_type)
+                # Reading every page measures a cold load, not just the mmap call
+                timer.run(
+                    "snapshot_open",
+                    lambda: float(store.open(machine_type).embeddings.sum()),
+                )
+        else:
+            for stage in ("fetch_embeddings", "snapshot_refresh", "snapshot_open"):
+                timer.skip(stage, "run with --db to include database stages")
+
+        estimate = estimate_clustering_memory(n_points, args.dim)
+        if args.memory_limit_bytes and estimate > args.memory_limit_bytes:
+            reason = (
+                f"needs ~{estimate / 1024**3:.1f} GB for the distance matrix, "
+                f"limit is {args.memory_limit_bytes / 1024**3:.1f} GB"
+            )
+            for stage in (
+                "cluster_with_hdbscan",
+                "reassign_noise",
+                "update_hdbscan_clusters",
+            ):
+                timer.skip(stage, reason)
+            return {"n_points": n_points, "stages": timer.stages}
+
+        clustered = timer.run(
+            "cluster_with_hdbscan",
+            cluster_with_hdbscan,
+            embeddings,
+            args.min_cluster_size,
+            args.min_samples,
+        )
+        if clustered is None or clustered[0] is None:
+            timer.stages["cluster_with_hdbscan"] = {
+                "status": "failed",
+                "error": "cluster_with_hdbscan returned no labels",
+            }
+            return {"n_points": n_points, "stages": timer.stages}
+        cluster_labels, probabilities, clusterer = clustered
+        timer.stages["cluster_with_hdbscan"].update(
+            n_clusters=len(set(cluster_labels.tolist()) - {-1}),
+            noise_ratio=round(float((cluster_labels == -1).mean()), 4),
+        )
+
+        timer.run(
+            "reassign_noise",
+            reassign_noise,
+            np.asarray(embeddings),
+            cluster_labels.copy(),
+            clusterer,
+        )
+
+        if args.db:
+            started_at = time.perf_counter()
+            timer.run(
+                "update_hdbscan_clusters",
+                update_hdbscan_clusters,
+                cluster_labels,
+                embedding_ids,
+            )
+            if timer.stages["update_hdbscan_clusters"]["status"] == "ok":
+                timer.stages["update_hdbscan_clusters"]["rows_per_s"] = round(
+                    n_points / (time.perf_counter() - started_at), 1
+                )
+        else:
+            timer.skip(
+                "update_hdbscan_clusters", "run with --db to include database stages"
+            )
+    finally:
+        if args.db:
+            delete_benchmark_rows(machine_type)
+
+    return {"n_points": n_points, "stages": timer.stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Clustering pipeline scalability benchmark"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--n-clusters", type=int, default=50)
+    parser.add_argument("--noise-ratio", type=float, default=0.05)
+    parser.add_argument("--min-cluster-size", type=int, default=2)
+    parser.add_argument("--min-samples", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--db", action="store_true", help="Include the database stages (PG_* variables)"
+    )
+    parser.add_argument(
+        "--memory-limit-gb",
+        type=float,
+        help="Skip clustering sizes estimated above this (default: 80%% of RAM)",
+    )
+    parser.add_argument("--output", default="clustering_benchmark.json")
+    args = parser.parse_args()
+    args.memory_limit_bytes = (
+        int(args.memory_limit_gb * 1024**3)
+        if args.memory_limit_gb
+        else default_memory_limit_bytes()
+    )
+
+    report = {
+        "benchmark": "clustering",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "params": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": [],
+    }
+
+    for n_points in args.sizes:
+        print(f"Benchmarking {n_points} points...")
+        # A fresh process per size keeps the sizes' memory numbers independent
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as pool:
+            try:
+                result = pool.submit(benchmark_size, n_points, args).result()
+            except Exception as e:
+                result = {"n_points": n_points, "error": repr(e)}
+        report["results"].append(result)
+        for stage, stats in result.get("stages", {}).items():
+            summary = (
+                f"{stats['wall_s']:.2f}s, peak RSS +{stats['peak_rss_delta_mb']:.0f} MB "
+                f"over {stats['rss_start_mb']:.0f} MB ({stats['peak_rss_scope']})"
+                if stats["status"] == "ok"
+                else stats["status"]
+            )
+            print(f"  {stage:<26} {summary}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+-----------------------------------------------------------------------
+File: LLMClient/llm_client.py
+Creation Time: Oct 19th 2026, 1:35 pm
+Author: Saurabh Zinjad
+Developer Email: saurabhzinjad@gmail.com
+Copyright (c) 2023-2024 Saurabh Zinjad. All rights reserved | https://github.com/Ztrimus
+-----------------------------------------------------------------------
+
+Shared OpenAI-compatible clients, one per provider, with pooled keep-alive
+connections, per-call metrics, and record/replay of LLM calls.
+
+    client = get_client("openai")
+    async_client = get_async_client("gemini", max_retries=0)
+
+LLM_MODE selects what the clients do:
+- live (default): call the provider;
+- record: call the provider and store every request -> response pair in
+  LLM_RECORDINGS_PATH (a SQLite file);
+- replay: no network at all; responses come from the recordings, after
+  LLM_REPLAY_LATENCY seconds ("recorded" replays the latency measured when recording).
+  A request that was never recorded raises LLMReplayMiss.
+
+Timeouts, retries and pool sizes default to LLM_TIMEOUT_SECONDS (60),
+LLM_MAX_RETRIES (2) and LLM_MAX_CONNECTIONS (32), and can be overridden per call
+of get_client. Latency and token usage of every call are collected in `metrics`.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from openai.types.chat import ChatCompletion
+
+LLM_MODES = ("live", "record", "replay")
+
+# Environment variables and defaults of every provider
+PROVIDERS = {
+    "openai": {
+        "api_key_env": "OPENAI_API_KEY",
+        "base_url_env": "OPENAI_BASE_URL",
+        "base_url": None,
+    },
+    "gemini": {
+        "api_key_env": "GEMINI_API_KEY",
+        "base_url_env": "GEMINI_BASE_URL",
+        "base_url": "https://generativelanguage.googleapis.com/v1beta/openai/",
+    },
+}
+
+
+class LLMReplayMiss(KeyError):
+    """Raised in replay mode for a request that has no recording."""
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    api_key: Optional[str]
+    base_url: Optional[str]
+    timeout_seconds: float
+    max_retries: int
+    max_connections: int
+    keepalive_seconds: float = 30.0
+
+
+def provider_config(provider, **overrides) -> ProviderConfig:
+    """Configuration of a provider from the environment, with `overrides` applied."""
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider {provider!r}")
+    settings = PROVIDERS[provider]
+    config = {
+        "api_key": os.environ.get(settings["api_key_env"]),
+        "base_url": os.environ.get(settings["base_url_env"], settings["base_url"]),
+        "timeout_seconds": float(os.environ.get("LLM_TIMEOUT_SECONDS", 60)),
+        "max_retries": int(os.environ.get("LLM_MAX_RETRIES", 2)),
+        "max_connections": int(os.environ.get("LLM_MAX_CONNECTIONS", 32)),
+    }
+    config.update(overrides)
+    return ProviderConfig(**config)
+
+
+def _client_options(config, http_client_class):
+    return {
+        "api_key": config.api_key,
+        "base_url": config.base_url,
+        "max_retries": config.max_retries,
+        "timeout": config.timeout_seconds,
+        "http_client": http_client_class(
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_connections,
+                keepalive_expiry=config.keepalive_seconds,
+            ),
+            timeout=httpx.Timeout(config.timeout_seconds, connect=10.0),
+        ),
+    }
+
+
+class LLMRecordings:
+    """Request -> response pairs of chat completion calls, stored in a SQLite file."""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite file (default: $LLM_RECORDINGS_PATH or llm_recordings.sqlite3).
+        """
+        self.path = path or os.environ.get(
+            "LLM_RECORDINGS_PATH", "llm_recordings.sqlite3"
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_recordings (
+                    request_key TEXT PRIMARY KEY,
+                    request TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    latency_seconds REAL NOT NULL,
+                    recorded_at REAL NOT NULL
+                )
+                """)
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        """Key of a request: a hash of all its arguments, in canonical JSON."""
+        return hashlib.sha256(
+            json.dumps(
+                request, sort_keys=True, ensure_ascii=False, default=str
+            ).encode()
+        ).hexdigest()
+
+    def get(self, request: dict):
+        """Return (response dict, recorded latency) or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, latency_seconds FROM llm_recordings WHERE request_key = ?",
+                (self.make_key(request),),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, request: dict, response: dict, latency_seconds: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_recordings "
+                "(request_key, request, response, latency_seconds, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    self.make_key(request),
+                    json.dumps(
+                        request, sort_keys=True, ensure_ascii=False, default=str
+                    ),
+                    json.dumps(response, ensure_ascii=False),
+                    latency_seconds,
+                    time.time(),
+                ),
+            )
+
+
+class LLMMetrics:
+    """Latency and token usage of LLM calls, per provider and model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._latencies = defaultdict(list)
+            self._failures = defaultdict(int)
+            self._tokens = defaultdict(lambda: [0, 0])
+
+    def observe(self, provider, model, seconds, response=None, failed=False):
+        key = f"{provider}/{model}"
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            self._latencies[key].append(seconds)
+            if failed:
+                self._failures[key] += 1
+            if usage is not None:
+                self._tokens[key][0] += usage.prompt_tokens or 0
+                self._tokens[key][1] += usage.completion_tokens or 0
+
+    def summary(self) -> dict:
+        """Calls, failures, latency percentiles and tokens per provider/model."""
+        with self._lock:
+            summary = {}
+            for key, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                summary[key] = {
+                    "calls": len(ordered),
+                    "failures": self._failures[key],
+                    "p50_seconds": round(ordered[len(ordered) // 2], 4),
+                    "p95_seconds": round(ordered[int(0.95 * (len(ordered) - 1))], 4),
+                    "total_seconds": round(sum(ordered), 4),
+                    "prompt_tokens": self._tokens[key][0],
+                    "completion_tokens": self._tokens[key][1],
+                }
+            return summary
+
+
+metrics = LLMMetrics()
+
+
+def _replay_delay(recorded_latency):
+    latency = os.environ.get("LLM_REPLAY_LATENCY", "0")
+    if latency == "recorded":
+        return recorded_latency
+    return float(latency)
+
+
+class _Completions:
+    """`client.chat.completions` with recording, replay and metrics."""
+
+    def __init__(self, provider, mode, recordings, make_client):
+        self.provider = provider
+        self.mode = mode
+        self.recordings = recordings
+        self.make_client = make_client
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.make_client()
+        return self._client
+
+    def _lookup(self, request):
+        if request.get("stream"):
+            raise ValueError("Streaming responses can't be recorded or replayed")
+        recorded = self.recordings.get(request)
+        if recorded is None:
+            raise LLMReplayMiss(
+                f"No recording for a {request.get('model')} request "
+                f"({self.recordings.make_key(request)[:12]})"
+            )
+        return ChatCompletion.model_validate(recorded[0]), recorded[1]
+
+    def create(self, **request):
+        started_at = time.perf_counter()
+        try:
+            if self.mode == "replay":
+                response, recorded_latency = self._lookup(request)
+                time.sleep(_replay_delay(recorded_latency))
+            else:
+                response = self.client().chat.completions.create(**request)
+                if self.mode == "record":
+                    self.recordings.put(
+                        request,
+                        response.model_dump(mode="json"),
+                        time.perf_counter() - started_at,
+                    )
+        except Exception:
+            metrics.observe(
+                self.provider,
+                request.get("model"),
+                time.perf_counter() - started_at,
+                failed=True,
+            )
+            raise
+        metrics.observe(
+            self.provider,
+            request.get("model"),
+            time.perf_counter() - started_at,
+            response,
+        )
+        return response
+
+
+class _AsyncCompletions(_Completions):
+    """
+    Async `client.chat.completions`. Pooled connections belong to an event loop,
+    so every loop gets its own underlying client.
+    """
+
+    def client(self):
+        if self._client is None:
+            self._client = weakref.WeakKeyDictionary()
+        loop = asyncio.get_running_loop()
+        if loop not in self._client:
+            self._client[loop] = self.make_client()
+        return self._client[loop]
+
+    async def create(self, **request):
+        started_at = time.perf_counter()
+        try:
+            if self.mode == "replay":
+                response, recorded_latency = self._lookup(request)
+                await asyncio.sleep(_replay_delay(recorded_latency))
+            else:
+                response = await self.client().chat.completions.create(**request)
+                if self.mode == "record":
+                    self.recordings.put(
+                        request,
+                        response.model_dump(mode="json"),
+                        time.perf_counter() - started_at,
+                    )
+        except Exception:
+            metrics.observe(
+                self.provider,
+                request.get("model"),
+                time.perf_counter() - started_at,
+                failed=True,
+            )
+            raise
+        metrics.observe(
+            self.provider,
+            request.get("model"),
+            time.perf_counter() - started_at,
+            response,
+        )
+        return response
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get(provider, asynchronous, mode, recordings, overrides):
+    mode = mode or os.environ.get("LLM_MODE", "live")
+    if mode not in LLM_MODES:
+        raise ValueError(f"LLM_MODE must be one of {LLM_MODES}, not {mode!r}")
+    key = (
+        provider,
+        asynchronous,
+        mode,
+        id(recordings),
+        tuple(sorted(overrides.items())),
+    )
+    with _clients_lock:
+        if key not in _clients:
+            config = provider_config(provider, **overrides)
+            if asynchronous:
+                make_client = lambda: AsyncOpenAI(
+                    **_client_options(config, DefaultAsyncHttpxClient)
+                )
+            else:
+                make_client = lambda: OpenAI(
+                    **_client_options(config, DefaultHttpxClient)
+                )
+            if mode != "live":
+                recordings = recordings or LLMRecordings()
+            completions_class = _AsyncCompletions if asynchronous else _Completions
+            _clients[key] = SimpleNamespace(
+                config=config,
+                chat=SimpleNamespace(
+                    completions=completions_class(
+                        provider, mode, recordings, make_client
+                    )
+                ),
+            )
+        return _clients[key]
+
+
+def get_client(provider="openai", mode=None, recordings=None, **overrides):
+    """
+    Shared client of a provider; only `chat.completions.create` is exposed.
+    The underlying OpenAI client (and its connection pool) is created on first use,
+    never in replay mode.
+
+    Args:
+        provider: "openai" or "gemini".
+        mode: "live", "record" or "replay" (default: $LLM_MODE or live).
+        recordings: LLMRecordings to use (default: $LLM_RECORDINGS_PATH).
+        overrides: ProviderConfig fields, e.g. max_retries=0 or timeout_seconds=30.
+    """
+    return _get(provider, False, mode, recordings, overrides)
+
+
+def get_async_client(provider="openai", mode=None, recordings=None, **overrides):
+    """Async version of `get_client`."""
+    return _get(provider, True, mode, recordings, overrides)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent small requests. Items submitted within `max_wait_seconds`
+    of the first pending one, up to `max_batch_size`, are passed to `handler` as one
+    list; `handler` is an async function returning one result per item.
+    """
+
+    def __init__(self, handler, max_batch_size=16, max_wait_seconds=0.01):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending = []
+        self._timer = None
+        # The event loop only keeps weak references to tasks
+        self._tasks = set()
+
+    async def submit(self, item):
+        """Queue an item and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_wait_seconds, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"Batch handler returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def chat_batch_handler(client, model, system_prompt="You are a helpful assistant."):
+    """
+    MicroBatcher handler that answers several short prompts with one request,
+    asking for a JSON array with one answer per prompt. If the answer can't be
+    split, the prompts are sent one by one instead.
+
+    Args:
+        client: Async client from get_async_client.
+        model: Model name.
+        system_prompt: System message of every request.
+    """
+
+    async def ask(prompt):
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+        )
+        return response.choices[0].message.content
+
+    async def handler(prompts):
+        if len(prompts) == 1:
+            return [await ask(prompts[0])]
+        numbered = "\n".join(
+            f"{i}. {json.dumps(prompt, ensure_ascii=False)}"
+            for i, prompt in enumerate(prompts, start=1)
+        )
+        content = await ask(
+            f"Answer each of the following {len(prompts)} requests independently.\n"
+            f"{numbered}\n"
+            f"Return only a JSON array of {len(prompts)} strings, "
+            f"the i-th string answering the i-th request."
+        )
+        try:
+            content = content.strip()
+            if content.startswith("```"):
+                content = content.split("\n", 1)[1].rsplit("```", 1)[0]
+            answers = json.loads(content)
+            if isinstance(answers, list) and len(answers) == len(prompts):
+                return [str(answer) for answer in answers]
+        except (ValueError, IndexError):
+            pass
+        return list(await asyncio.gather(*(ask(prompt) for prompt in prompts)))
+
+    return handler
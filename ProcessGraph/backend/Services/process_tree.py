@@ -0,0 +1,212 @@
+"""
+In-memory process tree shared by the JSON (tools.py) and YAML (yaml.py) pipelines.
+
+Both files hold the same nodes: {UUID, Step, TreeLevel, IDList, ChildNodeUUID}.
+The JSON file is a dict of UUID -> node; the YAML file keeps that dict under a
+top-level 'ProcessTree' key (its keys are not always the UUIDs). ProcessTree
+reads and writes both shapes and indexes the nodes by UUID, parent and level,
+so lookups and updates don't scan the tree.
+
+This module must not import PyYAML: yaml.py shadows it inside this directory.
+"""
+
+from collections.abc import Mapping
+
+NODE_FIELDS = ('UUID', 'Step', 'TreeLevel', 'IDList', 'ChildNodeUUID')
+
+
+class TreeNode:
+    """
+    One step of a process tree.
+
+    - uuid (str): The node's UUID.
+    - key (str): Its key in the file (the UUID, except in some YAML trees).
+    - step (str): The step description.
+    - level (int): TreeLevel (may be None in YAML trees).
+    - video_ids (list): IDList, in the order the videos were added.
+    - children (list): ChildNodeUUID.
+    - extra (dict): Any other fields of the node, kept as they are (or None).
+    """
+    __slots__ = ('uuid', 'key', 'step', 'level', 'video_ids', 'video_set', 'children', 'extra')
+
+    def __init__(self, uuid, step, level, video_ids=(), children=(), key=None, extra=None):
+        self.uuid = uuid
+        self.key = key if key is not None else uuid
+        self.step = step
+        self.level = level
+        self.video_ids = list(video_ids)
+        self.video_set = set(self.video_ids)
+        self.children = list(children)
+        self.extra = extra or None
+
+    def to_dict(self):
+        node = {
+            'UUID': self.uuid,
+            'Step': self.step,
+            'TreeLevel': self.level,
+            'IDList': list(self.video_ids),
+            'ChildNodeUUID': list(self.children),
+        }
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+    def __repr__(self):
+        return f"TreeNode({self.uuid!r}, {self.step!r}, level={self.level})"
+
+
+class ProcessTree(Mapping):
+    """
+    A read-only mapping of UUID -> TreeNode, changed through add_node and add_video.
+
+    Indexes:
+    - nodes: UUID -> TreeNode
+    - parents: child UUID -> parent UUID
+    - levels: TreeLevel -> UUIDs at that level (in insertion order)
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.parents = {}
+        self.levels = {}
+        # Top-level YAML keys other than 'ProcessTree'
+        self.document = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Builds a tree from the JSON shape: a dict of key -> node dict.
+
+        Null IDList and ChildNodeUUID fields are read as empty lists.
+        """
+        nodes = []
+        for key, fields in (data or {}).items():
+            fields = dict(fields)
+            nodes.append(TreeNode(
+                fields.pop('UUID', key),
+                fields.pop('Step', None),
+                fields.pop('TreeLevel', None),
+                fields.pop('IDList', None) or (),
+                fields.pop('ChildNodeUUID', None) or (),
+                key=key,
+                extra=fields,
+            ))
+        return cls.from_nodes(nodes)
+
+    @classmethod
+    def from_nodes(cls, nodes, document=None):
+        """
+        Builds a tree from TreeNodes, in file order.
+
+        Parameters:
+        - nodes (iterable of TreeNode): The nodes; their children lists define the parents.
+        - document (dict): Top-level YAML keys other than 'ProcessTree'.
+        """
+        tree = cls()
+        for node in nodes:
+            tree._index(node)
+        for node in tree.nodes.values():
+            for child_uuid in node.children:
+                tree.parents[child_uuid] = node.uuid
+        tree.document = dict(document or {})
+        return tree
+
+    @classmethod
+    def from_yaml_data(cls, data):
+        """Builds a tree from a loaded YAML document ({'ProcessTree': {...}, ...})."""
+        data = data or {}
+        tree = cls.from_dict(data.get('ProcessTree'))
+        tree.document = {key: value for key, value in data.items() if key != 'ProcessTree'}
+        return tree
+
+    def to_dict(self):
+        """The JSON shape: a dict of key -> node dict, in insertion order."""
+        return {node.key: node.to_dict() for node in self.nodes.values()}
+
+    def to_yaml_data(self):
+        """The YAML document, with the nodes under 'ProcessTree'."""
+        return {**self.document, 'ProcessTree': self.to_dict()}
+
+    def _index(self, node):
+        self.nodes[node.uuid] = node
+        self.levels.setdefault(node.level, {})[node.uuid] = None
+
+    def __getitem__(self, node_uuid):
+        return self.nodes[node_uuid]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_uuid):
+        return node_uuid in self.nodes
+
+    def parent(self, node_uuid):
+        """The parent's TreeNode, or None for a root."""
+        parent_uuid = self.parents.get(node_uuid)
+        return self.nodes.get(parent_uuid) if parent_uuid is not None else None
+
+    def at_level(self, level):
+        """The TreeNodes at a TreeLevel."""
+        return [self.nodes[node_uuid] for node_uuid in self.levels.get(level, ())]
+
+    def roots(self):
+        """The TreeNodes without a parent."""
+        return [node for node_uuid, node in self.nodes.items() if node_uuid not in self.parents]
+
+    def add_node(self, parent_uuid, step, video_id, new_uuid):
+        """
+        Adds a node as the last child of a parent, one TreeLevel below it.
+
+        Parameters:
+        - parent_uuid (str): UUID of the parent node.
+        - step (str): The step description.
+        - video_id (str): The first entry of the node's IDList.
+        - new_uuid (str): UUID (and key) of the new node.
+
+        Returns:
+        - TreeNode: The new node.
+        Raises KeyError if the parent does not exist, ValueError if new_uuid is taken.
+        """
+        parent_node = self.nodes[parent_uuid]
+        return self.insert(TreeNode(new_uuid, step, (parent_node.level or 0) + 1, [video_id]), parent_uuid)
+
+    def insert(self, node, parent_uuid=None):
+        """
+        Adds a ready-made node, as the last child of a parent if one is given.
+
+        Returns:
+        - TreeNode: The node.
+        Raises KeyError if the parent does not exist, ValueError if the UUID is taken.
+        """
+        if node.uuid in self.nodes:
+            raise ValueError(f"UUID {node.uuid} already exists")
+        if parent_uuid is not None:
+            self.nodes[parent_uuid].children.append(node.uuid)
+            self.parents[node.uuid] = parent_uuid
+        self._index(node)
+        return node
+
+    def has_video(self, node_uuid, video_id):
+        return video_id in self.nodes[node_uuid].video_set
+
+    def add_video(self, node_uuid, video_id, allow_duplicates=False):
+        """
+        Appends a video ID to a node's IDList.
+
+        Parameters:
+        - allow_duplicates (bool): Append even if the node already has the video
+          (what the YAML pipeline has always done).
+
+        Returns:
+        - bool: True if the IDList changed.
+        Raises KeyError if the node does not exist.
+        """
+        node = self.nodes[node_uuid]
+        if video_id in node.video_set and not allow_duplicates:
+            return False
+        node.video_ids.append(video_id)
+        node.video_set.add(video_id)
+        return True
@@ -0,0 +1,224 @@
+import json
+import os
+import uuid
+from process_tree import ProcessTree
+
+
+def read_jsonl(path, repair=False):
+    """
+    Reads the complete lines of a JSON-lines journal.
+
+    A crash can leave the last line half-written (no newline, or invalid JSON).
+    Reading stops there. With repair=True the file is also truncated to its last
+    complete line, so entries appended afterwards don't end up glued to the torn one.
+
+    Returns:
+    - list: The decoded entries, in order (empty if the file does not exist).
+    """
+    if not os.path.exists(path):
+        return []
+    entries = []
+    good_offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            good_offset += len(line)
+    if repair and good_offset < os.path.getsize(path):
+        print(f"Dropping a half-written entry at the end of '{path}'.")
+        with open(path, 'r+b') as f:
+            f.truncate(good_offset)
+    return entries
+
+
+class ProcessTreeStore:
+    """
+    Keeps a process tree in memory (a ProcessTree) and journals every change.
+
+    The tree file (e.g. process_tree.json) is the snapshot, in the same format as
+    before: a dict of UUID -> {UUID, Step, TreeLevel, IDList, ChildNodeUUID}.
+    Every add/update (or batch of them) is appended as one JSON line to
+    '<file>.journal' instead of rewriting the whole file. Every `compact_every` changes, and on close, the
+    snapshot is rewritten and the journal emptied. Opening a store replays the
+    journal on top of the snapshot, so changes survive a crash.
+    """
+
+    def __init__(self, file, compact_every=500, fsync=False):
+        """
+        Parameters:
+        - file (str): Path to the JSON tree file.
+        - compact_every (int): Number of journaled changes between snapshots.
+        - fsync (bool): Flush every journal entry to disk, not just to the OS.
+        """
+        self.file = file
+        self.journal_file = f"{file}.journal"
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        if not os.path.exists(file) and not os.path.exists(self.journal_file):
+            raise FileNotFoundError(f"The file '{file}' does not exist.")
+        self.tree = ProcessTree()
+        if os.path.exists(file):
+            with open(file, 'r') as json_file:
+                self.tree = ProcessTree.from_dict(json.load(json_file))
+        self.pending = self._replay()
+        self.journal = open(self.journal_file, 'a')
+
+    def _replay(self):
+        """
+        Apply the journal to the snapshot. Returns the number of entries replayed.
+        A torn last entry is cut off, so the journal can be appended to again.
+        """
+        entries = read_jsonl(self.journal_file, repair=True)
+        for entry in entries:
+            if entry['op'] == 'add':
+                self._apply_add(entry['uuid'], entry['parent'], entry['step'], entry['video_id'])
+            elif entry['op'] == 'update':
+                self._apply_update(entry['uuid'], entry['video_id'])
+            elif entry['op'] == 'batch':
+                self._apply_ops(entry['ops'])
+        return len(entries)
+
+    def _apply_add(self, new_uuid, parent_uuid, task, video_id):
+        # Entries can be replayed on a snapshot that already has them; skip those
+        if new_uuid in self.tree:
+            return
+        self.tree.add_node(parent_uuid, task, video_id, new_uuid)
+
+    def _apply_update(self, node_uuid, video_id):
+        self.tree.add_video(node_uuid, video_id)
+
+    def _apply_ops(self, ops):
+        for op in ops:
+            if op['op'] == 'add':
+                self._apply_add(op['uuid'], op['parent'], op['step'], op['video_id'])
+            else:
+                self._apply_update(op['uuid'], op['video_id'])
+
+    def _log(self, entry):
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def add_node(self, parent_uuid, task, video_id):
+        """
+        Adds a new task node under the specified parent UUID.
+
+        Returns:
+        - str: The UUID of the new node, or None if the parent does not exist.
+        """
+        if parent_uuid not in self.tree:
+            return None
+        new_uuid = str(uuid.uuid4())
+        self._apply_add(new_uuid, parent_uuid, task, video_id)
+        self._log({'op': 'add', 'uuid': new_uuid, 'parent': parent_uuid, 'step': task, 'video_id': video_id})
+        return new_uuid
+
+    def update_node(self, node_uuid, video_id):
+        """
+        Adds the video_id to the IDList of a node, if it's not already there.
+
+        Returns:
+        - bool: True if the node was changed, False if it already had the video ID.
+        Raises KeyError if the node does not exist.
+        """
+        if self.tree.has_video(node_uuid, video_id):
+            return False
+        self._apply_update(node_uuid, video_id)
+        self._log({'op': 'update', 'uuid': node_uuid, 'video_id': video_id})
+        return True
+
+    def apply_batch(self, ops):
+        """
+        Applies several adds and updates as one journal entry, so after a crash
+        either all of them or none of them are in the tree.
+
+        Parameters:
+        - ops (list of dict): {'op': 'add', 'uuid', 'parent', 'step', 'video_id'} or
+          {'op': 'update', 'uuid', 'video_id'}, in order. An add's parent can be
+          a node added earlier in the same batch; a missing 'uuid' is generated.
+
+        Returns:
+        - list of str: The UUID of every op's node.
+        Raises ValueError, before changing anything, if a parent or node does not exist.
+        """
+        ops = [dict(op) for op in ops]
+        known = set()
+        for op in ops:
+            if op['op'] == 'add':
+                if op['parent'] not in self.tree and op['parent'] not in known:
+                    raise ValueError(f"Parent UUID {op['parent']} not found")
+                op.setdefault('uuid', str(uuid.uuid4()))
+                known.add(op['uuid'])
+            elif op['op'] == 'update':
+                if op['uuid'] not in self.tree and op['uuid'] not in known:
+                    raise ValueError(f"UUID {op['uuid']} not found")
+            else:
+                raise ValueError(f"Unknown op {op['op']!r}")
+        self._apply_ops(ops)
+        self._log({'op': 'batch', 'ops': ops})
+        return [op['uuid'] for op in ops]
+
+    def export(self, file=None):
+        """
+        Writes the current tree in the JSON file format (indent=4).
+
+        Parameters:
+        - file (str): Destination (default: the store's own file).
+        """
+        file = file or self.file
+        with open(f"{file}.tmp", 'w') as json_output_file:
+            json.dump(self.tree.to_dict(), json_output_file, indent=4)
+            json_output_file.flush()
+            os.fsync(json_output_file.fileno())
+        os.replace(f"{file}.tmp", file)
+
+    def compact(self):
+        """Writes the snapshot and empties the journal."""
+        self.export()
+        # The snapshot already holds every journaled change; replaying them is a no-op,
+        # so a crash between these two steps is harmless
+        self.journal.truncate(0)
+        self.journal.seek(0)
+        self.pending = 0
+
+    def close(self):
+        if self.journal.closed:
+            return
+        if self.pending:
+            self.compact()
+        self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_stores = {}
+
+
+def open_store(file, **kwargs):
+    """
+    Returns the shared ProcessTreeStore of a tree file, opening it on first use.
+    """
+    key = os.path.abspath(file)
+    if key not in _stores or _stores[key].journal.closed:
+        _stores[key] = ProcessTreeStore(file, **kwargs)
+    return _stores[key]
+
+
+def close_stores():
+    """Compacts and closes every store opened with open_store."""
+    for store in _stores.values():
+        store.close()
+    _stores.clear()
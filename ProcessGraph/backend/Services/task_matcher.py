@@ -0,0 +1,294 @@
+"""
+Local matching of tasks against the steps of a process tree.
+
+Every node's Step is embedded once and kept in a nearest-neighbour index. The
+index only short-lists: the LLM still makes the ADD/UPDATE decision, but sees the
+top-k candidate nodes and their parents instead of the whole tree. The one
+decision taken locally is an UPDATE for a task whose normalised words equal an
+existing step's, e.g. "2. Drain the old oil." and "Drain old oil". Similarity
+alone can't tell opposite steps apart ("Loosen the oil filler cap" and "Tighten
+the oil filler cap" score 0.71, above real paraphrases), so it never decides.
+
+The embeddings are hashed word and character n-gram vectors: no model to download,
+deterministic, and good at the paraphrases transcripts produce ("Drain the old
+oil" / "Let the old oil drain completely"). Any `embed(texts) -> array` function
+returning L2-normalised rows can be passed instead.
+
+    python task_matcher.py --csv <transcripts.csv> --tree process_tree.json
+
+replays the transcripts, asks the full-tree LLM prompt for every task as the
+reference, and reports the LLM calls the exact matches avoid, how often they agree
+with the reference, and (with --check-fallback) how often the short-listed prompt does.
+"""
+
+import json
+import os
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+import numpy as np
+
+EMBEDDING_DIM = 2048
+TOP_K = int(os.environ.get('TASK_MATCH_TOP_K', 5))
+
+STOP_WORDS = frozenset(
+    'a an and the to of in on for with my your i i\'ll we you it its this that then '
+    'now next first finally after before by from as at is are be will so all up'.split()
+)
+
+
+def _tokens(text):
+    text = re.sub(r'^\s*(?:step\s*)?\d+[.):-]?\s*', '', text.lower())
+    words = [w for w in re.findall(r"[a-z0-9']+", text) if w not in STOP_WORDS]
+    # Crude stemming, so "draining", "drained" and "drain" share a token
+    return [re.sub(r"(?:'s|ing|ed|es|s)$", '', w) if len(w) > 4 else w for w in words]
+
+
+def normalize_step(text):
+    """The words of a step that matter for exact matching, e.g. 'drain old oil'."""
+    return ' '.join(_tokens(text))
+
+
+def _features(text):
+    words = _tokens(text)
+    features = Counter(f'w:{w}' for w in words)
+    features.update(f'b:{a} {b}' for a, b in zip(words, words[1:]))
+    for w in words:
+        padded = f'<{w}>'
+        features.update(f'c:{padded[i:i + 3]}' for i in range(len(padded) - 2))
+    return features
+
+
+def embed_texts(texts, dim=EMBEDDING_DIM):
+    """
+    Embeds texts as hashed n-gram vectors.
+
+    Parameters:
+    - texts (list of str): Texts to embed.
+    - dim (int): Number of hash buckets.
+
+    Returns:
+    - numpy.ndarray: One L2-normalised float32 row per text.
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    weights = {'w': 1.0, 'b': 1.0, 'c': 0.5}
+    for row, text in enumerate(texts):
+        for feature, count in _features(text).items():
+            bucket = zlib.crc32(feature.encode('utf-8')) % dim
+            vectors[row, bucket] += weights[feature[0]] * (1 + np.log(count))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+@dataclass
+class MatchDecision:
+    """
+    Outcome of matching one task.
+
+    - action (str): 'UPDATE' for an exact match, None when the LLM has to decide.
+    - uuid (str): Node to update (only set for 'UPDATE').
+    - score (float): Similarity of the best candidate.
+    - candidates (list): (uuid, similarity) of the top-k nodes, best first.
+    """
+    action: str
+    uuid: str
+    score: float
+    candidates: list = field(default_factory=list)
+
+
+class TaskMatcher:
+    """
+    Nearest-neighbour index over the Step of every node of a process tree.
+
+    The index follows the tree it was created with: nodes added to the tree
+    (e.g. through ProcessTreeStore.add_node) are embedded on the next lookup.
+    """
+
+    def __init__(self, tree, embed=embed_texts, top_k=TOP_K):
+        """
+        Parameters:
+        - tree (ProcessTree): The process tree, kept by reference.
+        - embed (callable): Function from a list of texts to L2-normalised rows.
+        - top_k (int): Number of candidates handed to the LLM.
+        """
+        self.tree = tree
+        self.embed = embed
+        self.top_k = top_k
+        self.uuids = []
+        self.rows = {}
+        # normalize_step(Step) -> UUID of the first node with that step
+        self.exact = {}
+        self.vectors = None
+        self.last_node = {}
+        self.stats = Counter()
+
+    def sync(self):
+        """Embeds the nodes added to the tree since the last call."""
+        if len(self.rows) == len(self.tree):
+            return
+        new_uuids = [node_uuid for node_uuid in self.tree if node_uuid not in self.rows]
+        new_vectors = self.embed([self.tree[node_uuid].step or '' for node_uuid in new_uuids])
+        self.vectors = new_vectors if self.vectors is None else np.vstack([self.vectors, new_vectors])
+        for node_uuid in new_uuids:
+            self.rows[node_uuid] = len(self.uuids)
+            self.uuids.append(node_uuid)
+            self.exact.setdefault(normalize_step(self.tree[node_uuid].step or ''), node_uuid)
+
+    def search(self, task, k=None):
+        """
+        Returns the (uuid, similarity) of the k nodes most similar to the task, best first.
+        """
+        self.sync()
+        if not self.uuids:
+            return []
+        k = min(k or self.top_k, len(self.uuids))
+        scores = self.vectors @ self.embed([task])[0]
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.uuids[i], float(scores[i])) for i in best]
+
+    def match(self, task):
+        """
+        Decides UPDATE locally when the task is exactly an existing step (after
+        normalize_step); otherwise returns the short-listed candidates for the LLM.
+        """
+        candidates = self.search(task)
+        score = candidates[0][1] if candidates else 0.0
+        node_uuid = self.exact.get(normalize_step(task))
+        if node_uuid is not None and normalize_step(task):
+            self.stats['local_updates'] += 1
+            return MatchDecision('UPDATE', node_uuid, 1.0, candidates)
+        self.stats['llm_fallbacks'] += 1
+        return MatchDecision(None, None, score, candidates)
+
+    def placed(self, video_id, node_uuid):
+        """Remembers the node a video's latest task went to, the likely parent of its next one."""
+        if node_uuid in self.tree:
+            self.last_node[video_id] = node_uuid
+
+    def candidate_nodes(self, decision, video_id=None):
+        """
+        The part of the tree the LLM needs for an ambiguous task: the candidates,
+        their parents, the root(s), and the node of the video's previous task.
+
+        Returns:
+        - dict: UUID -> {UUID, Step, TreeLevel, ParentUUID, Similarity (candidates only)}.
+        """
+        parents = self.tree.parents
+        similarity = dict(decision.candidates)
+        wanted = list(similarity)
+        wanted += [parents[node_uuid] for node_uuid in similarity if node_uuid in parents]
+        wanted += [node.uuid for node in self.tree.roots()]
+        if video_id in self.last_node:
+            wanted.append(self.last_node[video_id])
+
+        nodes = {}
+        for node_uuid in wanted:
+            if node_uuid in nodes or node_uuid not in self.tree:
+                continue
+            node = self.tree[node_uuid]
+            nodes[node_uuid] = {
+                'UUID': node_uuid,
+                'Step': node.step,
+                'TreeLevel': node.level,
+                'ParentUUID': parents.get(node_uuid),
+            }
+            if node_uuid in similarity:
+                nodes[node_uuid]['Similarity'] = round(similarity[node_uuid], 3)
+        return nodes
+
+
+_matchers = {}
+
+
+def open_matcher(file, **kwargs):
+    """
+    Returns the shared TaskMatcher of a tree file, over the tree of its shared store.
+    """
+    from process_tree_store import open_store
+
+    store = open_store(file)
+    key = os.path.abspath(file)
+    if key not in _matchers or _matchers[key].tree is not store.tree:
+        _matchers[key] = TaskMatcher(store.tree, **kwargs)
+    return _matchers[key]
+
+
+def evaluate(csv_file, json_file, top_k=TOP_K, check_fallback=False):
+    """
+    Replays the transcripts of a CSV file and compares the matcher with the full-tree LLM prompt.
+
+    Every task is decided by the full-tree prompt (the reference, which is also what
+    gets applied to the tree) and by the matcher. Runs on a copy of the tree, so the
+    tree file is left untouched. With LLM_MODE=record/replay, reruns cost nothing.
+
+    Parameters:
+    - csv_file (str): CSV with Video_ID and Transcript columns.
+    - json_file (str): Initial process tree.
+    - check_fallback (bool): Also ask the top-k prompt for the ambiguous tasks and
+      compare its decision with the reference (one more LLM call per ambiguous task).
+
+    Returns:
+    - dict: Task counts, LLM calls avoided and agreement rates.
+    """
+    import pandas as pd
+    from process_tree import ProcessTree
+    from tools import ask_placement, make_tasks
+
+    with open(json_file, 'r') as f:
+        tree = ProcessTree.from_dict(json.load(f))
+    matcher = TaskMatcher(tree, top_k=top_k)
+    report = Counter()
+
+    for _, row in pd.read_csv(csv_file).iterrows():
+        video_id = row['Video_ID']
+        for task in make_tasks(row['Transcript']):
+            report['tasks'] += 1
+            reference = ask_placement(task, tree.to_dict())
+            decision = matcher.match(task)
+
+            if decision.action == 'UPDATE':
+                report['local_updates'] += 1
+                report['local_updates_agreeing'] += reference == ('UPDATE', decision.uuid)
+            elif check_fallback:
+                fallback = ask_placement(task, matcher.candidate_nodes(decision, video_id), candidates=True)
+                report['fallbacks_checked'] += 1
+                report['fallbacks_agreeing'] += fallback == reference
+
+            if reference is None:
+                report['reference_unparsed'] += 1
+                continue
+            action, node_uuid = reference
+            if action == 'ADD' and node_uuid in tree:
+                new_uuid = f'eval-{report["tasks"]}'
+                tree.add_node(node_uuid, task, video_id, new_uuid)
+                matcher.placed(video_id, new_uuid)
+            elif action == 'UPDATE' and node_uuid in tree:
+                tree.add_video(node_uuid, video_id)
+                matcher.placed(video_id, node_uuid)
+
+    tasks = report['tasks'] or 1
+    summary = dict(report)
+    summary['llm_calls_avoided'] = report['local_updates']
+    summary['llm_calls_avoided_rate'] = round(report['local_updates'] / tasks, 3)
+    if report['local_updates']:
+        summary['local_update_agreement'] = round(report['local_updates_agreeing'] / report['local_updates'], 3)
+    if report['fallbacks_checked']:
+        summary['fallback_agreement'] = round(report['fallbacks_agreeing'] / report['fallbacks_checked'], 3)
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare the task matcher with the full-tree LLM prompt')
+    parser.add_argument(
+        '--csv',
+        default='ProcessGraph/backend/MockData/Unique_First-Person_Video_Transcripts_for_Mini_Cooper_2015_Oil_Change.csv',
+    )
+    parser.add_argument('--tree', default='process_tree.json')
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--check-fallback', action='store_true')
+    args = parser.parse_args()
+    print(json.dumps(evaluate(args.csv, args.tree, args.top_k, args.check_fallback), indent=4))
@@ -1,22 +1,31 @@
 import json
-import uuid
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_client import get_client
+from process_tree_store import close_stores, open_store
+from task_matcher import open_matcher
+from tree_checkpoints import TreeCheckpoints
+from tree_renderer import RENDER_EVERY, TreeRenderer, tree_snapshot
 import re
+import uuid
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Transcripts whose tasks are extracted at the same time
+MAX_WORKERS = int(os.environ.get("PROCESS_GRAPH_WORKERS", 4))
+
 def initialize_tree_with_openai(name, content):
     """
     Initialize a tree structure for a process tree using OpenAI API and store it in a JSON file.
     """
-    client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    client = get_client('openai')
     prompt = """
     Create a tree structure for a process tree in JSON format. The tree should include:
     - UUID: A unique identifier for each node.
@@ -71,7 +80,7 @@ def make_tasks(content):
     Break the video content into simple tasks using OpenAI API.
     """
     try:
-        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+        client = get_client('openai')
         prompt = """
         The following is a video transcript. Break it down into simple, actionable tasks. Ensure that the tasks are relevant to the work being done in the video. Keep each task concise and clear.
         """
@@ -91,16 +100,7 @@ def make_tasks(content):
         return []
 
 
-def get_uuid(task, filepath, videoid):
-    """
-    Determines the UUID for the task in the JSON file or adds the task if not present.
-    """
-    try:
-        with open(filepath, 'r') as json_file:
-            tree = json.load(json_file)
-
-        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
-        prompt = f"""
+PLACEMENT_PROMPT = """
         You will be given a JSON file representing a process tree.
         Each key in the JSON is a UUID, and each value is a node with attributes:
         - TreeLevel
@@ -119,89 +119,270 @@ def get_uuid(task, filepath, videoid):
 
         Task: "{task}"
         JSON Tree:
-        {json.dumps(tree, indent=4)}
+        {tree}
         """
-        completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": prompt}],
-            stream=False,
-            max_tokens=150,
-        )
-        result = completion.choices[0].message.content.strip()
 
-        print(f"OpenAI Response for Task '{task}': {result}")
+CANDIDATES_PROMPT = """
+        You will be given part of a process tree in JSON format: the existing steps most
+        similar to a task, their parents, the root node, and the step that came before
+        this task in the same video. Each key is a UUID, and each value is a node with
+        attributes:
+        - TreeLevel
+        - Step
+        - ParentUUID
+        - Similarity (for the steps most similar to the task)
 
-        # Parse the action and extract the UUID
-        action_match = re.search(r"Action:\s*(ADD|UPDATE)", result, re.IGNORECASE)
-        uuid_match = re.search(r"UUID:\s*([\w-]+)", result, re.IGNORECASE)
+        You will also be given a task. Determine whether this task already exists in the process tree.
 
-        if action_match and uuid_match:
-            action = action_match.group(1).upper()
-            uuid_value = uuid_match.group(1)  # Extract the clean UUID
+        - If a similar task exists, specify that the action should be UPDATE and provide the UUID of the existing task.
+        - If the task does not exist, specify that the action should be ADD, provide the UUID of the parent node where it would be the next step, and include the task description. I want a flat structure, so the task should be added as a child of the parent node.
 
-            # Call the appropriate function
-            if action == "ADD":
-                add_node(uuid_value, task, filepath, videoid)
-            elif action == "UPDATE":
-                update_node(uuid_value, videoid, filepath)
-            else:
-                print("Unexpected action returned.")
+        Output format:
+        - For ADD: Action: ADD, UUID: <Parent_UUID>, TASK: "<Task Description>"
+        - For UPDATE: Action: UPDATE, UUID: <Existing_Task_UUID>
+
+        Task: "{task}"
+        Candidate Nodes:
+        {tree}
+        """
+
+
+def ask_placement(task, nodes, candidates=False):
+    """
+    Asks the LLM where a task belongs in the process tree.
+
+    Parameters:
+    - task (str): The task description.
+    - nodes (dict): The whole tree, or the candidate nodes from TaskMatcher.candidate_nodes.
+    - candidates (bool): Whether `nodes` are candidate nodes rather than the whole tree.
+
+    Returns:
+    - tuple: (action, uuid) with action 'ADD' (uuid of the parent) or 'UPDATE'
+      (uuid of the existing node), or None if the response could not be parsed.
+    """
+    client = get_client('openai')
+    prompt = (CANDIDATES_PROMPT if candidates else PLACEMENT_PROMPT).format(
+        task=task, tree=json.dumps(nodes, indent=4)
+    )
+    completion = client.chat.completions.create(
+        model="gpt-4",
+        messages=[{"role": "system", "content": prompt}],
+        stream=False,
+        max_tokens=150,
+    )
+    result = completion.choices[0].message.content.strip()
+
+    print(f"OpenAI Response for Task '{task}': {result}")
+
+    # Parse the action and extract the UUID
+    action_match = re.search(r"Action:\s*(ADD|UPDATE)", result, re.IGNORECASE)
+    uuid_match = re.search(r"UUID:\s*([\w-]+)", result, re.IGNORECASE)
+
+    if action_match and uuid_match:
+        return action_match.group(1).upper(), uuid_match.group(1)  # Clean UUID
+    print("Unable to parse the response. Ensure the prompt generates clear output.")
+    print(f"Response: {result}")
+    return None
+
+
+def get_uuid(task, filepath, videoid):
+    """
+    Determines the UUID for the task in the JSON file or adds the task if not present.
+    The task matcher decides UPDATE locally when the task is exactly an existing step;
+    otherwise the LLM decides, seeing only the short-listed candidate nodes.
+    """
+    try:
+        matcher = open_matcher(filepath)
+        decision = matcher.match(task)
+        if decision.action == "UPDATE":
+            print(f"Matched Task '{task}' exactly to node {decision.uuid}")
+            placement = ("UPDATE", decision.uuid)
+        else:
+            placement = ask_placement(task, matcher.candidate_nodes(decision, videoid), candidates=True)
+        if placement is None:
+            return
+
+        action, uuid_value = placement
+        # Call the appropriate function
+        if action == "ADD":
+            uuid_value = add_node(uuid_value, task, filepath, videoid)
+        elif action == "UPDATE":
+            update_node(uuid_value, videoid, filepath)
         else:
-            print("Unable to parse the response. Ensure the prompt generates clear output.")
-            print(f"Response: {result}")
+            print("Unexpected action returned.")
+        matcher.placed(videoid, uuid_value)
     except Exception as e:
         print(f"Error processing content with OpenAI: {e}")
 
 
+BATCH_PLACEMENT_MODEL = os.environ.get("BATCH_PLACEMENT_MODEL", "gpt-4o")
+
+BATCH_PLACEMENT_PROMPT = """
+        You will be given part of a process tree in JSON format: the existing steps most
+        similar to the tasks below, their parents, and the root node. Each key is a UUID,
+        and each value is a node with attributes:
+        - TreeLevel
+        - Step
+        - ParentUUID
+        - Similarity (for the steps most similar to one of the tasks)
+
+        You will also be given the tasks of one video, numbered in the order they are done.
+        Some are already placed in the tree. For every other task, determine whether it
+        already exists in the process tree.
+
+        - If a similar task exists, the action is UPDATE and the uuid is the UUID of the existing task.
+        - If the task does not exist, the action is ADD and the uuid is the UUID of the parent node where it would be the next step. I want a flat structure, so the task should be added as a child of the parent node.
+        - The parent of a task can also be an earlier task of this video: use "TASK-<number>" as its uuid.
+
+        Return one placement per task that is not placed yet.
+
+        Tasks:
+        {tasks}
+        Candidate Nodes:
+        {tree}
+        """
+
+PLACEMENT_SCHEMA = {
+    "name": "task_placements",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "placements": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "task": {"type": "integer"},
+                        "action": {"type": "string", "enum": ["ADD", "UPDATE"]},
+                        "uuid": {"type": "string"},
+                    },
+                    "required": ["task", "action", "uuid"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["placements"],
+        "additionalProperties": False,
+    },
+}
+
+
+def ask_batch_placement(tasks, placed, nodes):
+    """
+    Asks the LLM, in one structured-output call, where every task of a video belongs.
+
+    Parameters:
+    - tasks (list of str): The video's tasks, in order.
+    - placed (dict): Task index -> UUID of the tasks that are already placed.
+    - nodes (dict): Candidate nodes, as from TaskMatcher.candidate_nodes.
+
+    Returns:
+    - dict: Task index -> (action, uuid), where uuid can be "TASK-<number>" (1-based).
+    """
+    client = get_client('openai')
+    task_lines = "\n        ".join(
+        f'{i + 1}. "{task}"' + (f" (already placed: UPDATE {placed[i]})" if i in placed else "")
+        for i, task in enumerate(tasks)
+    )
+    prompt = BATCH_PLACEMENT_PROMPT.format(tasks=task_lines, tree=json.dumps(nodes, indent=4))
+    completion = client.chat.completions.create(
+        model=BATCH_PLACEMENT_MODEL,
+        messages=[{"role": "system", "content": prompt}],
+        response_format={"type": "json_schema", "json_schema": PLACEMENT_SCHEMA},
+        stream=False,
+    )
+    result = json.loads(completion.choices[0].message.content)
+    print(f"OpenAI Placements for {len(tasks)} tasks: {result}")
+    return {p["task"] - 1: (p["action"], p["uuid"]) for p in result["placements"]}
+
+
+def place_tasks(tasks, filepath, videoid):
+    """
+    Places all tasks of a video in the JSON tree with at most one LLM call.
+
+    Tasks that exactly match an existing step are updated locally; the LLM places the others
+    in one structured-output call. All changes are validated first and then applied as
+    one journal entry, so the tree never holds half a video. If the response doesn't
+    cover every task, or refers to unknown nodes, the tasks are placed one by one
+    with get_uuid instead.
+
+    Parameters:
+    - tasks (list of str): The video's tasks, in order.
+    - filepath (str): Path to the JSON file.
+    - videoid (str): The video ID.
+    """
+    try:
+        store = open_store(filepath)
+        matcher = open_matcher(filepath)
+        placed = {}
+        nodes = {}
+        for i, task in enumerate(tasks):
+            decision = matcher.match(task)
+            if decision.action == "UPDATE":
+                placed[i] = decision.uuid
+            else:
+                nodes.update(matcher.candidate_nodes(decision, videoid))
+
+        placements = {}
+        if len(placed) < len(tasks):
+            placements = ask_batch_placement(tasks, placed, nodes)
+        placements.update((i, ("UPDATE", node_uuid)) for i, node_uuid in placed.items())
+
+        # Resolve TASK-<number> references, which may only point to earlier tasks
+        ops = []
+        task_uuids = []
+        for i, task in enumerate(tasks):
+            if i not in placements:
+                raise ValueError(f"No placement for task {i + 1}")
+            action, uuid_value = placements[i]
+            reference = re.fullmatch(r"TASK-(\d+)", uuid_value, re.IGNORECASE)
+            if reference:
+                index = int(reference.group(1)) - 1
+                if not 0 <= index < i:
+                    raise ValueError(f"Task {i + 1} refers to {uuid_value}, which is not an earlier task")
+                uuid_value = task_uuids[index]
+            if action == "ADD":
+                ops.append({"op": "add", "uuid": str(uuid.uuid4()), "parent": uuid_value, "step": task, "video_id": videoid})
+                task_uuids.append(ops[-1]["uuid"])
+            else:
+                ops.append({"op": "update", "uuid": uuid_value, "video_id": videoid})
+                task_uuids.append(uuid_value)
+
+        store.apply_batch(ops)
+        if task_uuids:
+            matcher.placed(videoid, task_uuids[-1])
+        added = sum(op["op"] == "add" for op in ops)
+        print(f"Placed {len(tasks)} tasks of video {videoid}: {added} added, {len(tasks) - added} updated.")
+    except Exception as e:
+        print(f"Batch placement failed for video {videoid} ({e}); placing tasks one by one.")
+        for task in tasks:
+            get_uuid(task, filepath, videoid)
+
+
 def add_node(parent_uuid, task, file, video_id):
     """
-    Adds a new task node to the JSON file under the specified parent UUID.
+    Adds a new task node to the JSON tree under the specified parent UUID.
+    The change goes to the tree's journal; the JSON file is rewritten on compaction.
 
     Parameters:
     - parent_uuid (str): The UUID of the parent node under which the new node will be added.
     - task (str): The task description for the new node.
     - file (str): Path to the JSON file.
     - video_id (str): The video ID associated with the new task.
+
+    Returns:
+    - str: The UUID of the new node, or None if it was not added.
     """
     try:
-        with open(file, 'r') as json_file:
-            tree = json.load(json_file)
-
-        # Generate a new UUID for the new node
-        new_uuid = str(uuid.uuid4())
-
-        # Create the new node
-        new_node = {
-            'UUID': new_uuid,
-            'Step': task,
-            'TreeLevel': None,  # Will set this later
-            'IDList': [video_id],
-            'ChildNodeUUID': []
-        }
-
-        # Find the parent node
-        parent_node = tree.get(parent_uuid)
-
-        if parent_node:
-            # Update the parent's ChildNodeUUID list
-            parent_node.setdefault('ChildNodeUUID', []).append(new_uuid)
-
-            # Set the TreeLevel of the new node
-            parent_level = parent_node.get('TreeLevel', 0)
-            new_node['TreeLevel'] = parent_level + 1
-
-            # Add the new node to the tree
-            tree[new_uuid] = new_node
-            print(f"Added new node with UUID {new_uuid} under parent UUID {parent_uuid}.")
-        else:
+        new_uuid = open_store(file).add_node(parent_uuid, task, video_id)
+        if new_uuid is None:
             print(f"Parent UUID {parent_uuid} not found in the JSON file.")
             return
 
-        # Write the updated tree back to the file
-        with open(file, 'w') as json_output_file:
-            json.dump(tree, json_output_file, indent=4)
-
+        print(f"Added new node with UUID {new_uuid} under parent UUID {parent_uuid}.")
         print(f"Task '{task}' added successfully under parent UUID {parent_uuid}.")
+        return new_uuid
 
     except FileNotFoundError:
         print(f"The file '{file}' does not exist.")
@@ -213,7 +394,7 @@ def add_node(parent_uuid, task, file, video_id):
 
 def update_node(node_uuid, video_id, file):
     """
-    Updates the node with the given UUID in the JSON file by adding the video_id to the IDList field,
+    Updates the node with the given UUID in the JSON tree by adding the video_id to the IDList field,
     only if it's not already present.
 
     Parameters:
@@ -222,28 +403,14 @@ def update_node(node_uuid, video_id, file):
     - file (str): Path to the JSON file.
     """
     try:
-        with open(file, 'r') as json_file:
-            tree = json.load(json_file)
-
-        # Find the node to update
-        node_to_update = tree.get(node_uuid)
+        store = open_store(file)
 
-        if node_to_update:
-            # Initialize IDList if it doesn't exist
-            id_list = node_to_update.setdefault('IDList', [])
-
-            if video_id in id_list:
-                print(f"Video ID '{video_id}' already exists in node UUID {node_uuid}. No action taken.")
-            else:
-                # Append the video_id to the IDList
-                id_list.append(video_id)
+        if node_uuid in store.tree:
+            if store.update_node(node_uuid, video_id):
                 print(f"Appended Video ID '{video_id}' to node UUID {node_uuid}.")
-
-                # Write the updated tree back to the file
-                with open(file, 'w') as json_output_file:
-                    json.dump(tree, json_output_file, indent=4)
-
                 print(f"Video ID '{video_id}' appended successfully for UUID {node_uuid}.")
+            else:
+                print(f"Video ID '{video_id}' already exists in node UUID {node_uuid}. No action taken.")
         else:
             print(f"UUID {node_uuid} not found in the JSON file.")
 
@@ -264,8 +431,7 @@ def plot_json_tree(json_file, output_image="json_tree.png"):
     - output_image (str): Filename for the saved plot image.
     """
     try:
-        with open(json_file, 'r') as file:
-            tree = json.load(file)
+        tree = open_store(json_file).tree.to_dict()
 
         G = nx.DiGraph()
 
@@ -327,10 +493,44 @@ def backup_json(file):
         print(f"Error creating backup: {e}")
 
 
-def main():
+def make_tasks_in_order(transcripts, max_workers=MAX_WORKERS):
+    """
+    Runs make_tasks for many transcripts concurrently and yields the results in input order.
+
+    At most 2 * max_workers transcripts are in flight, so results never pile up
+    while the consumer is busy with an earlier one.
+
+    Parameters:
+    - transcripts (iterable of str): The transcripts.
+    - max_workers (int): Number of concurrent make_tasks calls.
+
+    Yields:
+    - list of str: The tasks of each transcript.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for transcript in transcripts:
+            in_flight.append(executor.submit(make_tasks, transcript))
+            if len(in_flight) >= 2 * max_workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def main(batch_placement=True, max_workers=MAX_WORKERS, render_every=RENDER_EVERY):
     """
     Main function to process the CSV file and update the JSON tree.
-    After processing each row, it plots the JSON tree.
+    Every `render_every` rows, and at the end, it plots the JSON tree in the background.
+
+    Tasks are extracted from several transcripts at once, but the tree is only
+    changed here, one row at a time in CSV order, so the result is the same as
+    processing the rows one after the other.
+
+    Parameters:
+    - batch_placement (bool): Place all tasks of a video with one LLM call (place_tasks)
+      instead of one get_uuid call per task.
+    - max_workers (int): Number of transcripts whose tasks are extracted concurrently.
+    - render_every (int): Plot the tree after every N rows; 0 plots only the final tree.
     """
     csv_file = "ProcessGraph/backend/MockData/Unique_First-Person_Video_Transcripts_for_Mini_Cooper_2015_Oil_Change.csv"
     json_file = "process_tree.json"
@@ -361,21 +561,37 @@ def main():
         initialize_tree_with_openai("process_tree", first_row_string)
         plot_json_tree(json_file, output_image="json_tree_initial.png")
 
+    renderer = TreeRenderer(every=render_every, title="JSON Task Tree")
+    # Version history of the tree, one version per row
+    checkpoints = TreeCheckpoints(f"{json_file}.checkpoints")
+
     # Process each row in the CSV
-    for index, row in df.iterrows():
+    all_tasks = make_tasks_in_order(df['Transcript'], max_workers)
+    for (index, row), tasks in zip(df.iterrows(), all_tasks):
         video_id = row['Video_ID']
-        transcript = row['Transcript']
 
-        tasks = make_tasks(transcript)
         print(f"\n[Row {index + 1}] Generated Tasks for Video ID {video_id}: {tasks}")
 
         # Update the JSON tree with tasks
-        for task in tasks:
-            get_uuid(task, json_file, video_id)
+        if batch_placement:
+            place_tasks(tasks, json_file, video_id)
+        else:
+            for task in tasks:
+                get_uuid(task, json_file, video_id)
+
+        checkpoints.checkpoint(open_store(json_file).tree, label=f"row {index + 1} ({video_id})")
 
-        # Plot the JSON tree after processing each row
+        # Plot the JSON tree after processing the row, if it's due
         output_image = f"json_tree_after_row_{index + 1}.png"
-        plot_json_tree(json_file, output_image=output_image)
+        renderer.row_done(index + 1, lambda: tree_snapshot(open_store(json_file).tree), output_image)
+
+    renderer.close(tree_snapshot(open_store(json_file).tree), "json_tree_final.png")
+
+    stats = open_matcher(json_file).stats
+    print(f"Tasks matched locally: {stats['local_updates']}, sent to the LLM: {stats['llm_fallbacks']}")
+
+    # Write the final tree to the JSON file
+    close_stores()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""
+Versioned process-tree checkpoints: a base snapshot plus compact per-row diffs.
+
+A checkpoint directory holds:
+- base-<version>.ptree: binary snapshots (tree_serialization.save_snapshot);
+- diffs-<version>.jsonl: one line per later version, with the nodes added and
+  the video IDs appended since the previous version.
+
+Restoring a version loads the newest base at or before it and applies the diffs
+after that base, so the cost follows the diff chain, not the history. A new base
+is written once the diffs since the last one add up to `rebase_ratio` times the
+tree size, so disk use grows with the number of changes rather than rows x tree size.
+
+    python tree_checkpoints.py process_tree.json.checkpoints list
+    python tree_checkpoints.py process_tree.json.checkpoints restore 12 tree_v12.json
+"""
+
+import json
+import os
+import re
+import time
+from process_tree import TreeNode
+from process_tree_store import read_jsonl
+from tree_serialization import load_snapshot, save_snapshot, save_tree
+
+
+class TreeCheckpoints:
+    """
+    Checkpoints of one process tree, in a directory (created if missing).
+    """
+
+    def __init__(self, directory, rebase_ratio=0.5):
+        """
+        Parameters:
+        - directory (str): Checkpoint directory, e.g. 'process_tree.json.checkpoints'.
+        - rebase_ratio (float): Write a new base once the changes since the last one
+          reach this fraction of the tree's node count.
+        """
+        self.directory = directory
+        self.rebase_ratio = rebase_ratio
+        os.makedirs(directory, exist_ok=True)
+        self.bases = sorted(
+            int(match.group(1))
+            for match in map(re.compile(r'base-(\d+)\.ptree$').match, os.listdir(directory))
+            if match
+        )
+        self.head = None
+        self.ops_since_base = 0
+        # IDList length of every node at the head version, to find what changed
+        self.video_counts = {}
+        if self.bases:
+            # Only the newest diffs file is appended to; cut a torn last line off it
+            entries = read_jsonl(self._diffs_path(self.bases[-1]), repair=True)
+            if not entries:
+                # Crashed between writing the base and its first line
+                self._write_base_entry(self.bases[-1], None)
+            self.head = entries[-1]['version'] if entries else self.bases[-1]
+            self.ops_since_base = sum(len(entry.get('ops', ())) for entry in entries)
+            tree = self.load()
+            self.video_counts = {node.uuid: len(node.video_ids) for node in tree.values()}
+
+    def _base_path(self, version):
+        return os.path.join(self.directory, f'base-{version:06d}.ptree')
+
+    def _diffs_path(self, base):
+        return os.path.join(self.directory, f'diffs-{base:06d}.jsonl')
+
+    def _read_diffs(self, base):
+        """The diff entries written after a base, in order."""
+        return read_jsonl(self._diffs_path(base))
+
+    def _write_base_entry(self, version, label):
+        # The label of a base version is the first line of its diffs file
+        with open(self._diffs_path(version), 'w') as f:
+            f.write(json.dumps({'version': version, 'label': label, 'time': time.time(), 'base': True}) + '\n')
+
+    def _diff(self, tree):
+        ops = []
+        for node in tree.values():
+            seen = self.video_counts.get(node.uuid)
+            if seen is None:
+                op = {
+                    'op': 'add',
+                    'uuid': node.uuid,
+                    'parent': tree.parents.get(node.uuid),
+                    'step': node.step,
+                    'level': node.level,
+                    'video_ids': list(node.video_ids),
+                }
+                if node.key != node.uuid:
+                    op['key'] = node.key
+                if node.extra:
+                    op['extra'] = node.extra
+                ops.append(op)
+            elif len(node.video_ids) > seen:
+                ops.append({'op': 'videos', 'uuid': node.uuid, 'video_ids': node.video_ids[seen:]})
+        return ops
+
+    @staticmethod
+    def _apply(tree, ops):
+        for op in ops:
+            if op['op'] == 'add':
+                node = TreeNode(
+                    op['uuid'], op['step'], op['level'], op['video_ids'],
+                    key=op.get('key'), extra=op.get('extra'),
+                )
+                tree.insert(node, op['parent'])
+            else:
+                for video_id in op['video_ids']:
+                    tree.add_video(op['uuid'], video_id, allow_duplicates=True)
+
+    def checkpoint(self, tree, label=None):
+        """
+        Records the tree's current state as a new version.
+
+        Parameters:
+        - tree (ProcessTree): The tree; only nodes added and video IDs appended since
+          the previous checkpoint are stored.
+        - label (str): Optional name of the version, e.g. 'row 12'.
+
+        Returns:
+        - int: The new version number (0 for the first checkpoint).
+        """
+        if not self.bases:
+            return self._rebase(tree, 0, label)
+        ops = self._diff(tree)
+        version = self.head + 1
+        if self.ops_since_base + len(ops) >= max(1, self.rebase_ratio * len(tree)):
+            return self._rebase(tree, version, label)
+
+        entry = {'version': version, 'label': label, 'time': time.time(), 'ops': ops}
+        with open(self._diffs_path(self.bases[-1]), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.head = version
+        self.ops_since_base += len(ops)
+        for op in ops:
+            if op['op'] == 'add':
+                self.video_counts[op['uuid']] = len(op['video_ids'])
+            else:
+                self.video_counts[op['uuid']] += len(op['video_ids'])
+        return version
+
+    def _rebase(self, tree, version, label):
+        save_snapshot(tree, self._base_path(version))
+        self._write_base_entry(version, label)
+        self.bases.append(version)
+        self.head = version
+        self.ops_since_base = 0
+        self.video_counts = {node.uuid: len(node.video_ids) for node in tree.values()}
+        return version
+
+    def versions(self):
+        """
+        Returns:
+        - list of dict: {version, label, time, changes, base} for every version.
+        """
+        versions = []
+        for base in self.bases:
+            for entry in self._read_diffs(base):
+                versions.append({
+                    'version': entry['version'],
+                    'label': entry.get('label'),
+                    'time': entry.get('time'),
+                    'changes': len(entry.get('ops', ())),
+                    'base': bool(entry.get('base')),
+                })
+        return versions
+
+    def load(self, version=None):
+        """
+        Reconstructs a version (default: the latest).
+
+        Returns:
+        - ProcessTree: The tree as it was at that checkpoint.
+        Raises KeyError if the version does not exist.
+        """
+        if not self.bases:
+            raise KeyError('No checkpoints yet')
+        candidates = [base for base in self.bases if version is None or base <= version]
+        if not candidates:
+            raise KeyError(f'No version {version}')
+        base = candidates[-1]
+        tree = load_snapshot(self._base_path(base))
+        head = base
+        for entry in self._read_diffs(base):
+            if entry.get('base'):
+                continue
+            if version is not None and entry['version'] > version:
+                break
+            self._apply(tree, entry['ops'])
+            head = entry['version']
+        if version is not None and head != version:
+            raise KeyError(f'No version {version}')
+        return tree
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List and restore process tree checkpoints')
+    parser.add_argument('directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List the versions')
+    restore = subparsers.add_parser('restore', help='Write a version to a .json, .yaml or .ptree file')
+    restore.add_argument('version', type=int)
+    restore.add_argument('output')
+    args = parser.parse_args()
+
+    checkpoints = TreeCheckpoints(args.directory)
+    if args.command == 'list':
+        for entry in checkpoints.versions():
+            kind = 'base' if entry['base'] else f"{entry['changes']} changes"
+            print(f"{entry['version']:>6}  {entry['label'] or '':<20} {kind}")
+    else:
+        save_tree(checkpoints.load(args.version), args.output)
+        print(f"Version {args.version} written to '{args.output}'.")
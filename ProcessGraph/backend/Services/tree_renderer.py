@@ -0,0 +1,156 @@
+"""
+Throttled, incremental rendering of process trees.
+
+    renderer = TreeRenderer(every=5, title="JSON Task Tree")
+    for row ...:
+        ...update the tree...
+        renderer.row_done(row_number, lambda: tree_snapshot(tree), f"json_tree_after_row_{row_number}.png")
+    renderer.close(tree_snapshot(tree), "json_tree_final.png")
+
+Nodes are laid out by TreeLevel (one row of the picture per level), and every node
+keeps the position it got when it first appeared, so the layout is deterministic
+and only new nodes are placed. Drawing happens on a background thread with the Agg
+backend, never on the thread that updates the tree; if rendering falls behind,
+a pending picture is replaced by the newer one.
+"""
+
+import os
+import threading
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import networkx as nx
+
+# Render after every N rows; 0 renders only the final tree (tree_checkpoints keeps the history)
+RENDER_EVERY = int(os.environ.get("PROCESS_GRAPH_RENDER_EVERY", 0))
+
+
+def tree_snapshot(tree):
+    """
+    Copies what the renderer needs out of a process tree.
+
+    Parameters:
+    - tree (ProcessTree): The tree to draw.
+
+    Returns:
+    - list of tuple: (uuid, step, tree_level, parent_uuid) per node, in tree order.
+    """
+    return [
+        (node.uuid, node.step or 'No Step', node.level or 0, tree.parents.get(node.uuid))
+        for node in tree.values()
+    ]
+
+
+class TreeLayout:
+    """
+    Hierarchical layout keyed on TreeLevel. A new node goes to the first free slot of
+    its level at or right of its parent; placed nodes never move.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.next_slot = {}
+
+    def update(self, nodes):
+        """Places the nodes that have no position yet. Returns the positions."""
+        for node_uuid, _, level, parent_uuid in nodes:
+            if node_uuid in self.positions:
+                continue
+            parent_x = self.positions[parent_uuid][0] if parent_uuid in self.positions else 0
+            x = max(self.next_slot.get(level, 0), parent_x)
+            self.next_slot[level] = x + 1
+            self.positions[node_uuid] = (x, -level)
+        return self.positions
+
+
+class TreeRenderer:
+    """
+    Renders tree snapshots to PNG files on a background thread, at a row cadence.
+    """
+
+    def __init__(self, every=RENDER_EVERY, title="Task Tree"):
+        """
+        Parameters:
+        - every (int): Render after every N rows; 0 renders only on close.
+        - title (str): Title of the pictures.
+        """
+        self.every = every
+        self.title = title
+        self.layout = TreeLayout()
+        self.pending = None
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="tree-renderer", daemon=True)
+        self.thread.start()
+
+    def row_done(self, row_number, nodes, output_image):
+        """
+        Renders the tree if the cadence says so.
+
+        Parameters:
+        - row_number (int): 1-based number of the row just processed.
+        - nodes (callable): Returns the tree_snapshot to draw; only called when rendering.
+        - output_image (str): Filename for the saved plot image.
+        """
+        if self.every and row_number % self.every == 0:
+            self.submit(nodes(), output_image)
+
+    def submit(self, nodes, output_image):
+        """Queues a snapshot for rendering, replacing a pending one that hasn't started."""
+        with self.condition:
+            if self.pending is not None:
+                print(f"Rendering is behind; skipping '{self.pending[1]}'.")
+            self.pending = (nodes, output_image)
+            self.condition.notify()
+
+    def close(self, nodes=None, output_image=None):
+        """
+        Renders the final tree (if given), waits for rendering to finish, and stops the thread.
+        """
+        if nodes is not None:
+            self.submit(nodes, output_image)
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                nodes, output_image = self.pending
+                self.pending = None
+            try:
+                self.render(nodes, output_image)
+            except Exception as e:
+                print(f"Unexpected error during plotting: {e}")
+
+    def render(self, nodes, output_image):
+        """Draws a snapshot and saves it, on the calling thread."""
+        positions = self.layout.update(nodes)
+
+        G = nx.DiGraph()
+        labels = {}
+        for node_uuid, step, _, parent_uuid in nodes:
+            G.add_node(node_uuid)
+            labels[node_uuid] = f"{step}\n({node_uuid})"
+            if parent_uuid is not None:
+                G.add_edge(parent_uuid, node_uuid)
+        pos = {node_uuid: positions[node_uuid] for node_uuid in G}
+
+        width = max(x for x, _ in pos.values()) + 1 if pos else 1
+        depth = -min(y for _, y in pos.values()) + 1 if pos else 1
+        # pyplot keeps global state; a bare Figure on an Agg canvas is safe off the main thread
+        figure = Figure(figsize=(min(max(12, 2 * width), 200), min(max(8, 1.5 * depth), 200)))
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+        nx.draw_networkx_nodes(G, pos, ax=ax, node_size=3000, node_color="lightblue")
+        nx.draw_networkx_edges(G, pos, ax=ax, arrowstyle='->', arrowsize=20)
+        nx.draw_networkx_labels(G, pos, labels, ax=ax, font_size=8, font_weight="bold")
+        ax.set_title(self.title)
+        ax.axis('off')
+        figure.tight_layout()
+        figure.savefig(output_image)
+        print(f"Tree plotted and saved as '{output_image}'.")
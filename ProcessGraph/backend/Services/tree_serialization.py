@@ -0,0 +1,239 @@
+"""
+Loading and saving process trees.
+
+Three formats, chosen by file extension:
+- .json: the JSON tree people read (indent=4, as tools.py writes it);
+- .yaml/.yml: the YAML document of yaml.py, read and written with libyaml's C
+  loader/dumper when PyYAML was built with it;
+- .ptree: a compact binary snapshot for internal use (marshalled tuples). It holds
+  everything the JSON and YAML files hold, so conversions are lossless. marshal
+  only decodes plain data, so loading a snapshot never runs code from the file.
+
+    python tree_serialization.py convert process_tree.yaml process_tree.ptree
+    python tree_serialization.py benchmark --sizes 1000 10000 100000
+"""
+
+import importlib
+import json
+import os
+import marshal
+import random
+import sys
+import time
+from process_tree import ProcessTree, TreeNode
+
+# Version 1 snapshots were pickles and are no longer read
+SNAPSHOT_MAGIC = b'PTREE\x02'
+
+_pyyaml = None
+
+
+def pyyaml():
+    """
+    The PyYAML module. yaml.py in this directory shadows it on sys.path when a
+    script runs from here, so it is imported with this directory left out.
+    """
+    global _pyyaml
+    if _pyyaml is None:
+        module = sys.modules.get('yaml')
+        if module is None or not hasattr(module, 'SafeLoader'):
+            here = os.path.dirname(os.path.abspath(__file__))
+            shadow = sys.modules.pop('yaml', None)
+            path = sys.path[:]
+            sys.path[:] = [p for p in path if os.path.abspath(p or os.curdir) != here]
+            try:
+                module = importlib.import_module('yaml')
+            finally:
+                sys.path[:] = path
+                if shadow is not None:
+                    sys.modules['yaml'] = shadow
+        _pyyaml = module
+    return _pyyaml
+
+
+def load_yaml(stream, fast=True):
+    """
+    Parses YAML with the C safe loader if available (fast=False forces the pure-Python one).
+    """
+    yaml = pyyaml()
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader) if fast else yaml.SafeLoader
+    return yaml.load(stream, Loader=loader)
+
+
+def dump_yaml(data, stream=None, fast=True):
+    """
+    Writes YAML with the C safe dumper if available, in block style like yaml.dump.
+    Returns the text when no stream is given.
+    """
+    yaml = pyyaml()
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper) if fast else yaml.SafeDumper
+    return yaml.dump(data, stream, Dumper=dumper, default_flow_style=False)
+
+
+def save_snapshot(tree, path):
+    """
+    Writes a tree as a binary snapshot (atomically).
+
+    Parameters:
+    - tree (ProcessTree): The tree.
+    - path (str): Destination file.
+    Raises ValueError if a node holds a value marshal can't store (e.g. a YAML date).
+    """
+    payload = (
+        tree.document,
+        [
+            (node.key, node.uuid, node.step, node.level, node.video_ids, node.children, node.extra)
+            for node in tree.nodes.values()
+        ],
+    )
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        marshal.dump(payload, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_snapshot(path):
+    """Reads a binary snapshot written by save_snapshot."""
+    with open(path, 'rb') as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"'{path}' is not a process tree snapshot")
+        document, rows = marshal.load(f)
+    return ProcessTree.from_nodes(
+        (
+            TreeNode(uuid, step, level, video_ids, children, key=key, extra=extra)
+            for key, uuid, step, level, video_ids, children, extra in rows
+        ),
+        document,
+    )
+
+
+def _format(path):
+    extension = os.path.splitext(path)[1].lower()
+    formats = {'.json': 'json', '.yaml': 'yaml', '.yml': 'yaml', '.ptree': 'snapshot'}
+    if extension not in formats:
+        raise ValueError(f"Unknown process tree format: '{path}'")
+    return formats[extension]
+
+
+def load_tree(path):
+    """
+    Reads a process tree from a .json, .yaml/.yml or .ptree file.
+
+    Returns:
+    - ProcessTree: The tree.
+    """
+    file_format = _format(path)
+    if file_format == 'snapshot':
+        return load_snapshot(path)
+    with open(path, 'r') as f:
+        if file_format == 'json':
+            return ProcessTree.from_dict(json.load(f))
+        return ProcessTree.from_yaml_data(load_yaml(f))
+
+
+def save_tree(tree, path):
+    """
+    Writes a process tree to a .json, .yaml/.yml or .ptree file (atomically).
+    """
+    file_format = _format(path)
+    if file_format == 'snapshot':
+        save_snapshot(tree, path)
+        return
+    with open(f"{path}.tmp", 'w') as f:
+        if file_format == 'json':
+            json.dump(tree.to_dict(), f, indent=4)
+        else:
+            dump_yaml(tree.to_yaml_data(), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def convert(source, destination):
+    """Converts a tree file to another format, e.g. YAML to a binary snapshot."""
+    save_tree(load_tree(source), destination)
+
+
+def make_tree(n_nodes, seed=0):
+    """
+    A synthetic tree for benchmarks: n_nodes steps, each under a random earlier node,
+    with a few video IDs each.
+    """
+    rng = random.Random(seed)
+    tree = ProcessTree.from_dict({
+        'root': {'UUID': 'root', 'Step': 'Oil change', 'TreeLevel': 0, 'IDList': ['vid_0'], 'ChildNodeUUID': []}
+    })
+    uuids = ['root']
+    for i in range(1, n_nodes):
+        parent_uuid = uuids[rng.randrange(max(0, len(uuids) - 50), len(uuids))]
+        node_uuid = f'{rng.getrandbits(128):032x}'
+        tree.add_node(parent_uuid, f'Step {i}: loosen the drain plug and let the oil drain', f'vid_{i % 97}', node_uuid)
+        for _ in range(rng.randrange(3)):
+            tree.add_video(node_uuid, f'vid_{rng.randrange(500)}')
+        uuids.append(node_uuid)
+    return tree
+
+
+def benchmark(sizes=(1000, 10000, 100000), directory='.'):
+    """
+    Times saving and loading synthetic trees in every format and prints a table.
+
+    Returns:
+    - list of dict: One row per (size, format) with save/load seconds and file size.
+    """
+    yaml = pyyaml()
+    formats = [('json', '.json', None), ('snapshot', '.ptree', None)]
+    if getattr(yaml, '__with_libyaml__', False):
+        formats.append(('yaml (libyaml)', '.yaml', True))
+    formats.append(('yaml (pure Python)', '.yaml', False))
+
+    rows = []
+    for n_nodes in sizes:
+        tree = make_tree(n_nodes)
+        for name, extension, fast in formats:
+            path = os.path.join(directory, f'benchmark_tree_{n_nodes}{extension}')
+            started_at = time.perf_counter()
+            if fast is None:
+                save_tree(tree, path)
+            else:
+                with open(path, 'w') as f:
+                    dump_yaml(tree.to_yaml_data(), f, fast=fast)
+            saved_at = time.perf_counter()
+            if fast is None:
+                loaded = load_tree(path)
+            else:
+                with open(path, 'r') as f:
+                    loaded = ProcessTree.from_yaml_data(load_yaml(f, fast=fast))
+            loaded_at = time.perf_counter()
+            assert loaded.to_yaml_data() == tree.to_yaml_data()
+            rows.append({
+                'nodes': n_nodes,
+                'format': name,
+                'save_seconds': round(saved_at - started_at, 4),
+                'load_seconds': round(loaded_at - saved_at, 4),
+                'megabytes': round(os.path.getsize(path) / 1e6, 2),
+            })
+            os.remove(path)
+
+    print(f"{'nodes':>8}  {'format':<20}{'save s':>10}{'load s':>10}{'MB':>8}")
+    for row in rows:
+        print(f"{row['nodes']:>8}  {row['format']:<20}{row['save_seconds']:>10}{row['load_seconds']:>10}{row['megabytes']:>8}")
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert and benchmark process tree files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert_parser = subparsers.add_parser('convert', help='Convert between .json, .yaml and .ptree')
+    convert_parser.add_argument('source')
+    convert_parser.add_argument('destination')
+    benchmark_parser = subparsers.add_parser('benchmark', help='Time load/save of synthetic trees')
+    benchmark_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    benchmark_parser.add_argument('--directory', default='.')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert(args.source, args.destination)
+        print(f"Converted '{args.source}' to '{args.destination}'.")
+    else:
+        benchmark(args.sizes, args.directory)
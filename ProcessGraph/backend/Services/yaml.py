@@ -1,21 +1,64 @@
-import yaml
 import uuid
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_client import get_client
 import re
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 import shutil
+from process_tree import ProcessTree
+from tree_serialization import dump_yaml, load_yaml, pyyaml, save_tree
+from tree_checkpoints import TreeCheckpoints
+from tree_renderer import RENDER_EVERY, TreeRenderer, tree_snapshot
+
+# PyYAML itself: `import yaml` would find this file. load_yaml/dump_yaml use libyaml when available
+yaml = pyyaml()
 
 load_dotenv()
 
+# One ProcessTree per YAML file, shared by get_uuid/add_node/update_node;
+# changes stay in memory until save_yaml_tree writes them
+_trees = {}
+_dirty = set()
+
+
+def open_yaml_tree(file):
+    """
+    Returns the shared ProcessTree of a YAML file, reading the file on first use.
+
+    Parameters:
+    - file (str): Path to the YAML file.
+
+    Returns:
+    - ProcessTree: The tree, with any changes not yet written to the file.
+    """
+    key = os.path.abspath(file)
+    if key not in _trees:
+        with open(file, 'r') as yaml_file:
+            _trees[key] = ProcessTree.from_yaml_data(load_yaml(yaml_file))
+    return _trees[key]
+
+
+def save_yaml_tree(file):
+    """
+    Writes the shared tree of a YAML file back to it, if it changed since it was read or last written.
+    """
+    key = os.path.abspath(file)
+    if key in _dirty:
+        save_tree(_trees[key], file)
+        _dirty.discard(key)
+
+
+def _changed(file):
+    _dirty.add(os.path.abspath(file))
+
+
 def initialize_tree_with_openai(name, content):
     """
     Initialize a tree structure for a process tree using OpenAI API and store it in a YAML file.
     """
-    client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    client = get_client('openai')
     prompt = """
     Create a tree structure for a process tree in YAML format. The tree should include:
     - UUID: A unique identifier for each node.
@@ -49,11 +92,12 @@ def initialize_tree_with_openai(name, content):
         print("Processed YAML Content:\n", yaml_content)
 
         # Parse the cleaned YAML content
-        tree = yaml.safe_load(yaml_content)
+        tree = load_yaml(yaml_content)
 
         # Save the tree to a YAML file
         with open(f"{name}.yaml", 'w') as yaml_output_file:
-            yaml.dump(tree, yaml_output_file)
+            dump_yaml(tree, yaml_output_file)
+        _trees.pop(os.path.abspath(f"{name}.yaml"), None)
 
         print(f"Process tree initialized and saved as {name}.yaml")
     except Exception as e:
@@ -65,7 +109,7 @@ def make_tasks(content):
     Break the video content into simple tasks using OpenAI API.
     """
     try:
-        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+        client = get_client('openai')
         prompt = """
         The following is a video content. Break it down into simple tasks. Make sure the tasks are related to the work being done in the video. Keep it short and simple.
         """
@@ -87,10 +131,9 @@ def get_uuid(task, filepath, videoid):
     Determines the UUID for the task in the YAML file or adds the task if not present.
     """
     try:
-        with open(filepath, 'r') as yaml_file:
-            tree = yaml.safe_load(yaml_file)
-        
-        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+        tree = open_yaml_tree(filepath)
+
+        client = get_client('openai')
         prompt = f"""
         You will be given a YAML file in the form of a text file. The YAML file consists of a tree structure for a process tree.
         You will be given a task, and you have to find the UUID of the task in the YAML file. 
@@ -102,7 +145,7 @@ def get_uuid(task, filepath, videoid):
 
         Task: {task}
         YAML Tree:
-        {yaml.dump(tree, default_flow_style=False)}
+        {dump_yaml(tree.to_yaml_data())}
         """
         completion = client.chat.completions.create(
             model="gpt-4o",
@@ -135,7 +178,8 @@ def get_uuid(task, filepath, videoid):
 
 def add_node(parent_uuid, task, file, video_id):
     """
-    Adds a new task node to the YAML file under the specified parent UUID.
+    Adds a new task node to the YAML tree under the specified parent UUID.
+    The file is written by save_yaml_tree.
 
     Parameters:
     - parent_uuid (str): The UUID of the parent node under which the new node will be added.
@@ -144,51 +188,18 @@ def add_node(parent_uuid, task, file, video_id):
     - video_id (str): The video ID associated with the new task.
     """
     try:
-        with open(file, 'r') as yaml_file:
-            data = yaml.safe_load(yaml_file)
-
-        # Access the ProcessTree
-        tree = data.get('ProcessTree', {})
+        tree = open_yaml_tree(file)
 
         # Generate a new UUID for the new node
         new_uuid = str(uuid.uuid4())[:8]  # Shorten for readability, adjust as needed
 
-        # Create the new node
-        new_node = {
-            'UUID': new_uuid,
-            'Step': task,
-            'TreeLevel': None,  # Will set this later
-            'IDList': [video_id],
-            'ChildNodeUUID': []
-        }
-
-        # Find the parent node by searching through the tree
-        parent_node = None
-        for node_key, node_value in tree.items():
-            if node_value.get('UUID') == parent_uuid:
-                parent_node = node_value
-                break
-
-        if parent_node:
-            # Update the parent's ChildNodeUUID list
-            if 'ChildNodeUUID' in parent_node and parent_node['ChildNodeUUID'] is not None:
-                parent_node['ChildNodeUUID'].append(new_uuid)
-            else:
-                parent_node['ChildNodeUUID'] = [new_uuid]
-
-            # Set the TreeLevel of the new node
-            parent_level = parent_node.get('TreeLevel', 0)
-            new_node['TreeLevel'] = parent_level + 1
-
-            # Add the new node to the tree under a key that is its UUID
-            tree[new_uuid] = new_node
-        else:
+        if parent_uuid not in tree:
             print(f"Parent UUID {parent_uuid} not found in the YAML file.")
             return
 
-        # Write the updated data back to the file
-        with open(file, 'w') as yaml_output_file:
-            yaml.dump(data, yaml_output_file, default_flow_style=False)
+        # Add the new node one TreeLevel below its parent, under a key that is its UUID
+        tree.add_node(parent_uuid, task, video_id, new_uuid)
+        _changed(file)
 
         print(f"Task '{task}' added successfully under parent UUID {parent_uuid}.")
 
@@ -202,33 +213,16 @@ def add_node(parent_uuid, task, file, video_id):
 
 def update_node(node_uuid, video_id, file):
     """
-    Updates the node with the given UUID in the YAML file by adding the video_id to the IDList field,
-    appending it even if it's already present.
+    Updates the node with the given UUID in the YAML tree by adding the video_id to the IDList field,
+    appending it even if it's already present. The file is written by save_yaml_tree.
     """
     try:
-        with open(file, 'r') as yaml_file:
-            data = yaml.safe_load(yaml_file)
-
-        # Access the ProcessTree
-        tree = data.get('ProcessTree', {})
+        tree = open_yaml_tree(file)
 
-        # Find the node to update by searching through the tree
-        node_to_update = None
-        for node_key, node_value in tree.items():
-            if node_value.get('UUID') == node_uuid:
-                node_to_update = node_value
-                break
-
-        if node_to_update:
+        if node_uuid in tree:
             # Append the video_id to the IDList without checking for duplicates
-            if 'IDList' in node_to_update and node_to_update['IDList'] is not None:
-                node_to_update['IDList'].append(video_id)
-            else:
-                node_to_update['IDList'] = [video_id]
-
-            # Write the updated data back to the file
-            with open(file, 'w') as yaml_output_file:
-                yaml.dump(data, yaml_output_file, default_flow_style=False)
+            tree.add_video(node_uuid, video_id, allow_duplicates=True)
+            _changed(file)
 
             print(f"Video ID '{video_id}' appended successfully for UUID {node_uuid}.")
         else:
@@ -252,7 +246,7 @@ def plot_yaml_tree(yaml_file, output_image="yaml_tree.png"):
     """
     try:
         with open(yaml_file, 'r') as file:
-            data = yaml.safe_load(file)
+            data = load_yaml(file)
 
         G = nx.DiGraph()
 
@@ -308,10 +302,10 @@ def backup_yaml(file):
     except Exception as e:
         print(f"Error creating backup: {e}")
 
-def main():
+def main(render_every=RENDER_EVERY):
     """
     Main function to process the CSV file and update the YAML tree.
-    After processing each row, it plots the YAML tree.
+    Every `render_every` rows (0: only at the end), it plots the YAML tree in the background.
     """
     import os
     import pandas as pd
@@ -345,6 +339,10 @@ def main():
         initialize_tree_with_openai("process_tree", first_row_string)
         plot_yaml_tree(yaml_file, output_image="yaml_tree_initial.png")
 
+    renderer = TreeRenderer(every=render_every, title="YAML Task Tree")
+    # Version history of the tree, one version per row
+    checkpoints = TreeCheckpoints(f"{yaml_file}.checkpoints")
+
     # Process each row in the CSV
     for index, row in df.iterrows():
         video_id = row['Video_ID']
@@ -357,9 +355,16 @@ def main():
         for task in tasks:
             get_uuid(task, yaml_file, video_id)
 
-        # Plot the YAML tree after processing each row
+        # Write the row's changes once
+        save_yaml_tree(yaml_file)
+        tree = open_yaml_tree(yaml_file)
+        checkpoints.checkpoint(tree, label=f"row {index + 1} ({video_id})")
+
+        # Plot the YAML tree after processing the row, if it's due
         output_image = f"yaml_tree_after_row_{index + 1}.png"
-        plot_yaml_tree(yaml_file, output_image=output_image)
+        renderer.row_done(index + 1, lambda: tree_snapshot(tree), output_image)
+
+    renderer.close(tree_snapshot(open_yaml_tree(yaml_file)), "yaml_tree_final.png")
 
 if __name__ == "__main__":
     main()